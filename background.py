@@ -5,7 +5,8 @@ from typing import List
 from sqlalchemy.orm import joinedload
 from sqlalchemy import select
 import models
-from services import shopify_service
+from services import shopify_service, sync_service
+from services.label_prefetcher import prefetch_unprinted_labels
 from settings import settings
 from database import AsyncSessionLocal
 
@@ -20,16 +21,15 @@ async def _do_update_work(session, awb_list: List[str]):
     )
     shipments = shipments_result.unique().scalars().all()
     
-    store_configs = {s.domain: s for s in settings.SHOPIFY_STORES}
     courier_display_names = {v: k for k, v in settings.COURIER_MAP.items()}
     update_tasks = []
 
     for ship in shipments:
         if not (ship.order and ship.order.store and ship.order.shopify_order_id and ship.shopify_fulfillment_id):
             continue
-        store_cfg = store_configs.get(ship.order.store.domain)
-        if not store_cfg:
+        if not ship.order.store.access_token:
             continue
+        store_cfg = shopify_service.store_config_from_db(ship.order.store)
         
         tracking_url = f"https://sameday.ro/track-awb/{ship.awb}" if 'sameday' in (ship.courier or '').lower() else f"https://tracking.dpd.ro?shipmentNumber={ship.awb}"
         tracking_info = {
@@ -60,4 +60,45 @@ async def update_shopify_in_background(awb_list: List[str]):
         except Exception as e:
             logging.error(f"Eroare în task-ul de fundal Shopify: {e}", exc_info=True)
             await session.rollback()
-    logging.info(f"✅ Notificarea Shopify pentru {len(awb_list)} expedieri a fost finalizată.")
\ No newline at end of file
+    logging.info(f"✅ Notificarea Shopify pentru {len(awb_list)} expedieri a fost finalizată.")
+
+
+async def _periodic_orders_sync(app):
+    """
+    Rulează sincronizarea incrementală a comenzilor la fiecare SYNC_INTERVAL_ORDERS_MINUTES.
+    Folosește același `app.state.is_syncing` ca rutele /sync/*, deci nu pornește peste o
+    sincronizare manuală; între procese, magazinele sunt protejate de advisory lock-ul din `sync_service`.
+    """
+    interval = settings.SYNC_INTERVAL_ORDERS_MINUTES * 60
+    while True:
+        await asyncio.sleep(interval)
+        if app.state.is_syncing:
+            logging.info("Sincronizarea periodică a comenzilor este sărită: o altă sincronizare este în curs.")
+            continue
+        app.state.is_syncing = True
+        try:
+            async with AsyncSessionLocal() as session:
+                try:
+                    await sync_service.run_orders_sync(session, days=settings.SYNC_INITIAL_DAYS, full_sync=False)
+                except Exception as e:
+                    logging.error(f"Eroare în sincronizarea periodică a comenzilor: {e}", exc_info=True)
+                    await session.rollback()
+        finally:
+            app.state.is_syncing = False
+
+async def _periodic_label_prefetch():
+    """Descarcă în cache etichetele AWB-urilor neprintate la fiecare LABEL_PREFETCH_INTERVAL_SECONDS."""
+    while True:
+        try:
+            await prefetch_unprinted_labels()
+        except Exception as e:
+            logging.error(f"Eroare în prefetch-ul etichetelor: {e}", exc_info=True)
+        await asyncio.sleep(settings.LABEL_PREFETCH_INTERVAL_SECONDS)
+
+def start_background_tasks(app):
+    """Pornește task-urile periodice. Apelată la startup-ul aplicației."""
+    asyncio.create_task(_periodic_orders_sync(app))
+    logging.info(f"Sincronizarea incrementală a comenzilor rulează la fiecare {settings.SYNC_INTERVAL_ORDERS_MINUTES} minute.")
+    if settings.LABEL_PREFETCH_ENABLED and settings.LABEL_CACHE_ENABLED:
+        asyncio.create_task(_periodic_label_prefetch())
+        logging.info(f"Prefetch-ul etichetelor neprintate rulează la fiecare {settings.LABEL_PREFETCH_INTERVAL_SECONDS} secunde.")
@@ -3,6 +3,9 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from models import CourierAccount, CourierMapping
+from services.courier_mapping_cache import courier_mapping_cache
+from services.ingest_service import invalidate_courier_fingerprints
+from services.couriers import evict_courier_service
 import json
 
 async def get_courier_accounts(db: AsyncSession):
@@ -26,6 +29,7 @@ async def update_courier_account(db: AsyncSession, account_id: int, name: str, a
     result = await db.execute(select(CourierAccount).where(CourierAccount.id == account_id))
     account = result.scalar_one_or_none()
     if account:
+        old_account_key = account.account_key
         account.name = name
         account.account_key = account_key
         account.courier_type = courier_type
@@ -33,7 +37,12 @@ async def update_courier_account(db: AsyncSession, account_id: int, name: str, a
         # Acum, această linie este corectă
         account.credentials = credentials 
         account.is_active = is_active
+        await invalidate_courier_fingerprints(db, [old_account_key, account_key])
         await db.commit()
+        courier_mapping_cache.invalidate()
+        # Clientul HTTP, rate limit-ul și token-ul instanței existente țin setările vechi
+        for key in {old_account_key, account_key}:
+            await evict_courier_service(key)
 
 async def get_courier_mappings(db: AsyncSession):
     result = await db.execute(select(CourierMapping).order_by(CourierMapping.shopify_name))
@@ -42,4 +51,6 @@ async def get_courier_mappings(db: AsyncSession):
 async def create_courier_mapping(db: AsyncSession, shopify_name: str, account_key: str):
     new_mapping = CourierMapping(shopify_name=shopify_name, account_key=account_key)
     db.add(new_mapping)
-    await db.commit()
\ No newline at end of file
+    await invalidate_courier_fingerprints(db)
+    await db.commit()
+    courier_mapping_cache.invalidate()
\ No newline at end of file
@@ -8,6 +8,9 @@ from database import engine
 from routes import store_categories, printing, logs, orders, sync, labels, settings, validation, webhooks, couriers
 from websocket_manager import manager
 from background import start_background_tasks
+from services.shopify_client import close_shopify_clients
+from services.couriers import close_courier_services
+from services.pdf_pool import shutdown_pdf_pool
 from settings import settings
 
 # Create all database tables on startup
@@ -39,7 +42,19 @@ async def startup_event():
     """
     Start background tasks when the application starts.
     """
-    start_background_tasks()
+    # Guard shared by the /sync/* routes and the periodic sync
+    app.state.is_syncing = False
+    start_background_tasks(app)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Close the pooled Shopify and courier connections and stop the PDF worker processes.
+    """
+    await close_shopify_clients()
+    await close_courier_services()
+    shutdown_pdf_pool()
 
 
 @app.websocket("/ws/status")
@@ -81,6 +81,9 @@ class Order(Base):
   processing_status = Column(String(32), default='pending_validation', index=True, nullable=False)
   assigned_courier = Column(String(64), nullable=True)
   is_on_hold_shopify = Column(Boolean, default=False, nullable=False, index=True)
+  # Calculat de `calculate_and_set_derived_status` (per comandă) sau `recompute_derived_statuses` (SQL, toate comenzile)
+  derived_status = Column(String(255), nullable=True, index=True)
+  payload_hash = Column(String(64), nullable=True)
   
   
   store = relationship('Store', back_populates='orders')
@@ -102,7 +105,8 @@ class RomaniaAddress(Base):
 class LineItem(Base):
   __tablename__ = 'line_items'
   id = Column(Integer, primary_key=True)
-  order_id = Column(Integer, ForeignKey('orders.id'))
+  order_id = Column(Integer, ForeignKey('orders.id'), index=True)
+  shopify_line_item_id = Column(String(50), unique=True, index=True, nullable=True)
   sku = Column(String(128), index=True)
   title = Column(Text)
   quantity = Column(Integer)
@@ -114,7 +118,7 @@ class Shipment(Base):
   order_id = Column(Integer, ForeignKey('orders.id'))
   fulfillment_created_at = Column(TIMESTAMP(timezone=True), nullable=True)
   shopify_fulfillment_id = Column(String(50), nullable=True, index=True)
-  awb = Column(String(64), index=True)
+  awb = Column(String(64), unique=True, index=True)
   courier_specific_data = Column(JSON, nullable=True)
   courier = Column(String(64), index=True)
   account_key = Column(String(32))
@@ -122,8 +126,15 @@ class Shipment(Base):
   printed_at = Column(TIMESTAMP(timezone=True), nullable=True, index=True)
   last_status = Column(String(255), nullable=True, index=True)
   last_status_at = Column(TIMESTAMP(timezone=True), nullable=True)
+  # Programarea tracking-ului: NULL = status final, nu mai este verificat
+  next_check_at = Column(TIMESTAMP(timezone=True), nullable=True, server_default=func.now())
+  # Verificări consecutive fără schimbare de status (crește intervalul)
+  check_count = Column(Integer, default=0, server_default='0', nullable=False)
   
   order = relationship('Order', back_populates='shipments')
+  __table_args__ = (
+      Index('ix_shipments_next_check_at', 'next_check_at', postgresql_where=next_check_at.isnot(None)),
+  )
 
 class FulfillmentOrder(Base):
     __tablename__ = 'fulfillment_orders'
@@ -169,4 +180,31 @@ class CourierMapping(Base):
     id = Column(Integer, primary_key=True)
     shopify_name = Column(String(255), unique=True, nullable=False, index=True)
     account_key = Column(String(64), ForeignKey('courier_accounts.account_key'), nullable=False)
-    account = relationship("CourierAccount", back_populates="mappings")
\ No newline at end of file
+    account = relationship("CourierAccount", back_populates="mappings")
+class SyncCheckpoint(Base):
+    __tablename__ = 'sync_checkpoints'
+    id = Column(Integer, primary_key=True)
+    store_id = Column(Integer, ForeignKey('stores.id'), unique=True, nullable=False, index=True)
+    run_id = Column(String(32), nullable=False)
+    full_sync = Column(Boolean, default=False, nullable=False)
+    use_bulk = Column(Boolean, default=False, nullable=False)
+    # Fereastra rulării, păstrată ca reluarea să ceară exact aceleași comenzi
+    created_since = Column(TIMESTAMP(timezone=True), nullable=True)
+    updated_since = Column(TIMESTAMP(timezone=True), nullable=True)
+    # Watermark-ul care va fi salvat în Store.last_sync_at la finalul rulării
+    watermark = Column(TIMESTAMP(timezone=True), nullable=False)
+    resume_token = Column(Text, nullable=True)
+    last_order_updated_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    pages_done = Column(Integer, default=0, nullable=False)
+    orders_done = Column(Integer, default=0, nullable=False)
+    started_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
+    store = relationship('Store')
+
+class CourierToken(Base):
+    """Token-ul de autentificare curent al unui cont de curier, partajat între procese."""
+    __tablename__ = 'courier_tokens'
+    account_key = Column(String(64), ForeignKey('courier_accounts.account_key', ondelete='CASCADE'), primary_key=True)
+    token = Column(Text, nullable=False)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
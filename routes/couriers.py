@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 import models
 from database import get_db
 from services.courier_service import get_courier_service
+from services.status_classifier import status_classifier
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
@@ -106,4 +107,11 @@ async def update_account(account_id: int, request: Request, db: AsyncSession = D
 @router.post('/mappings', response_class=RedirectResponse, name="create_courier_mapping")
 async def create_mapping(db: AsyncSession = Depends(get_db), shopify_name: str = Form(), account_key: str = Form()):
     await crud_couriers.create_courier_mapping(db, shopify_name, account_key)
-    return RedirectResponse(url=router.url_path_for("get_couriers_page"), status_code=303)
\ No newline at end of file
+    return RedirectResponse(url=router.url_path_for("get_couriers_page"), status_code=303)
+
+@router.get('/status-map/unmapped', response_class=JSONResponse, name="get_unmapped_courier_statuses")
+async def get_unmapped_statuses(limit: int = 100):
+    """Statusurile de curier care nu se regăsesc în config/courier_status_map.json, cu numărul de apariții."""
+    return {
+        "unmapped": [{"raw_status": raw, "count": count} for raw, count in status_classifier.unmapped_statuses(limit)],
+    }
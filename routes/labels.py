@@ -1,17 +1,18 @@
 # routes/labels.py
-import io
-import logging
+import os
+import tempfile
+from pathlib import Path
 from datetime import datetime, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import APIRouter, Depends, Request, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse, HTMLResponse
+from fastapi.responses import JSONResponse, StreamingResponse, HTMLResponse, FileResponse
 from sqlalchemy import select
-from pypdf import PdfWriter, PdfReader
 from starlette.background import BackgroundTasks
 
 import models
 from database import get_db
 from services import label_service
+from services.label_cache import label_cache
 from background import update_shopify_in_background
 
 router = APIRouter(prefix='/labels', tags=['Labels'])
@@ -27,32 +28,26 @@ async def merge_labels_for_printing(request: Request, background_tasks: Backgrou
     shipments = shipments_res.scalars().all()
     shipments_data = [{"awb": s.awb, "courier": s.courier, "account_key": s.account_key} for s in shipments]
     
-    # --- MODIFICARE AICI: Am corectat numele funcției și am scos argumentul 'db' ---
-    awb_to_pdf_map, failed_awbs_map = await label_service.generate_labels_pdf(shipments_data)
-    successful_awbs = list(awb_to_pdf_map.keys())
+    # Etichetele sunt ținute pe disc și îmbinate direct într-un fișier temporar, șters după trimitere
+    fd, merged_name = tempfile.mkstemp(prefix='awb_merge_', suffix='.pdf')
+    os.close(fd)
+    merged_path = Path(merged_name)
+    try:
+        with label_service.LabelSpool() as spool:
+            successful_awbs, failed_awbs_map = await label_service.spool_labels(shipments_data, spool)
+            pages = await label_service.merge_spooled_labels(spool, awbs_to_process, merged_path) if successful_awbs else 0
+    except Exception:
+        merged_path.unlink(missing_ok=True)
+        raise
 
-    if not successful_awbs:
+    if not successful_awbs or not pages:
+        merged_path.unlink(missing_ok=True)
         error_detail = "Nicio etichetă nu a putut fi generată."
         if failed_awbs_map:
             failed_list = ", ".join(failed_awbs_map.keys())
             error_detail += f" Următoarele AWB-uri au eșuat: {failed_list}"
         return JSONResponse(content={'detail': error_detail}, status_code=500)
-    
-    final_pdf_writer = PdfWriter()
-    for awb in awbs_to_process:
-        if pdf_buffer := awb_to_pdf_map.get(awb):
-            try:
-                pdf_reader = PdfReader(pdf_buffer)
-                for page in pdf_reader.pages:
-                    final_pdf_writer.add_page(page)
-            except Exception as e:
-                logging.error(f"Nu s-a putut procesa PDF-ul pentru AWB {awb}: {e}")
 
-    final_buffer = io.BytesIO()
-    if len(final_pdf_writer.pages) > 0:
-        final_pdf_writer.write(final_buffer)
-    final_buffer.seek(0)
-    
     now = datetime.now(timezone.utc)
     shipments_to_mark_res = await db.execute(select(models.Shipment).where(models.Shipment.awb.in_(successful_awbs), models.Shipment.printed_at.is_(None)))
     shipments_to_mark = shipments_to_mark_res.scalars().all()
@@ -62,7 +57,8 @@ async def merge_labels_for_printing(request: Request, background_tasks: Backgrou
     await db.commit()
     
     background_tasks.add_task(update_shopify_in_background, successful_awbs)
-    return StreamingResponse(final_buffer, media_type='application/pdf')
+    background_tasks.add_task(merged_path.unlink, missing_ok=True)
+    return FileResponse(merged_path, media_type='application/pdf')
 
 @router.get("/download/{awb}", name="download_single_label")
 async def download_single_label(awb: str, db: AsyncSession = Depends(get_db)):
@@ -100,4 +96,9 @@ async def download_single_label(awb: str, db: AsyncSession = Depends(get_db)):
         return HTMLResponse(content=error_html, status_code=404)
         
     headers = {'Content-Disposition': f'attachment; filename="AWB_{awb}.pdf"'}
-    return StreamingResponse(pdf_buffer, media_type='application/pdf', headers=headers)
\ No newline at end of file
+    return StreamingResponse(pdf_buffer, media_type='application/pdf', headers=headers)
+
+@router.get("/cache/stats", name="label_cache_stats")
+async def get_label_cache_stats():
+    """Statistici pentru cache-ul de etichete (hit-uri, miss-uri, rata de hit, mărime)."""
+    return JSONResponse(content=label_cache.stats())
@@ -1,54 +1,48 @@
 # routes/printing.py
 import logging
-import math
 from pathlib import Path
+from uuid import uuid4
 from datetime import datetime, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import APIRouter, Depends, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, FileResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import select, func, or_
+from sqlalchemy import select
 from starlette.background import BackgroundTasks
 import models
 from database import get_db
 from services import print_service
+from services.batch_planner import StalePlanError, batch_planner
+from services.label_prefetcher import count_prefetched
 from background import update_shopify_in_background
 from dependencies import get_templates
-from settings import settings
 
 router = APIRouter()
 # Initialize templates directly in the file
 templates = Jinja2Templates(directory="templates")
 
+ARCHIVE_BASE_DIR = Path('awb_archive')
+
 @router.get("/print-view", response_class=HTMLResponse)
 async def get_print_view_page(request: Request, db: AsyncSession = Depends(get_db), templates: Jinja2Templates = Depends(get_templates)):
-    latest_shipment_subq = (select(models.Shipment.order_id, func.max(models.Shipment.id).label("max_id")).group_by(models.Shipment.order_id).alias("latest_shipment_subq"))
-    supported_couriers_filter = or_(models.Shipment.courier.ilike('%dpd%'), models.Shipment.courier.ilike('%sameday%'))
-    unprinted_counts_query = (
-        select(models.StoreCategory.id, func.count(models.Order.id.distinct()))
-        .join(models.store_category_map).join(models.Store).join(models.Order)
-        .join(models.Shipment, models.Order.id == models.Shipment.order_id)
-        .join(latest_shipment_subq, models.Shipment.id == latest_shipment_subq.c.max_id)
-        .where(models.Shipment.printed_at.is_(None), models.Shipment.awb.isnot(None), supported_couriers_filter)
-        .group_by(models.StoreCategory.id)
-    )
-    counts_res = await db.execute(unprinted_counts_query)
-    counts_dict = dict(counts_res.all())
     categories_res = await db.execute(select(models.StoreCategory).order_by(models.StoreCategory.name))
     categories = categories_res.scalars().all()
-    
+
+    # Numărătorile și loturile vin din același plan înghețat pe care îl folosește printarea
+    plans = await batch_planner.get_plans(db, [cat.id for cat in categories])
     total_unprinted = 0
-    batch_size = settings.PRINT_BATCH_SIZE
     for cat in categories:
-        count = counts_dict.get(cat.id, 0)
-        cat.unprinted_count = count
-        cat.total_batches = math.ceil(count / batch_size) if count > 0 else 0
-        total_unprinted += count
-        
+        plan = plans[cat.id]
+        cat.unprinted_count = len(plan.shipments)
+        cat.prefetched_count = await count_prefetched(plan.shipments)
+        cat.total_batches = plan.total_batches
+        cat.plan_version = plan.version
+        total_unprinted += cat.unprinted_count
+
     return templates.TemplateResponse("print_view.html", {"request": request, "categories": categories, "total_unprinted": total_unprinted})
 
 @router.post("/print/selected-batches")
-async def process_and_print_selected_batches(request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), category_id: int = Form(...), batch_numbers: str = Form(...)):
+async def process_and_print_selected_batches(request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), category_id: int = Form(...), batch_numbers: str = Form(...), plan_version: str = Form(...)):
     try:
         batch_nums_list = [int(b) for b in batch_numbers.split(',') if b.isdigit()]
         if not batch_nums_list: raise HTTPException(status_code=400, detail="Niciun lot valid selectat.")
@@ -58,12 +52,29 @@ async def process_and_print_selected_batches(request: Request, background_tasks:
     category = await db.get(models.StoreCategory, category_id)
     if not category: raise HTTPException(status_code=404, detail="Categoria nu a fost găsită.")
 
-    pdf_buffer, successful_awbs, failed_awbs = await print_service.generate_pdf_for_selected_batches(db, category_id, batch_nums_list)
+    # Loturile sunt cele văzute de operator; dacă planul s-a schimbat între timp, numerele loturilor nu mai sunt valide
+    try:
+        plan = await batch_planner.get_plan(db, category_id, expected_version=plan_version)
+    except StalePlanError as e:
+        logging.warning(str(e))
+        raise HTTPException(status_code=409, detail="Loturile s-au modificat de la încărcarea paginii. Reîncarcă Print Hub și selectează din nou.")
+    shipments_to_fetch = plan.shipments_for(batch_nums_list)
+    if not shipments_to_fetch: raise HTTPException(status_code=400, detail="Loturile selectate nu există în planul curent.")
+
+    # PDF-ul este scris direct în arhiva zilei (nume temporar), apoi redenumit după ID-ul log-ului
+    archive_dir = ARCHIVE_BASE_DIR / datetime.now().strftime('%Y-%m-%d')
+    staging_path = archive_dir / f".print_{uuid4().hex}.pdf"
+    try:
+        pages, successful_awbs, failed_awbs = await print_service.generate_pdf_for_shipments(shipments_to_fetch, staging_path)
+    except Exception:
+        staging_path.unlink(missing_ok=True)
+        raise
     logging.info(f"Total AWB-uri trimise la procesare: {len(successful_awbs) + len(failed_awbs)}")
     logging.info(f"AWB-uri procesate cu SUCCES ({len(successful_awbs)}): {successful_awbs}")
     if failed_awbs: logging.warning(f"AWB-uri EȘUATE ({len(failed_awbs)}): {failed_awbs}")
 
-    if not successful_awbs:
+    if not successful_awbs or not pages:
+        staging_path.unlink(missing_ok=True)
         error_detail = f"Nu s-a putut genera nicio etichetă. {len(failed_awbs)} AWB-uri au eșuat."
         raise HTTPException(status_code=404, detail=error_detail)
 
@@ -83,15 +94,13 @@ async def process_and_print_selected_batches(request: Request, background_tasks:
     log_entries = [models.PrintLogEntry(print_log_id=new_log.id, awb=awb, order_name=awb_to_order_name.get(awb, 'N/A')) for awb in successful_awbs]
     db.add_all(log_entries)
     
-    if pdf_buffer.getbuffer().nbytes > 0:
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        archive_dir = Path('awb_archive') / today_str
-        archive_dir.mkdir(parents=True, exist_ok=True)
-        pdf_filename = f"awb_log_{new_log.id}_{int(datetime.now().timestamp())}.pdf"
-        pdf_path = archive_dir / pdf_filename
-        with open(pdf_path, 'wb') as f: f.write(pdf_buffer.getbuffer())
-        new_log.pdf_path = str(pdf_path)
+    pdf_filename = f"awb_log_{new_log.id}_{int(datetime.now().timestamp())}.pdf"
+    pdf_path = archive_dir / pdf_filename
+    # Același fișier devine arhiva și răspunsul (fără copii în memorie)
+    staging_path.replace(pdf_path)
+    new_log.pdf_path = str(pdf_path)
 
     await db.commit()
+    batch_planner.invalidate(category_id)
     background_tasks.add_task(update_shopify_in_background, successful_awbs)
-    return StreamingResponse(pdf_buffer, media_type='application/pdf')
\ No newline at end of file
+    return FileResponse(pdf_path, media_type='application/pdf')
\ No newline at end of file
@@ -1,15 +1,19 @@
 # routes/sync.py
-from fastapi import APIRouter, Depends, BackgroundTasks, Request
-from fastapi.responses import RedirectResponse
+import logging
+from fastapi import APIRouter, Depends, BackgroundTasks, Request, Form, WebSocket, WebSocketDisconnect
+from fastapi.responses import RedirectResponse, JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
-from services.sync_service import sync_all_stores
+from services import sync_service
+from services.derived_status_service import recompute_derived_statuses
+from websocket_manager import manager
 
 router = APIRouter()
 
 @router.post("/all", response_class=RedirectResponse)
-async def sync_all_stores_route(background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
-    background_tasks.add_task(sync_all_stores, db)
+async def sync_all_stores_route(request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    if not request.app.state.is_syncing:
+        background_tasks.add_task(run_sync_task, request, sync_service.run_orders_sync, db, days=30)
     # This is a background task, so we redirect immediately.
     # A flash message could be added to inform the user.
     return RedirectResponse(url="/", status_code=303)
@@ -34,9 +38,10 @@ async def websocket_endpoint(websocket: WebSocket):
         manager.disconnect(websocket)
 
 @router.post('/orders')
-async def sync_orders_start(request: Request, background_tasks: BackgroundTasks, days: int = Form(30), db: AsyncSession = Depends(get_db)):
+async def sync_orders_start(request: Request, background_tasks: BackgroundTasks, days: int = Form(30), full: bool = Form(False), db: AsyncSession = Depends(get_db)):
     if request.app.state.is_syncing: return JSONResponse(status_code=409, content={"message": "O altă sincronizare este deja în curs."})
-    background_tasks.add_task(run_sync_task, request, sync_service.run_orders_sync, db, days=days, full_sync=False)
+    # Implicit incremental (după watermark-ul fiecărui magazin); `full=true` re-preia toată fereastra de `days` zile
+    background_tasks.add_task(run_sync_task, request, sync_service.run_orders_sync, db, days=days, full_sync=full)
     return JSONResponse(content={"ok": True, "message": "Sincronizarea comenzilor a pornit."})
 
 @router.post('/couriers')
@@ -49,4 +54,10 @@ async def sync_couriers_start(request: Request, background_tasks: BackgroundTask
 async def sync_full_start(request: Request, background_tasks: BackgroundTasks, days: int = Form(30), db: AsyncSession = Depends(get_db)):
     if request.app.state.is_syncing: return JSONResponse(status_code=409, content={"message": "O altă sincronizare este deja în curs."})
     background_tasks.add_task(run_sync_task, request, sync_service.run_full_sync, db, days=days)
-    return JSONResponse(content={"ok": True, "message": "Sincronizarea totală a pornit."})
\ No newline at end of file
+    return JSONResponse(content={"ok": True, "message": "Sincronizarea totală a pornit."})
+
+@router.post('/derived-status')
+async def recompute_derived_status(db: AsyncSession = Depends(get_db)):
+    """Mentenanță: recalculează statusul derivat al tuturor comenzilor (ex. după modificarea courier_status_map.json)."""
+    changed = await recompute_derived_statuses(db)
+    return JSONResponse(content={"ok": True, "changed": changed, "message": f"Status derivat recalculat: {changed} comenzi modificate."})
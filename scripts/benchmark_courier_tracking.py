@@ -0,0 +1,92 @@
+# scripts/benchmark_courier_tracking.py
+"""
+Compară latența per AWB a tracking-ului cu un client HTTP nou la fiecare cerere
+(comportamentul vechi: handshake TCP+TLS pentru fiecare AWB) față de clientul
+persistent al instanței de curier (conexiuni keep-alive refolosite).
+
+Utilizare:
+    python scripts/benchmark_courier_tracking.py <account_key> <awb1,awb2,...> [--repeat 3]
+
+Cererile sunt trimise secvențial, câte una, deci rate limit-ul contului este dezactivat
+pentru durata testului ca să nu fie măsurat și timpul de așteptare.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import httpx
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import select
+
+import models
+from database import AsyncSessionLocal
+from services.couriers import get_courier_service
+
+
+async def _measure(service, awbs: List[str], repeat: int, fresh_client: bool) -> List[float]:
+    pooled_client = service.http
+    latencies = []
+    try:
+        for _ in range(repeat):
+            for awb in awbs:
+                if fresh_client:
+                    service.http = httpx.AsyncClient(timeout=pooled_client.timeout)
+                start = time.perf_counter()
+                await service.track(awb)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if fresh_client:
+                    await service.http.aclose()
+    finally:
+        service.http = pooled_client
+    return latencies
+
+
+def _report(label: str, latencies: List[float]):
+    ordered = sorted(latencies)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    print(f"{label:<22} n={len(ordered):<4} medie={statistics.mean(ordered):7.1f} ms  mediană={statistics.median(ordered):7.1f} ms  p95={p95:7.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark tracking: client nou per AWB vs. client persistent.")
+    parser.add_argument("account_key")
+    parser.add_argument("awbs", help="AWB-uri separate prin virgulă")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    awbs = [a.strip() for a in args.awbs.split(",") if a.strip()]
+
+    async with AsyncSessionLocal() as db:
+        account = (await db.execute(
+            select(models.CourierAccount).where(models.CourierAccount.account_key == args.account_key)
+        )).scalar_one_or_none()
+    if not account:
+        print(f"EROARE: Contul de curier '{args.account_key}' nu există.")
+        return
+
+    credentials = {**(account.credentials or {}), "rate_limit_per_second": 0}
+    service = get_courier_service(account.courier_type, account.account_key, credentials)
+    if not service:
+        print(f"EROARE: Tipul de curier '{account.courier_type}' nu este suportat.")
+        return
+
+    try:
+        # Încălzire: autentificare (Sameday) și prima conexiune, excluse din măsurători
+        await service.track(awbs[0])
+
+        fresh = await _measure(service, awbs, args.repeat, fresh_client=True)
+        pooled = await _measure(service, awbs, args.repeat, fresh_client=False)
+        _report("client nou per AWB", fresh)
+        _report("client persistent", pooled)
+        print(f"Câștig median per AWB: {statistics.median(fresh) - statistics.median(pooled):.1f} ms")
+    finally:
+        await service.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
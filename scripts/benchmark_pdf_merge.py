@@ -0,0 +1,104 @@
+# scripts/benchmark_pdf_merge.py
+"""
+Măsoară cât de blocat este event loop-ul în timpul îmbinării unui lot mare de etichete:
+- pe event loop (comportamentul de dinainte de `asyncio.to_thread`);
+- într-un thread (pypdf ține GIL-ul, deci event loop-ul rămâne în mare parte blocat);
+- în pool-ul de procese PDF (`services.pdf_pool`), folosit acum de Print Hub și /labels/merge_for_print.
+
+Un task "ticker" doarme câte --tick-ms și notează întârzierea față de momentul așteptat;
+întârzierea maximă / p95 este latența pe care ar vedea-o orice altă cerere (websocket, webhook).
+
+Utilizare:
+    python scripts/benchmark_pdf_merge.py [--labels 1000] [--tick-ms 10]
+
+Etichetele sunt generate local cu reportlab, nu descărcate de la curier.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from reportlab.lib.pagesizes import A6
+from reportlab.pdfgen import canvas
+
+from services import pdf_pool
+
+
+def _make_labels(directory: Path, count: int) -> List[Path]:
+    paths = []
+    for i in range(1, count + 1):
+        path = directory / f"{i}.pdf"
+        p = canvas.Canvas(str(path), pagesize=A6)
+        p.setFont('Helvetica-Bold', 20)
+        p.drawString(30, 300, f"AWB BENCH{i:07d}")
+        p.setFont('Helvetica', 9)
+        for line in range(20):
+            p.drawString(30, 270 - line * 11, f"Destinatar {i} / rând {line}: Str. Exemplu nr. {line}, București")
+        p.showPage()
+        p.save()
+        paths.append(path)
+    return paths
+
+
+async def _ticker(tick: float, lags: List[float], stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + tick
+        await asyncio.sleep(tick)
+        lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+
+async def _measure(label: str, merge, tick: float):
+    lags: List[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(tick, lags, stop))
+    await asyncio.sleep(tick * 3)
+    start = time.perf_counter()
+    pages = await merge()
+    duration = time.perf_counter() - start
+    stop.set()
+    await ticker
+    ordered = sorted(lags)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    print(f"{label:<16} pagini={pages:<5} durată={duration:6.2f}s  lag mediu={statistics.mean(ordered):8.1f} ms  p95={p95:8.1f} ms  max={ordered[-1]:8.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark latență event loop: îmbinare PDF pe loop vs. thread vs. pool de procese.")
+    parser.add_argument("--labels", type=int, default=1000)
+    parser.add_argument("--tick-ms", type=float, default=10.0)
+    args = parser.parse_args()
+    tick = args.tick_ms / 1000
+
+    with tempfile.TemporaryDirectory(prefix='awb_bench_') as tmp:
+        directory = Path(tmp)
+        print(f"Generez {args.labels} etichete de test...")
+        paths = _make_labels(directory, args.labels)
+
+        # Încălzire: pornirea proceselor din pool nu intră în măsurători
+        await pdf_pool.run_in_pdf_pool(pdf_pool.merge_pdf_files, paths[:1], directory / "warmup.pdf")
+
+        async def on_loop():
+            return pdf_pool.merge_pdf_files(paths, directory / "loop.pdf")
+
+        async def in_thread():
+            return await asyncio.to_thread(pdf_pool.merge_pdf_files, paths, directory / "thread.pdf")
+
+        async def in_process_pool():
+            return await pdf_pool.run_in_pdf_pool(pdf_pool.merge_pdf_files, paths, directory / "pool.pdf")
+
+        try:
+            await _measure("pe event loop", on_loop, tick)
+            await _measure("thread", in_thread, tick)
+            await _measure("pool de procese", in_process_pool, tick)
+        finally:
+            pdf_pool.shutdown_pdf_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
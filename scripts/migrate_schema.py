@@ -0,0 +1,97 @@
+# scripts/migrate_schema.py
+"""
+Aduce o bază de date existentă la schema din `models.py`.
+
+Mai întâi creează tabelele lipsă (ex. `sync_checkpoints`, `courier_tokens`) cu
+`Base.metadata.create_all`, apoi aplică coloanele și indecșii adăugați ulterior pe
+tabelele existente (pe care `create_all` nu le modifică). Toate instrucțiunile sunt
+idempotente (IF NOT EXISTS), deci scriptul poate fi rulat oricând, de mai multe ori.
+
+Utilizare:
+    python scripts/migrate_schema.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import models
+from database import DATABASE_URL
+
+# (descriere, instrucțiuni), în ordinea în care au apărut în modele
+MIGRATIONS = [
+    ("line_items.shopify_line_item_id și AWB unic (upsert pe pagini)", [
+        "ALTER TABLE line_items ADD COLUMN IF NOT EXISTS shopify_line_item_id varchar(50) UNIQUE",
+        # Vechiul flux (citire, apoi insert) permitea AWB-uri duplicate între webhook și sync:
+        # păstrăm cel mai nou rând per AWB înainte de indexul unic
+        "DELETE FROM shipments s USING shipments newer WHERE s.awb = newer.awb AND s.id < newer.id",
+        # Indexul `ix_shipments_awb` (neunic în schema veche) devine unic, ca în models.py
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = 'ix_shipments_awb' AND i.indisunique
+            ) THEN
+                CREATE UNIQUE INDEX IF NOT EXISTS ix_shipments_awb_unique ON shipments (awb);
+                DROP INDEX IF EXISTS ix_shipments_awb;
+                ALTER INDEX ix_shipments_awb_unique RENAME TO ix_shipments_awb;
+            END IF;
+        END $$
+        """,
+    ]),
+    ("orders.payload_hash (comenzi nemodificate sărite la sync)", [
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS payload_hash varchar(64)",
+    ]),
+    ("shipments.next_check_at / check_count (programarea tracking-ului)", [
+        "ALTER TABLE shipments ADD COLUMN IF NOT EXISTS next_check_at timestamptz DEFAULT now()",
+        "ALTER TABLE shipments ADD COLUMN IF NOT EXISTS check_count integer NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS ix_shipments_next_check_at ON shipments (next_check_at) WHERE next_check_at IS NOT NULL",
+    ]),
+    ("orders.derived_status (status derivat calculat în SQL)", [
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS derived_status varchar(255)",
+        "CREATE INDEX IF NOT EXISTS ix_orders_derived_status ON orders (derived_status)",
+    ]),
+]
+
+
+async def _column_exists(conn, table: str, column: str) -> bool:
+    result = await conn.execute(
+        text("SELECT 1 FROM information_schema.columns WHERE table_name = :table AND column_name = :column"),
+        {"table": table, "column": column},
+    )
+    return result.first() is not None
+
+
+async def main():
+    print("Se conectează la baza de date...")
+    engine = create_async_engine(DATABASE_URL)
+    try:
+        async with engine.begin() as conn:
+            backfill_derived_status = not await _column_exists(conn, 'orders', 'derived_status')
+            print("- tabelele lipsă din models.py")
+            await conn.run_sync(models.Base.metadata.create_all)
+            for description, statements in MIGRATIONS:
+                print(f"- {description}")
+                for statement in statements:
+                    await conn.execute(text(statement))
+        print("Schema este la zi.")
+
+        # Coloana nou adăugată este goală: o completăm o singură dată, cu aceeași logică ca sync-ul
+        if backfill_derived_status:
+            from database import AsyncSessionLocal
+            from services.derived_status_service import recompute_derived_statuses
+            print("Se completează orders.derived_status...")
+            async with AsyncSessionLocal() as db:
+                changed = await recompute_derived_statuses(db)
+            print(f"Status derivat completat pentru {changed} comenzi.")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
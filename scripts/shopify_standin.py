@@ -0,0 +1,202 @@
+# scripts/shopify_standin.py
+"""
+Înlocuitor local pentru Shopify Admin GraphQL, servit dintr-un fișier JSONL în formatul
+rezultatului Bulk Operations (implicit `scripts/fixtures/shopify_bulk_orders.jsonl`).
+
+Răspunde la exact cererile folosite de `shopify_service`:
+- `OrdersPage`: paginare cu cursor; lineItems / fulfillmentOrders trunchiate la
+  LINE_ITEMS_PAGE_SIZE / FULFILLMENT_ORDERS_PAGE_SIZE, ca în Shopify;
+- `RemainingNested`: restul unei conexiuni imbricate;
+- `RunBulkOrders` + `BulkStatus`: operația este gata imediat, iar URL-ul duce la fișierul JSONL.
+
+Utilizare:
+    # verifică offline că sync-ul paginat și cel bulk produc aceleași comenzi
+    python scripts/shopify_standin.py check [--fixture fișier.jsonl] [--page-size 3]
+
+    # server local; aplicația îl folosește cu SHOPIFY_GRAPHQL_URL=http://127.0.0.1:8765/graphql.json
+    python scripts/shopify_standin.py serve [--port 8765]
+
+Filtrul `query` (fereastra de date) este ignorat: fixture-ul este fereastra.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services import shopify_service
+from services.ingest_service import payload_fingerprint
+from services.shopify_client import get_shopify_client
+from settings import ShopifyStore
+
+DEFAULT_FIXTURE = Path(__file__).parent / "fixtures" / "shopify_bulk_orders.jsonl"
+BULK_OPERATION_ID = "gid://shopify/BulkOperation/1"
+BULK_PATH = "/bulk/orders.jsonl"
+
+# Tipul din GID -> (conexiune, dimensiunea primei pagini în OrdersPage)
+CHILD_CONNECTIONS = {
+    "LineItem": ("lineItems", shopify_service.LINE_ITEMS_PAGE_SIZE),
+    "FulfillmentOrder": ("fulfillmentOrders", shopify_service.FULFILLMENT_ORDERS_PAGE_SIZE),
+}
+
+
+class ShopifyStandin:
+    """Starea înlocuitorului: comenzile din fixture (în ordinea fișierului) și copiii lor."""
+
+    def __init__(self, fixture: Path, base_url: str):
+        self.jsonl = fixture.read_text(encoding="utf-8")
+        self.base_url = base_url.rstrip("/")
+        self.orders: List[Dict[str, Any]] = []
+        self.children: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for line in self.jsonl.splitlines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            parent_id = row.pop("__parentId", None)
+            if parent_id is None:
+                self.orders.append(row)
+            else:
+                connection, _ = CHILD_CONNECTIONS[row["id"].split("/")[-2]]
+                self.children.setdefault((parent_id, connection), []).append(row)
+
+    def _connection(self, order_id: str, connection: str, offset: int, first: int) -> Dict[str, Any]:
+        items = self.children.get((order_id, connection), [])
+        page = items[offset:offset + first]
+        has_next = offset + first < len(items)
+        return {
+            "pageInfo": {"hasNextPage": has_next, "endCursor": str(offset + first) if has_next else None},
+            "edges": [{"node": node} for node in page],
+        }
+
+    def _orders_page(self, variables: Dict[str, Any]) -> Dict[str, Any]:
+        offset = int(variables.get("after") or 0)
+        first = int(variables["first"])
+        edges = []
+        for order in self.orders[offset:offset + first]:
+            node = dict(order)
+            for connection, page_size in CHILD_CONNECTIONS.values():
+                node[connection] = self._connection(order["id"], connection, 0, page_size)
+            edges.append({"node": node})
+        has_next = offset + first < len(self.orders)
+        return {"orders": {"pageInfo": {"hasNextPage": has_next, "endCursor": str(offset + first)}, "edges": edges}}
+
+    def _remaining_nested(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        connection = "lineItems" if "lineItems(" in query else "fulfillmentOrders"
+        return {"node": {connection: self._connection(
+            variables["id"], connection, int(variables.get("after") or 0), shopify_service.NESTED_FOLLOWUP_PAGE_SIZE
+        )}}
+
+    def graphql(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        query, variables = payload.get("query", ""), payload.get("variables") or {}
+        if "OrdersPage" in query:
+            data = self._orders_page(variables)
+        elif "RemainingNested" in query:
+            data = self._remaining_nested(query, variables)
+        elif "RunBulkOrders" in query:
+            data = {"bulkOperationRunQuery": {"bulkOperation": {"id": BULK_OPERATION_ID, "status": "CREATED"}, "userErrors": []}}
+        elif "BulkStatus" in query:
+            data = {"node": {
+                "id": BULK_OPERATION_ID, "status": "COMPLETED", "errorCode": None,
+                "objectCount": str(len(self.jsonl.splitlines())), "url": f"{self.base_url}{BULK_PATH}",
+            }}
+        else:
+            return {"errors": [{"message": "Query necunoscut pentru înlocuitorul local."}]}
+        return {"data": data}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        """Handler pentru `httpx.MockTransport`."""
+        if request.method == "GET" and request.url.path == BULK_PATH:
+            return httpx.Response(200, text=self.jsonl)
+        if request.method == "POST" and request.url.path.endswith("graphql.json"):
+            return httpx.Response(200, json=self.graphql(json.loads(request.content)))
+        return httpx.Response(404, json={"errors": "Not Found"})
+
+
+def _normalize(orders: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Comenzile după ID, fără `pageInfo` (diferă între moduri și nu intră în amprentă)."""
+    result = {}
+    for order in orders:
+        order = dict(order)
+        for connection, _ in CHILD_CONNECTIONS.values():
+            order[connection] = {"edges": (order.get(connection) or {}).get("edges", [])}
+        result[order["id"]] = order
+    return result
+
+
+async def _collect(pages) -> List[Dict[str, Any]]:
+    orders: List[Dict[str, Any]] = []
+    async for page in pages:
+        orders.extend(page.orders)
+    return orders
+
+
+async def check(fixture: Path, page_size: int) -> bool:
+    base_url = "https://standin.local"
+    standin = ShopifyStandin(fixture, base_url)
+    store = ShopifyStore(
+        brand="Standin", domain="standin.local", access_token="offline", pii_source="shopify",
+        shared_secret="", graphql_url=f"{base_url}/admin/api/2025-07/graphql.json",
+    )
+    client = get_shopify_client(store)
+    await client.http.aclose()
+    client.http = httpx.AsyncClient(transport=httpx.MockTransport(standin.handle))
+    try:
+        paged = _normalize(await _collect(shopify_service.iter_order_pages(store, since_days=30, page_size=page_size)))
+        bulk = _normalize(await _collect(shopify_service.iter_bulk_order_pages(store, since_days=30, page_size=page_size, poll_interval=0)))
+    finally:
+        await client.aclose()
+
+    ok = True
+    if paged.keys() != bulk.keys():
+        print(f"DIFERENȚĂ: comenzi doar paginat {sorted(paged.keys() - bulk.keys())}, doar bulk {sorted(bulk.keys() - paged.keys())}")
+        ok = False
+    for order_id in sorted(paged.keys() & bulk.keys()):
+        if payload_fingerprint(paged[order_id], store.pii_source) != payload_fingerprint(bulk[order_id], store.pii_source):
+            print(f"DIFERENȚĂ pentru {order_id}:\n  paginat: {json.dumps(paged[order_id], ensure_ascii=False)[:300]}\n  bulk:    {json.dumps(bulk[order_id], ensure_ascii=False)[:300]}")
+            ok = False
+    items = sum(len(o["lineItems"]["edges"]) for o in paged.values())
+    print(f"{len(paged)} comenzi ({items} line items) paginat vs. {len(bulk)} bulk: {'identice' if ok else 'DIFERITE'}.")
+    return ok
+
+
+def serve(fixture: Path, port: int):
+    import uvicorn
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, PlainTextResponse
+
+    standin = ShopifyStandin(fixture, f"http://127.0.0.1:{port}")
+    app = FastAPI()
+
+    @app.post("/graphql.json")
+    @app.post("/admin/api/{api_version}/graphql.json")
+    async def graphql(request: Request, api_version: Optional[str] = None):
+        return JSONResponse(standin.graphql(await request.json()))
+
+    @app.get(BULK_PATH)
+    async def bulk_result():
+        return PlainTextResponse(standin.jsonl)
+
+    uvicorn.run(app, host="127.0.0.1", port=port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Înlocuitor local Shopify GraphQL (paginare + Bulk Operations) din fixture JSONL.")
+    parser.add_argument("command", choices=["check", "serve"])
+    parser.add_argument("--fixture", type=Path, default=DEFAULT_FIXTURE)
+    parser.add_argument("--page-size", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.fixture, args.port)
+    elif not asyncio.run(check(args.fixture, args.page_size)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# services/batch_planner.py
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from settings import settings
+from .print_service import printable_shipments_select, sorted_printable_shipments
+
+
+class StalePlanError(Exception):
+    """Versiunea planului trimisă de client nu mai corespunde datelor curente."""
+    pass
+
+
+class BatchPlan(NamedTuple):
+    """
+    Planul de printare înghețat al unei categorii: AWB-urile neprintate în ordinea de printare,
+    împărțite în loturi de `batch_size`. `version` depinde doar de conținut, deci două procese
+    (sau o repornire) construiesc aceeași versiune pentru aceleași date.
+    """
+    category_id: int
+    version: str
+    fingerprint: Tuple
+    batch_size: int
+    shipments: Tuple[Dict, ...]
+    built_at: float
+
+    @property
+    def total_batches(self) -> int:
+        return -(-len(self.shipments) // self.batch_size)
+
+    def shipments_for(self, batch_numbers: Iterable[int]) -> List[Dict]:
+        """AWB-urile loturilor cerute (numerotate de la 1), în ordinea loturilor; loturile inexistente sunt ignorate."""
+        selected = []
+        for batch_num in batch_numbers:
+            if 1 <= batch_num <= self.total_batches:
+                selected.extend(self.shipments[(batch_num - 1) * self.batch_size:batch_num * self.batch_size])
+        return selected
+
+
+class BatchPlanner:
+    """
+    Cache în memorie cu planul de printare al fiecărei categorii. Amprenta datelor (număr,
+    max/sumă ID-uri AWB, ultima modificare a comenzilor) este citită pentru toate categoriile
+    cu o singură interogare agregată; planul (interogarea grea + sortarea) este reconstruit
+    doar pentru categoriile a căror amprentă s-a schimbat sau mai vechi de PRINT_PLAN_MAX_AGE_SECONDS.
+    """
+
+    def __init__(self):
+        self._plans: Dict[int, BatchPlan] = {}
+        self._locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def _fingerprints(self, db: AsyncSession, category_id: Optional[int] = None) -> Dict[int, Tuple]:
+        category_col = models.store_category_map.c.category_id
+        query = (
+            printable_shipments_select(
+                category_col,
+                func.count(models.Shipment.id),
+                func.max(models.Shipment.id),
+                func.sum(models.Shipment.id),
+                func.max(models.Order.updated_at),
+            )
+            .join(models.store_category_map, models.store_category_map.c.store_id == models.Order.store_id)
+            .group_by(category_col)
+        )
+        if category_id is not None:
+            query = query.where(category_col == category_id)
+        rows = (await db.execute(query)).all()
+        return {row[0]: (row[1], row[2], row[3], row[4].isoformat() if row[4] else None) for row in rows}
+
+    def _is_fresh(self, plan: Optional[BatchPlan], fingerprint: Tuple) -> bool:
+        return (
+            plan is not None
+            and plan.fingerprint == fingerprint
+            and plan.batch_size == settings.print_batch_size
+            and time.monotonic() - plan.built_at < settings.PRINT_PLAN_MAX_AGE_SECONDS
+        )
+
+    async def _plan_for(self, db: AsyncSession, category_id: int, fingerprint: Tuple) -> BatchPlan:
+        plan = self._plans.get(category_id)
+        if self._is_fresh(plan, fingerprint):
+            return plan
+        # O singură reconstrucție per categorie; cererile simultane așteaptă și refolosesc rezultatul
+        async with self._locks[category_id]:
+            plan = self._plans.get(category_id)
+            if self._is_fresh(plan, fingerprint):
+                return plan
+            start = time.monotonic()
+            shipments = tuple(await sorted_printable_shipments(db, category_id)) if fingerprint[0] else ()
+            batch_size = settings.print_batch_size
+            digest = hashlib.sha256(f"{category_id}:{batch_size}".encode('utf-8'))
+            for s in shipments:
+                digest.update(f"\n{s['awb']}".encode('utf-8'))
+            plan = BatchPlan(category_id, digest.hexdigest()[:16], fingerprint, batch_size, shipments, time.monotonic())
+            self._plans[category_id] = plan
+            if shipments:
+                logging.info(f"Plan de printare pentru categoria {category_id}: {len(shipments)} AWB-uri, {plan.total_batches} loturi, versiunea {plan.version} ({time.monotonic() - start:.2f}s).")
+            return plan
+
+    async def get_plans(self, db: AsyncSession, category_ids: Iterable[int]) -> Dict[int, BatchPlan]:
+        """Planurile curente pentru `category_ids` (pentru Print Hub), cu o singură interogare de amprentă."""
+        fingerprints = await self._fingerprints(db)
+        return {cid: await self._plan_for(db, cid, fingerprints.get(cid, (0, None, None, None))) for cid in category_ids}
+
+    async def get_plan(self, db: AsyncSession, category_id: int, expected_version: Optional[str] = None) -> BatchPlan:
+        """
+        Planul curent al categoriei. Dacă `expected_version` este dat și diferă de versiunea
+        curentă (AWB-uri noi, printate între timp etc.), ridică StalePlanError.
+        """
+        fingerprints = await self._fingerprints(db, category_id)
+        plan = await self._plan_for(db, category_id, fingerprints.get(category_id, (0, None, None, None)))
+        if expected_version is not None and expected_version != plan.version:
+            raise StalePlanError(f"Planul categoriei {category_id} s-a schimbat ({expected_version} -> {plan.version}).")
+        return plan
+
+    def invalidate(self, category_id: Optional[int] = None):
+        """Renunță la planul categoriei (sau la toate), de ex. după ce AWB-urile au fost printate."""
+        if category_id is None:
+            self._plans.clear()
+        else:
+            self._plans.pop(category_id, None)
+
+
+batch_planner = BatchPlanner()
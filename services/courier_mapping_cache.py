@@ -0,0 +1,67 @@
+# services/courier_mapping_cache.py
+
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from settings import settings
+
+
+class CourierMappingCache:
+    """
+    Cache în memorie pentru maparea numelui de curier din Shopify -> (courier_type, account_key).
+    Se încarcă o singură dată (toate mapările spre conturi active) și este invalidat
+    de `crud.couriers` la fiecare modificare. TTL-ul acoperă modificările făcute
+    din alt proces (alt worker uvicorn).
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self._ttl = ttl_seconds
+        self._mappings: Optional[Dict[str, Tuple[str, str]]] = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._mappings = None
+
+    async def _get_mappings(self, db: AsyncSession) -> Dict[str, Tuple[str, str]]:
+        mappings = self._mappings
+        if mappings is not None and time.monotonic() - self._loaded_at < self._ttl:
+            return mappings
+
+        async with self._lock:
+            if self._mappings is not None and time.monotonic() - self._loaded_at < self._ttl:
+                return self._mappings
+            result = await db.execute(
+                select(models.CourierMapping.shopify_name, models.CourierAccount.courier_type, models.CourierAccount.account_key)
+                .join(models.CourierAccount, models.CourierMapping.account_key == models.CourierAccount.account_key)
+                .where(models.CourierAccount.is_active == True)
+            )
+            self._mappings = {
+                name.strip().lower(): (courier_type, account_key)
+                for name, courier_type, account_key in result.all() if name
+            }
+            self._loaded_at = time.monotonic()
+            logging.info(f"Cache mapări curieri încărcat: {len(self._mappings)} mapări active.")
+            return self._mappings
+
+    async def resolve(self, db: AsyncSession, tracking_company: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """Returnează (courier_type, account_key) sau (None, None) dacă nu există mapare activă."""
+        search_text = (tracking_company or '').strip().lower()
+        if not search_text:
+            return None, None
+        return (await self._get_mappings(db)).get(search_text, (None, None))
+
+    async def resolve_many(self, db: AsyncSession, companies: Iterable[Optional[str]]) -> Dict[str, Tuple[str, str]]:
+        """Ca `resolve`, pentru mai multe nume deodată (cheie: numele lowercase). Numele nemapate lipsesc."""
+        mappings = await self._get_mappings(db)
+        names = {(c or '').strip().lower() for c in companies} - {''}
+        return {name: mappings[name] for name in names if name in mappings}
+
+
+courier_mapping_cache = CourierMappingCache(ttl_seconds=settings.COURIER_MAPPING_CACHE_TTL_SECONDS)
@@ -2,78 +2,276 @@
 
 import asyncio
 import logging
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from itertools import zip_longest
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
-from tqdm.asyncio import tqdm
-from typing import List, Tuple, Dict, Any
+from sqlalchemy import Integer, String, cast, column, select, update, values
+from sqlalchemy.dialects.postgresql import TIMESTAMP
+from typing import List, Tuple, Dict, Any, Optional, NamedTuple
 
 import models
 from settings import settings
-from .couriers.common import TrackingStatus
+from .couriers.common import BaseCourierService, TrackingStatus
+from .couriers.resilience import set_run_deadline, reset_run_deadline, remaining_time
 from .couriers import get_courier_service
+from .status_classifier import status_classifier
+from .derived_status_service import recompute_derived_statuses
+from websocket_manager import manager
 
 
-# Worker-ul primește serviciul gata creat
-async def worker(courier_service, shipment: models.Shipment):
+def next_check_at(group: Optional[str], check_count: int, now: datetime) -> Optional[datetime]:
+    """
+    Momentul următoarei verificări pentru un AWB din grupul `group`, după `check_count`
+    verificări consecutive fără schimbare. Intervalul de bază al grupului se dublează
+    la fiecare verificare fără mișcare, până la TRACKING_MAX_INTERVAL_MINUTES.
+    Grupurile finale (livrat/refuzat/anulat) nu mai sunt verificate (None).
+    """
+    if group in settings.TRACKING_FINAL_GROUPS:
+        return None
+    intervals = settings.TRACKING_INTERVAL_MINUTES
+    base = intervals.get(group or "unknown", intervals.get("unknown", 120))
+    minutes = min(base * 2 ** min(check_count, 8), settings.TRACKING_MAX_INTERVAL_MINUTES)
+    return now + timedelta(minutes=minutes)
+
+
+class _DueShipment(NamedTuple):
+    id: int
+    order_id: Optional[int]
+    awb: str
+    account_key: str
+    last_status: Optional[str]
+    check_count: int
+
+
+async def _track_chunk(courier_service: Optional[BaseCourierService], awbs: List[str]) -> Dict[str, TrackingStatus]:
     if not courier_service:
-        return None, shipment.id
+        return {}
     try:
-        response: TrackingStatus = await courier_service.track(shipment.awb)
-        return response, shipment.id
+        return await courier_service.track_many(awbs)
     except Exception as e:
-        logging.error(f"Eroare la tracking pentru AWB {shipment.awb}: {e}")
-        return None, shipment.id
+        logging.error(f"Eroare la tracking pentru contul {courier_service.account_key} ({len(awbs)} AWB-uri): {e}")
+        return {}
+
+
+def _interleave_chunks(by_account: Dict[str, List[_DueShipment]], chunk_sizes: Dict[str, int]) -> List[Tuple[str, List[_DueShipment]]]:
+    """Împarte AWB-urile fiecărui cont în bucăți și le alternează între conturi (round-robin)."""
+    per_account = [
+        [(account_key, rows[i:i + chunk_sizes[account_key]]) for i in range(0, len(rows), chunk_sizes[account_key])]
+        for account_key, rows in by_account.items()
+    ]
+    interleaved = []
+    for round_ in zip_longest(*per_account):
+        interleaved.extend(item for item in round_ if item)
+    return interleaved
+
+
+def _shipment_update(row: _DueShipment, response: Optional[TrackingStatus], now: datetime) -> Dict[str, Any]:
+    """
+    Valorile noi pentru un AWB verificat. Doar statusurile diferite de cel salvat
+    conțin `last_status` (și `last_status_at`); restul actualizează doar programul
+    de verificare. Fără răspuns de la curier (eroare de comunicare, circuit deschis)
+    contorul rămâne neatins, iar AWB-ul este reîncercat după TRACKING_ERROR_RETRY_MINUTES.
+    """
+    if response is None:
+        return {
+            'id': row.id,
+            'check_count': row.check_count or 0,
+            'next_check_at': now + timedelta(minutes=settings.TRACKING_ERROR_RETRY_MINUTES),
+            'error': True,
+        }
+    group = status_classifier.classify(response.raw_status)
+    if response.raw_status != row.last_status:
+        return {
+            'id': row.id,
+            'order_id': row.order_id,
+            'last_status': response.raw_status,
+            'last_status_at': now,
+            'next_check_at': next_check_at(group, 0, now),
+        }
+    # Fără schimbare: următoarea verificare se amână progresiv
+    check_count = (row.check_count or 0) + 1
+    return {'id': row.id, 'check_count': check_count, 'next_check_at': next_check_at(group, check_count, now)}
+
+
+async def _write_updates(db: AsyncSession, updates: List[Dict[str, Any]]):
+    """
+    Scrie un lot de rezultate și face commit:
+    - statusurile schimbate: un singur `UPDATE shipments ... FROM (VALUES ...)` care setează
+      last_status, last_status_at și resetează programul de verificare;
+    - celelalte AWB-uri: un `UPDATE ... FROM (VALUES ...)` doar pentru check_count/next_check_at;
+    - statusul derivat este recalculat (în SQL) doar pentru comenzile cu AWB-uri schimbate.
+    """
+    changes = [u for u in updates if 'last_status' in u]
+    schedule = [u for u in updates if 'last_status' not in u]
+
+    if changes:
+        changed_rows = values(
+            column('id', Integer), column('last_status', String), column('last_status_at', TIMESTAMP(timezone=True)),
+            column('next_check_at', TIMESTAMP(timezone=True)),
+            name='changed_rows',
+        ).data([(u['id'], u['last_status'], u['last_status_at'], u['next_check_at']) for u in changes])
+        await db.execute(
+            update(models.Shipment)
+            .where(models.Shipment.id == changed_rows.c.id)
+            .values(
+                last_status=changed_rows.c.last_status,
+                last_status_at=changed_rows.c.last_status_at,
+                # NULL-urile din VALUES nu au tip (status final); cast explicit pentru cazul în care toate sunt NULL
+                next_check_at=cast(changed_rows.c.next_check_at, TIMESTAMP(timezone=True)),
+                check_count=0,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    if schedule:
+        schedule_rows = values(
+            column('id', Integer), column('check_count', Integer), column('next_check_at', TIMESTAMP(timezone=True)),
+            name='schedule_rows',
+        ).data([(u['id'], u['check_count'], u['next_check_at']) for u in schedule])
+        await db.execute(
+            update(models.Shipment)
+            .where(models.Shipment.id == schedule_rows.c.id)
+            .values(check_count=schedule_rows.c.check_count, next_check_at=cast(schedule_rows.c.next_check_at, TIMESTAMP(timezone=True)))
+            .execution_options(synchronize_session=False)
+        )
+
+    order_ids = {u['order_id'] for u in changes if u['order_id'] is not None}
+    if order_ids:
+        await recompute_derived_statuses(db, order_ids, commit=False)
+    await db.commit()
+
 
 async def track_and_update_shipments(db: AsyncSession, full_sync: bool = False):
+    """
+    Urmărește AWB-urile scadente (`next_check_at <= acum`, cele mai vechi întâi, cel mult
+    TRACKING_MAX_PER_RUN) și programează următoarea verificare după grupul statusului.
+    Cu `full_sync=True` sunt verificate toate AWB-urile nefinalizate, indiferent de program.
+
+    AWB-urile sunt grupate pe cont în bucăți (`track_many`) puse într-o coadă, consumată de
+    TRACKING_WORKERS worker-i. Rezultatele sunt scrise pe măsură ce sosesc, în loturi de
+    TRACKING_COMMIT_EVERY AWB-uri (UPDATE bulk + commit), deci o oprire la jumătate nu
+    pierde statusurile deja primite. Progresul este transmis prin websocket.
+
+    Rularea are un deadline global (TRACKING_RUN_DEADLINE_SECONDS): reîncercările și
+    timeout-urile cererilor se încadrează în el, iar după expirare bucățile rămase nu mai
+    sunt trimise (rămân scadente pentru rularea următoare). Bucățile unui cont cu circuitul
+    deschis sunt sărite imediat și reprogramate ca erori.
+    """
     logging.warning("COURIER SYNC a pornit.")
-    final_statuses = ["livrat", "refuzat", "retur"]
-    
+    start_ts = datetime.now(timezone.utc)
+
     query = (
-        select(models.Shipment, models.CourierAccount.courier_type, models.CourierAccount.credentials)
+        select(
+            models.Shipment.id, models.Shipment.order_id, models.Shipment.awb, models.Shipment.account_key,
+            models.Shipment.last_status, models.Shipment.check_count,
+            models.CourierAccount.courier_type, models.CourierAccount.credentials,
+        )
         .join(models.CourierAccount, models.Shipment.account_key == models.CourierAccount.account_key)
-        .where(or_(
-            models.Shipment.derived_status.notin_(final_statuses),
-            models.Shipment.derived_status.is_(None)
-        ))
+        .where(models.Shipment.next_check_at.isnot(None))
     )
+    if not full_sync:
+        query = (
+            query.where(models.Shipment.next_check_at <= start_ts)
+            .order_by(models.Shipment.next_check_at)
+            .limit(settings.TRACKING_MAX_PER_RUN)
+        )
     result = await db.execute(query)
-    shipments_and_details: List[Tuple[models.Shipment, str, Dict[str, Any]]] = result.all()
+    rows = result.all()
 
-    if not shipments_and_details:
+    if not rows:
         logging.warning("Nu există AWB-uri de urmărit.")
+        await manager.broadcast({"type": "sync_end", "sync_type": "couriers", "message": "Nu există AWB-uri de urmărit."})
         return
 
-    # --- LOGICA NOUĂ: Creăm o singură instanță de serviciu per cont ---
-    service_instances = {}
-    all_tasks = []
-    
-    for shipment, courier_type, credentials in shipments_and_details:
-        account_key = shipment.account_key
+    # O singură instanță de serviciu per cont, iar AWB-urile sunt grupate pe cont
+    # ca fiecare curier să le poată urmări în cereri multi-colet (`track_many`)
+    service_instances: Dict[str, Optional[BaseCourierService]] = {}
+    by_account: Dict[str, List[_DueShipment]] = defaultdict(list)
+    for shipment_id, order_id, awb, account_key, last_status, check_count, courier_type, credentials in rows:
         if account_key not in service_instances:
-            # Creăm serviciul o singură dată pentru fiecare cont
-            service_instances[account_key] = get_courier_service(
-                courier_type, account_key, credentials
-            )
-        
-        courier_service = service_instances[account_key]
-        all_tasks.append(worker(courier_service, shipment))
-    # --- SFÂRȘIT LOGICĂ NOUĂ ---
-
-    shipment_map = {sh.id: sh for sh, _, _ in shipments_and_details}
-    results = await tqdm.gather(*all_tasks, desc="Verificare status AWB-uri")
-
-    updated_count = 0
-    # Despachetarea rezultatului este acum mai simplă
-    for response, shipment_id in results:
-        if response and shipment_id:
-            shipment = shipment_map.get(shipment_id)
-            if shipment:
-                shipment.last_status = response.raw_status
-                shipment.derived_status = derived_status
-                updated_count += 1
-
-    if updated_count > 0:
-        await db.commit()
-        logging.warning(f"S-au actualizat {updated_count} statusuri de AWB-uri.")
-    else:
-        logging.warning("Nu s-a actualizat niciun status de AWB.")
\ No newline at end of file
+            service_instances[account_key] = get_courier_service(courier_type, account_key, credentials)
+        by_account[account_key].append(_DueShipment(shipment_id, order_id, awb, account_key, last_status, check_count))
+
+    chunk_sizes = {
+        account_key: max(settings.TRACKING_CHUNK_SIZE, getattr(service, 'track_batch_size', 1) or 1)
+        for account_key, service in service_instances.items()
+    }
+    work_queue: asyncio.Queue = asyncio.Queue()
+    for item in _interleave_chunks(by_account, chunk_sizes):
+        work_queue.put_nowait(item)
+
+    total = len(rows)
+    results_queue: asyncio.Queue = asyncio.Queue()
+    await manager.broadcast({"type": "sync_start", "sync_type": "couriers", "message": f"Verificare status pentru {total} AWB-uri ({len(by_account)} conturi)..."})
+
+    skipped = 0
+
+    async def tracking_worker():
+        nonlocal skipped
+        while True:
+            try:
+                account_key, chunk = work_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            remaining = remaining_time()
+            if remaining is not None and remaining <= 0:
+                skipped += len(chunk)
+                continue
+            service = service_instances[account_key]
+            if service and service.circuit_breaker.is_open:
+                statuses = {}
+            else:
+                statuses = await _track_chunk(service, [row.awb for row in chunk])
+            now = datetime.now(timezone.utc)
+            await results_queue.put([_shipment_update(row, statuses.get(row.awb), now) for row in chunk])
+
+    async def writer():
+        pending: List[Dict[str, Any]] = []
+        done = changed = finished = errors = 0
+        while True:
+            updates = await results_queue.get()
+            if updates is not None:
+                pending.extend(updates)
+                done += len(updates)
+                changed += sum(1 for u in updates if 'last_status' in u)
+                errors += sum(1 for u in updates if u.get('error'))
+                finished += sum(1 for u in updates if u['next_check_at'] is None)
+            if pending and (updates is None or len(pending) >= settings.TRACKING_COMMIT_EVERY):
+                await _write_updates(db, pending)
+                pending = []
+                await manager.broadcast({
+                    "type": "progress_update",
+                    "sync_type": "couriers",
+                    "current": done,
+                    "total": total,
+                    "message": f"Verificare AWB-uri... ({done}/{total}, {changed} statusuri schimbate, {errors} erori)",
+                })
+            if updates is None:
+                return done, changed, finished, errors
+
+    writer_task = asyncio.create_task(writer())
+    # Deadline-ul este setat înainte de crearea task-urilor, care copiază contextul curent
+    deadline_token = set_run_deadline(settings.TRACKING_RUN_DEADLINE_SECONDS)
+    try:
+        workers = [asyncio.create_task(tracking_worker()) for _ in range(max(1, settings.TRACKING_WORKERS))]
+    finally:
+        reset_run_deadline(deadline_token)
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        # Salvăm tot ce s-a primit, chiar dacă rularea a fost întreruptă
+        await results_queue.put(None)
+        done, changed, finished, errors = await writer_task
+
+    message = (
+        f"Verificare curieri finalizată: {done - errors} AWB-uri verificate, {changed} statusuri schimbate, "
+        f"{finished} ajunse la status final, {errors} fără răspuns de la curier, {skipped} amânate (deadline)."
+    )
+    await manager.broadcast({
+        "type": "sync_end", "sync_type": "couriers", "message": message,
+        "checked": done - errors, "changed": changed, "errors": errors, "skipped": skipped,
+    })
+    logging.warning(f"COURIER SYNC finalizat în {(datetime.now(timezone.utc) - start_ts).total_seconds():.1f}s: {message}")
@@ -1,9 +1,14 @@
 # gbeschea/awb-hub/AWB-Hub-4f368a2a96d8f5e58ab53450be45f32021473f5a/services/couriers/__init__.py
 
+import asyncio
 import logging
 from typing import Dict, Any, Optional
 
+from settings import settings
 from .common import BaseCourierService
+from .rate_limit import drop_rate_limiter
+from .resilience import drop_circuit_breaker
+from .token_store import token_store
 from .dpd import DPDCourierService
 from .sameday import SamedayCourierService
 # Adaugă și alți curieri aici
@@ -39,4 +44,40 @@ def get_courier_service(courier_type: str, account_key: str, credentials: Dict[s
             logging.warning(f"Tipul de curier '{courier_type}' nu este implementat în __init__.py")
             return None
             
-    return _courier_instances[instance_key]
\ No newline at end of file
+    return _courier_instances[instance_key]
+
+
+async def close_courier_services():
+    """Închide clienții HTTP ai tuturor instanțelor; apelată la oprirea aplicației."""
+    instances = list(_courier_instances.values())
+    _courier_instances.clear()
+    for instance in instances:
+        try:
+            await instance.aclose()
+        except Exception as e:
+            logging.warning(f"Eroare la închiderea clientului HTTP pentru {instance.account_key}: {e}")
+
+
+async def _close_later(instance: BaseCourierService, delay: float):
+    # Cererile deja pornite pe instanța veche se termină (cel mult un timeout) înainte de închidere
+    await asyncio.sleep(delay)
+    try:
+        await instance.aclose()
+    except Exception as e:
+        logging.warning(f"Eroare la închiderea clientului HTTP pentru {instance.account_key}: {e}")
+
+
+async def evict_courier_service(account_key: str):
+    """
+    Scoate instanța (instanțele) contului din `_courier_instances` și renunță la limitatorul,
+    circuitul și token-ul lui, ca următoarea cerere să folosească setările și credențialele
+    curente. Apelată de `crud.couriers` după modificarea unui cont.
+    """
+    evicted = [key for key, instance in _courier_instances.items() if instance.account_key == account_key]
+    for key in evicted:
+        asyncio.create_task(_close_later(_courier_instances.pop(key), settings.COURIER_HTTP_TIMEOUT_SECONDS))
+    drop_rate_limiter(account_key)
+    drop_circuit_breaker(account_key)
+    await token_store.forget(account_key)
+    if evicted:
+        logging.info(f"Instanța serviciului de curier pentru contul {account_key} a fost recreată la următoarea cerere.")
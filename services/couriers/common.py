@@ -1,29 +1,158 @@
 # services/couriers/common.py
 
+import asyncio
+import logging
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Dict, List, NamedTuple, Optional
+
+import httpx
 from pydantic import BaseModel
 
+from settings import settings as app_settings
+
+from .rate_limit import get_rate_limiter
+from .resilience import CourierTransportError, CircuitOpenError, get_circuit_breaker, remaining_time
+
 class TrackingStatus(BaseModel):
     """
     O structură standard pentru răspunsul de la serviciile de tracking.
     """
     raw_status: str
 
+class LabelResponse(NamedTuple):
+    """Rezultatul descărcării unei etichete: PDF-ul sau motivul eșecului."""
+    success: bool
+    content: Optional[bytes] = None
+    error_message: Optional[str] = None
+
+def _retry_after_seconds(value: Optional[str]) -> float:
+    """Valoarea header-ului Retry-After în secunde: număr de secunde sau dată HTTP (0 dacă lipsește sau e invalid)."""
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return 0.0
+
 class BaseCourierService(ABC):
     """
     Clasa de bază abstractă pentru toate serviciile de curierat.
     Definește interfața comună.
     """
+    # Tipul curierului, folosit pentru limitele implicite din COURIER_RATE_LIMITS
+    courier_type: str = ''
+
     def __init__(self, account_key: str, settings: dict):
         self.account_key = account_key
         self.settings = settings
+        # Limitatorul contului; fiecare cerere HTTP către curier trece prin `async with self.rate_limiter`
+        self.rate_limiter = get_rate_limiter(account_key, self.courier_type, settings)
+        self.circuit_breaker = get_circuit_breaker(account_key)
+        # Client HTTP pe termen lung (conexiuni keep-alive refolosite între AWB-uri); închis la oprirea aplicației
+        max_connections = int(settings.get('http_max_connections', app_settings.COURIER_HTTP_MAX_CONNECTIONS))
+        self.timeout_seconds = float(settings.get('http_timeout_seconds', app_settings.COURIER_HTTP_TIMEOUT_SECONDS))
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout_seconds),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=app_settings.COURIER_HTTP_KEEPALIVE_SECONDS,
+            ),
+        )
+
+    async def aclose(self):
+        """Închide conexiunile clientului HTTP."""
+        await self.http.aclose()
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Cerere HTTP către curier, prin rate limiter-ul și circuit breaker-ul contului.
+        Erorile de transport, 5xx și 429 sunt reîncercate cu backoff exponențial (cu jitter),
+        în limita COURIER_RETRY_ATTEMPTS și a deadline-ului rulării; timeout-ul fiecărei
+        încercări nu depășește timpul rămas. Ridică CourierTransportError dacă nu reușește;
+        celelalte răspunsuri (inclusiv 4xx) sunt returnate apelantului.
+        """
+        attempts = max(1, app_settings.COURIER_RETRY_ATTEMPTS)
+        error: CourierTransportError = CourierTransportError(f"Nicio încercare pentru {url}")
+        for attempt in range(1, attempts + 1):
+            # Deadline-ul este verificat înainte de `allow()`, ca să nu ocupăm proba circuitului degeaba
+            remaining = remaining_time()
+            if remaining is not None and remaining <= 0:
+                raise CourierTransportError(f"Deadline-ul rulării a expirat ({self.account_key})")
+            if not self.circuit_breaker.allow():
+                raise CircuitOpenError(f"Circuit deschis pentru contul {self.account_key}")
+            trial = self.circuit_breaker.half_open
+
+            retry_after = 0.0
+            try:
+                try:
+                    async with self.rate_limiter:
+                        remaining = remaining_time()
+                        timeout = self.timeout_seconds if remaining is None else max(0.1, min(self.timeout_seconds, remaining))
+                        response = await self.http.request(method, url, timeout=timeout, **kwargs)
+                    if response.status_code < 500 and response.status_code != 429:
+                        self.circuit_breaker.record_success()
+                        return response
+                    retry_after = _retry_after_seconds(response.headers.get('Retry-After')) if response.status_code == 429 else 0.0
+                    error = CourierTransportError(f"HTTP {response.status_code} de la {self.courier_type or self.account_key}")
+                except httpx.HTTPError as e:
+                    error = CourierTransportError(f"{type(e).__name__} la {self.courier_type or self.account_key}: {e}")
+                self.circuit_breaker.record_failure()
+            finally:
+                # Anulare sau eroare neașteptată în timpul probei: proba este eliberată, altfel circuitul rămâne blocat
+                if trial and self.circuit_breaker.half_open:
+                    self.circuit_breaker.release_trial()
+
+            if attempt == attempts:
+                break
+            delay = max(retry_after, app_settings.COURIER_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            remaining = remaining_time()
+            if remaining is not None and delay >= remaining:
+                break
+            logging.info(f"{error}; reîncercare {attempt + 1}/{attempts} în {delay:.1f}s.")
+            await asyncio.sleep(delay)
+        raise error
+
+    # Câte AWB-uri acceptă API-ul curierului într-o singură cerere de tracking
+    track_batch_size: int = 1
 
     @abstractmethod
     async def track(self, awb: str) -> Optional[TrackingStatus]:
-        """Urmărește un AWB și returnează statusul brut."""
+        """Urmărește un AWB și returnează statusul brut. Ridică CourierTransportError la erori de comunicare."""
         pass
 
+    async def track_many(self, awbs: List[str]) -> Dict[str, TrackingStatus]:
+        """
+        Urmărește mai multe AWB-uri și returnează {awb: status} doar pentru AWB-urile
+        pentru care curierul a răspuns; cele cu erori de comunicare lipsesc din rezultat.
+        Implicit apelează `track` pentru fiecare AWB; curierii al căror API acceptă
+        mai multe colete într-o cerere suprascriu metoda.
+        """
+        statuses = await asyncio.gather(*(self.track(awb) for awb in awbs), return_exceptions=True)
+        results: Dict[str, TrackingStatus] = {}
+        errors = 0
+        for awb, status in zip(awbs, statuses):
+            if isinstance(status, TrackingStatus):
+                results[awb] = status
+            elif isinstance(status, BaseException):
+                errors += 1
+                if not isinstance(status, CourierTransportError):
+                    logging.error(f"Eroare neașteptată la tracking pentru AWB {awb}: {status}")
+        if errors:
+            logging.warning(f"{self.account_key}: {errors}/{len(awbs)} AWB-uri fără răspuns de la curier.")
+        return results
+
+    async def get_label(self, awb: str, paper_size: str = 'A6') -> LabelResponse:
+        """Descarcă eticheta PDF a AWB-ului. Curierii care suportă etichete suprascriu metoda."""
+        return LabelResponse(success=False, error_message=f"Etichetele nu sunt suportate pentru {self.courier_type or self.account_key}.")
+
     # Poți adăuga aici și alte metode comune, cum ar fi 'create_awb'
     # @abstractmethod
     # async def create_awb(self, data: dict) -> Optional[dict]:
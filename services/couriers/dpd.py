@@ -1,9 +1,12 @@
 # services/couriers/dpd.py
-import httpx
+import asyncio
 import logging
-from typing import Optional
+from typing import Optional, Dict, List, Any
 from datetime import datetime, timezone
-from .common import BaseCourierService, TrackingStatus
+from .common import BaseCourierService, TrackingStatus, CourierTransportError, LabelResponse
+
+# Numărul maxim de colete acceptat de DPD într-un singur apel /track/
+DPD_TRACK_MAX_PARCELS = 10
 
 def _parse_dpd_date(date_str: Optional[str]) -> Optional[datetime]:
     if not date_str: return None
@@ -13,43 +16,112 @@ def _parse_dpd_date(date_str: Optional[str]) -> Optional[datetime]:
     except (ValueError, TypeError):
         return None
 
+def _parcel_status(parcel: Dict[str, Any]) -> TrackingStatus:
+    operations = parcel.get('operations', [])
+    if not operations:
+        return TrackingStatus(raw_status="AWB negăsit sau fără istoric DPD")
+
+    last_op = operations[-1]
+    raw_status = (last_op.get('description') or 'N/A').strip()
+    return TrackingStatus(raw_status=raw_status)
+
 class DPDCourierService(BaseCourierService):
     """DPD AWB Tracking Service - implementat cu logica ta originală."""
+
+    courier_type = 'dpd'
     
     def __init__(self, account_key: str, settings: dict):
         super().__init__(account_key, settings)
         self.username = self.settings.get('username')
         self.password = self.settings.get('password')
         self.api_url = "https://api.dpd.ro/v1"
+        self.track_batch_size = max(1, int(self.settings.get('track_batch_size') or DPD_TRACK_MAX_PARCELS))
 
         if not all([self.username, self.password]):
             raise ValueError(f"Username/password missing for DPD account {account_key}")
 
-    async def track(self, awb: str) -> Optional[TrackingStatus]:
+    async def _track_chunk(self, awbs: List[str]) -> Dict[str, TrackingStatus]:
+        """Un singur apel /track/ pentru până la `track_batch_size` colete."""
         body = {
             'userName': self.username, 
             'password': self.password, 
             'language': 'RO', # Schimbat în RO pentru mesaje mai clare
-            'parcels': [{'id': awb}]
+            'parcels': [{'id': awb} for awb in awbs]
+        }
+        r = await self._request('POST', f'{self.api_url}/track/', json=body)
+        if r.status_code != 200:
+            raise CourierTransportError(f"DPD HTTP {r.status_code} pentru AWB-urile {', '.join(awbs)}: {r.text[:200]}")
+
+        try:
+            parcels = (r.json() or {}).get('parcels') or []
+        except ValueError as e:
+            raise CourierTransportError(f"Răspuns DPD invalid pentru AWB-urile {', '.join(awbs)}: {e}")
+        by_id = {str(p.get('parcelId')): p for p in parcels if p.get('parcelId')}
+        results = {}
+        missing = []
+        for index, awb in enumerate(awbs):
+            # Potrivim după `parcelId`; fără el, DPD returnează coletele în ordinea cererii
+            if by_id:
+                parcel = by_id.get(awb)
+            else:
+                parcel = parcels[index] if index < len(parcels) else None
+            if parcel is None:
+                # Lipsa din răspuns nu este un "negăsit" confirmat: AWB-ul rămâne neactualizat și este reîncercat
+                missing.append(awb)
+                continue
+            results[awb] = _parcel_status(parcel)
+        if missing:
+            logging.warning(f"DPD {self.account_key}: AWB-uri lipsă din răspunsul /track/: {', '.join(missing)}")
+        return results
+
+    async def track_many(self, awbs: List[str]) -> Dict[str, TrackingStatus]:
+        """
+        Urmărește AWB-urile în cereri /track/ cu câte `track_batch_size` colete.
+        AWB-urile din cererile eșuate (erori de comunicare) sau lipsă din răspuns lipsesc din rezultat.
+        """
+        chunks = [awbs[i:i + self.track_batch_size] for i in range(0, len(awbs), self.track_batch_size)]
+        results: Dict[str, TrackingStatus] = {}
+        failed = 0
+
+        # Paralelismul și ritmul cererilor sunt limitate de `self.rate_limiter`
+        async def run(chunk: List[str]):
+            nonlocal failed
+            try:
+                results.update(await self._track_chunk(chunk))
+            except CourierTransportError as e:
+                failed += len(chunk)
+                logging.warning(f"DPD {self.account_key}: {e}")
+            except Exception as e:
+                failed += len(chunk)
+                logging.error(f"General error tracking DPD AWBs {', '.join(chunk)}: {e}")
+
+        await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+        logging.info(f"DPD {self.account_key}: {len(awbs)} AWB-uri urmărite în {len(chunks)} cereri ({failed} fără răspuns).")
+        return results
+
+    async def track(self, awb: str) -> Optional[TrackingStatus]:
+        return (await self.track_many([awb])).get(awb)
+
+    async def get_label(self, awb: str, paper_size: str = 'A6') -> LabelResponse:
+        """Eticheta PDF prin /print/ (paperSize: A6, A4 sau A4_4xA6)."""
+        body = {
+            'userName': self.username,
+            'password': self.password,
+            'paperSize': paper_size,
+            'parcels': [{'parcel': {'id': awb}}],
         }
         try:
-            async with httpx.AsyncClient() as client:
-                r = await client.post(f'{self.api_url}/track/', json=body, timeout=15.0)
-                
-                if r.status_code != 200:
-                    logging.error(f"DPD HTTP Error for AWB {awb}: {r.status_code} - {r.text}")
-                    return TrackingStatus(raw_status=f"Eroare HTTP DPD: {r.status_code}")
-                
-                data = (r.json() or {}).get('parcels', [{}])[0]
-                operations = data.get('operations', [])
-                
-                if not operations:
-                    return TrackingStatus(raw_status="AWB negăsit sau fără istoric DPD")
-
-                last_op = operations[-1]
-                raw_status = (last_op.get('description') or 'N/A').strip()
-                return TrackingStatus(raw_status=raw_status)
-
-        except Exception as e:
-            logging.error(f"General error tracking DPD AWB {awb}: {e}")
-            return TrackingStatus(raw_status="Eroare generală la tracking DPD")
\ No newline at end of file
+            r = await self._request('POST', f'{self.api_url}/print/', json=body)
+        except CourierTransportError as e:
+            return LabelResponse(success=False, error_message=str(e))
+
+        if r.status_code == 200 and r.content.startswith(b'%PDF'):
+            return LabelResponse(success=True, content=r.content)
+        # DPD răspunde cu JSON {"error": {...}} când eticheta nu poate fi generată
+        try:
+            error = (r.json() or {}).get('error') or {}
+            message = error.get('message') or f"HTTP {r.status_code}"
+        except ValueError:
+            message = f"HTTP {r.status_code}"
+        return LabelResponse(success=False, error_message=f"DPD: {message}")
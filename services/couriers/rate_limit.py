@@ -0,0 +1,93 @@
+# services/couriers/rate_limit.py
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from settings import settings
+
+
+class TokenBucketLimiter:
+    """
+    Limitator asincron "token bucket" cu concurență maximă.
+    Folosit ca `async with limiter:` în jurul fiecărei cereri HTTP către curier:
+    așteaptă un loc liber (cel mult `max_concurrency` cereri în paralel) și un token
+    (în medie `rate` cereri pe secundă, cu rafale de până la `burst`).
+    """
+
+    def __init__(self, rate: float, burst: int, max_concurrency: int):
+        self.rate = rate
+        self.burst = max(1, int(burst))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def acquire(self):
+        """Așteaptă un token. Cererile sunt servite în ordinea sosirii."""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        try:
+            await self.acquire()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+
+
+def _limit_config(courier_type: Optional[str], credentials: Optional[Dict[str, Any]]) -> Tuple[float, int, int]:
+    """(rate, burst, max_concurrency): credențialele contului au prioritate față de COURIER_RATE_LIMITS."""
+    limits = settings.COURIER_RATE_LIMITS
+    defaults = limits.get((courier_type or '').lower(), limits.get('default', {}))
+    credentials = credentials or {}
+    return (
+        float(credentials.get('rate_limit_per_second', defaults.get('rate', 5.0))),
+        int(credentials.get('rate_limit_burst', defaults.get('burst', 5))),
+        int(credentials.get('max_concurrency', defaults.get('concurrency', 4))),
+    )
+
+
+_limiters: Dict[str, Tuple[Tuple[float, int, int], TokenBucketLimiter]] = {}
+
+
+def get_rate_limiter(account_key: str, courier_type: Optional[str] = None, credentials: Optional[Dict[str, Any]] = None) -> TokenBucketLimiter:
+    """
+    Returnează limitatorul contului `account_key` (unul per cont, partajat de tracking,
+    autentificare și etichete). Fără `credentials` se refolosește limitatorul existent;
+    cu `credentials` modificate, limitatorul este recreat cu noii parametri.
+    """
+    existing = _limiters.get(account_key)
+    if existing and credentials is None:
+        return existing[1]
+
+    config = _limit_config(courier_type, credentials)
+    if existing and existing[0] == config:
+        return existing[1]
+
+    rate, burst, max_concurrency = config
+    logging.info(f"Rate limit pentru contul {account_key}: {rate}/s, rafală {burst}, {max_concurrency} cereri în paralel.")
+    limiter = TokenBucketLimiter(rate, burst, max_concurrency)
+    _limiters[account_key] = (config, limiter)
+    return limiter
+
+
+def drop_rate_limiter(account_key: str):
+    """Renunță la limitatorul contului; următorul `get_rate_limiter` îl recreează din credențialele curente."""
+    _limiters.pop(account_key, None)
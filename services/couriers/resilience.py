@@ -0,0 +1,112 @@
+# services/couriers/resilience.py
+
+import logging
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from settings import settings
+
+
+class CourierTransportError(Exception):
+    """
+    Cererea către curier nu a primit un răspuns util (timeout, eroare de rețea, 5xx,
+    autentificare eșuată etc.). Nu este un status de livrare și nu se salvează pe Shipment.
+    """
+
+
+class CircuitOpenError(CourierTransportError):
+    """Circuitul contului este deschis: cererea este refuzată imediat, fără apel HTTP."""
+
+
+# Momentul (time.monotonic) până la care rularea curentă de tracking are voie să trimită cereri
+_run_deadline: ContextVar[Optional[float]] = ContextVar('courier_run_deadline', default=None)
+
+
+def set_run_deadline(seconds: Optional[float]):
+    """Setează deadline-ul pentru task-urile pornite din contextul curent; returnează token-ul pentru reset."""
+    return _run_deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def reset_run_deadline(token):
+    _run_deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Secundele rămase până la deadline-ul rulării (None dacă nu există deadline)."""
+    deadline = _run_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per cont de curier.
+    - închis: cererile trec; după `failure_threshold` eșecuri consecutive se deschide;
+    - deschis: cererile sunt refuzate imediat timp de `reset_timeout` secunde;
+    - semi-deschis: o singură cerere de probă; succesul închide circuitul, eșecul îl redeschide.
+    """
+
+    def __init__(self, account_key: str, failure_threshold: int, reset_timeout: float):
+        self.account_key = account_key
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        """Adevărat cât timp cererile sunt refuzate (pauza nu a expirat sau proba este în curs)."""
+        if self._opened_at is None:
+            return False
+        return self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_timeout
+
+    @property
+    def half_open(self) -> bool:
+        """Adevărat cât timp cererea de probă (permisă de `allow`) nu și-a raportat rezultatul."""
+        return self._opened_at is not None and self._trial_in_flight
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def release_trial(self):
+        """
+        Eliberează proba fără rezultat (deadline, anulare, eroare neașteptată): circuitul rămâne
+        deschis, iar următoarea cerere poate fi o nouă probă. Fără efect dacă rezultatul a fost raportat.
+        """
+        self._trial_in_flight = False
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logging.warning(f"Circuit închis din nou pentru contul de curier {self.account_key}.")
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._trial_in_flight or (self._opened_at is None and self._failures >= self.failure_threshold):
+            logging.warning(f"Circuit deschis pentru contul de curier {self.account_key} după {self._failures} eșecuri; pauză {self.reset_timeout:.0f}s.")
+            self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(account_key: str) -> CircuitBreaker:
+    breaker = _breakers.get(account_key)
+    if breaker is None:
+        breaker = CircuitBreaker(account_key, settings.COURIER_BREAKER_FAILURE_THRESHOLD, settings.COURIER_BREAKER_RESET_SECONDS)
+        _breakers[account_key] = breaker
+    return breaker
+
+
+def drop_circuit_breaker(account_key: str):
+    """Renunță la circuitul contului (ex. credențiale modificate): următoarea cerere pornește cu circuitul închis."""
+    _breakers.pop(account_key, None)
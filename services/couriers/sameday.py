@@ -1,47 +1,40 @@
 # gbeschea/awb-hub/AWB-Hub-4f368a2a96d8f5e58ab53450be45f32021473f5a/services/couriers/sameday.py
 
-import httpx
 import logging
-import asyncio
-import time
-from typing import Optional
+from typing import Optional, Tuple
 from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 
-from .common import BaseCourierService, TrackingStatus
+from .common import BaseCourierService, TrackingStatus, CourierTransportError, LabelResponse
+from .token_store import token_store
 
-# --- RATE LIMITER GLOBAL PENTRU SAMEDAY ---
-# Aceste variabile sunt partajate pentru a limita viteza tuturor cererilor către Sameday
-_last_request_time: float = 0.0
-_rate_limit_interval: float = 0.5  # Așteaptă cel puțin 0.5 secunde între cereri
-_rate_limit_lock = asyncio.Lock()
 
-async def _apply_sameday_rate_limit():
-    """Așteaptă dacă este necesar pentru a respecta limita de request-uri."""
-    async with _rate_limit_lock:
-        now = time.monotonic()
-        elapsed = now - _last_request_time
-        if elapsed < _rate_limit_interval:
-            await asyncio.sleep(_rate_limit_interval - elapsed)
-        # Actualizăm timpul ultimei cereri DUPĂ ce am așteptat
-        globals()['_last_request_time'] = time.monotonic()
+# Datele Sameday fără offset (ex. "2026-10-17 16:37") sunt în ora României
+SAMEDAY_TZ = ZoneInfo("Europe/Bucharest")
 
 
 def _parse_sameday_date(date_str: Optional[str]) -> Optional[datetime]:
+    """Data Sameday ca datetime cu fus orar; valorile fără offset sunt interpretate în SAMEDAY_TZ."""
     if not date_str: return None
     try:
-        return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+        parsed = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
     except (ValueError, TypeError):
         try:
-            return datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+            parsed = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
         except (ValueError, TypeError):
             return None
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=SAMEDAY_TZ)
+
+
+def _token_expiry(expire_at: Optional[str]) -> datetime:
+    """Expirarea token-ului din `expire_at`, limitată la o oră de acum (valoarea Sameday nu e mereu de încredere)."""
+    default_expiry = datetime.now(timezone.utc) + timedelta(minutes=60)
+    return min(_parse_sameday_date(expire_at) or default_expiry, default_expiry)
 
 class SamedayCourierService(BaseCourierService):
     """Sameday AWB Tracking Service with authentication and rate limiting."""
 
-    _token: Optional[str] = None
-    _token_expiry: datetime = datetime.min.replace(tzinfo=timezone.utc)
-    _token_lock = asyncio.Lock()
+    courier_type = 'sameday'
 
     def __init__(self, account_key: str, settings: dict):
         super().__init__(account_key, settings)
@@ -53,59 +46,67 @@ class SamedayCourierService(BaseCourierService):
         if not self.username or not self.password:
             raise ValueError(f"Username and password are required for Sameday account key: {account_key}.")
 
-    async def _get_token(self) -> Optional[str]:
-        async with self._token_lock:
-            if self._token and datetime.now(timezone.utc) < self._token_expiry:
-                return self._token
-
-            logging.info(f"Se solicită un token nou de la Sameday pentru user: {self.username}")
-            try:
-                await _apply_sameday_rate_limit() # Aplicăm limitare și la autentificare
-                headers = {'X-Auth-Username': self.username, 'X-Auth-Password': self.password}
-                async with httpx.AsyncClient() as client:
-                    url = f"{self.api_url}/api/authenticate"
-                    response = await client.post(url, headers=headers)
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    self._token = data.get("token")
-                    self._token_expiry = datetime.now(timezone.utc) + timedelta(minutes=55)
-                    
-                    logging.info(f"Token Sameday obținut cu succes pentru user: {self.username}")
-                    return self._token
-            except Exception as e:
-                logging.error(f"Autentificare Sameday eșuată pentru user '{self.username}': {e}")
-                self._token = None
-                return None
+    async def _authenticate(self) -> Tuple[str, datetime]:
+        """Cere un token nou; ridică CourierTransportError dacă autentificarea eșuează."""
+        logging.info(f"Se solicită un token nou de la Sameday pentru user: {self.username}")
+        headers = {'X-Auth-Username': self.username, 'X-Auth-Password': self.password}
+        url = f"{self.api_url}/api/authenticate"
+        # Autentificarea consumă din același buget ca restul cererilor contului
+        response = await self._request('POST', url, headers=headers)
+        data = response.json() if response.status_code == 200 else {}
+        token = data.get("token")
+        if not token:
+            logging.error(f"Autentificare Sameday eșuată pentru user '{self.username}': HTTP {response.status_code}")
+            raise CourierTransportError(f"Autentificare Sameday eșuată ({self.account_key})")
+
+        expires_at = _token_expiry(data.get("expire_at"))
+        logging.info(f"Token Sameday obținut cu succes pentru user: {self.username}")
+        return token, expires_at
+
+    async def _get_token(self) -> str:
+        """Token-ul contului din `token_store` (per cont, reînnoit înainte de expirare)."""
+        return await token_store.get(self.account_key, self._authenticate)
 
     async def track(self, awb: str) -> Optional[TrackingStatus]:
+        """Ridică CourierTransportError la erori de autentificare sau comunicare (nu se salvează ca status)."""
         token = await self._get_token()
-        if not token:
-            return TrackingStatus(raw_status="Eroare Autentificare Sameday")
-
         headers = {"X-Auth-Token": token}
-        
+
+        url = f"{self.api_url}/api/client/awb/{awb}/status"
+        track_response = await self._request('GET', url, headers=headers)
+
+        if track_response.status_code == 404:
+            return TrackingStatus(raw_status="AWB inexistent (client)")
+        if track_response.status_code == 401:
+            # Token respins înainte de termen: la următoarea cerere se obține unul nou
+            await token_store.invalidate(self.account_key, token)
+        if track_response.status_code != 200:
+            raise CourierTransportError(f"Sameday HTTP {track_response.status_code} pentru AWB {awb}")
+
         try:
-            await _apply_sameday_rate_limit() # Aplicăm limitarea de viteză ÎNAINTE de cerere
+            data = track_response.json()
+
+            history = data.get("expeditionHistory", [])
+            if not history:
+                return TrackingStatus(raw_status="AWB generat, fără istoric")
+
+            latest_event = max(history, key=lambda event: _parse_sameday_date(event.get('statusDate')) or datetime.min.replace(tzinfo=timezone.utc))
+            raw_status = latest_event.get('statusLabel', "Status necunoscut")
             
-            url = f"{self.api_url}/api/client/awb/{awb}/status"
-            async with httpx.AsyncClient() as client:
-                track_response = await client.get(url, headers=headers)
-                
-                if track_response.status_code == 404:
-                    return TrackingStatus(raw_status="AWB inexistent (client)")
-                
-                track_response.raise_for_status()
-                data = track_response.json()
-
-                history = data.get("expeditionHistory", [])
-                if not history:
-                    return TrackingStatus(raw_status="AWB generat, fără istoric")
-
-                latest_event = max(history, key=lambda event: _parse_sameday_date(event.get('statusDate')) or datetime.min.replace(tzinfo=timezone.utc))
-                raw_status = latest_event.get('statusLabel', "Status necunoscut")
-                
-                return TrackingStatus(raw_status=raw_status)
-        except Exception as e:
-            logging.error(f"Eroare generală la tracking Sameday AWB {awb}: {e}")
-            return TrackingStatus(raw_status="Eroare generală tracking")
\ No newline at end of file
+            return TrackingStatus(raw_status=raw_status)
+        except (ValueError, AttributeError) as e:
+            raise CourierTransportError(f"Răspuns Sameday invalid pentru AWB {awb}: {e}")
+
+    async def get_label(self, awb: str, paper_size: str = 'A6') -> LabelResponse:
+        """Eticheta PDF prin /api/awb/download/{awb}/{format} (A6 sau A4)."""
+        try:
+            token = await self._get_token()
+            r = await self._request('GET', f"{self.api_url}/api/awb/download/{awb}/{paper_size}", headers={"X-Auth-Token": token})
+        except CourierTransportError as e:
+            return LabelResponse(success=False, error_message=str(e))
+
+        if r.status_code == 401:
+            await token_store.invalidate(self.account_key, token)
+        if r.status_code == 200 and r.content.startswith(b'%PDF'):
+            return LabelResponse(success=True, content=r.content)
+        return LabelResponse(success=False, error_message=f"Sameday: HTTP {r.status_code}")
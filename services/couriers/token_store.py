@@ -0,0 +1,139 @@
+# services/couriers/token_store.py
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+import models
+from database import AsyncSessionLocal
+from settings import settings
+
+# Funcția de autentificare a curierului: returnează (token, expiră_la)
+TokenFetcher = Callable[[], Awaitable[Tuple[str, datetime]]]
+
+
+class _TokenEntry:
+    def __init__(self):
+        self.token: Optional[str] = None
+        self.expires_at: datetime = datetime.min.replace(tzinfo=timezone.utc)
+        self.lock = asyncio.Lock()
+        self.refresh_task: Optional[asyncio.Task] = None
+
+    def valid(self, now: datetime) -> bool:
+        return bool(self.token) and now < self.expires_at
+
+
+class CourierTokenStore:
+    """
+    Token-uri de autentificare per cont de curier.
+    - fiecare cont are propriul slot și propriul lock (conturile nu se blochează reciproc);
+    - cu COURIER_TOKEN_PERSIST, token-urile sunt salvate în `courier_tokens`, deci worker-ii
+      uvicorn și sincronizarea din fundal refolosesc același token în loc să se autentifice din nou;
+    - cu mai puțin de COURIER_TOKEN_REFRESH_MARGIN_SECONDS până la expirare, token-ul curent
+      este returnat în continuare, iar reînnoirea pornește în fundal.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _TokenEntry] = {}
+
+    def _entry(self, account_key: str) -> _TokenEntry:
+        entry = self._entries.get(account_key)
+        if entry is None:
+            entry = self._entries[account_key] = _TokenEntry()
+        return entry
+
+    async def get(self, account_key: str, fetch: TokenFetcher) -> str:
+        entry = self._entry(account_key)
+        now = datetime.now(timezone.utc)
+        if not entry.valid(now):
+            async with entry.lock:
+                if not entry.valid(datetime.now(timezone.utc)):
+                    await self._load_or_fetch(account_key, entry, fetch)
+        elif entry.expires_at - now < timedelta(seconds=settings.COURIER_TOKEN_REFRESH_MARGIN_SECONDS):
+            if entry.refresh_task is None or entry.refresh_task.done():
+                entry.refresh_task = asyncio.create_task(self._refresh(account_key, entry, fetch))
+        return entry.token
+
+    async def invalidate(self, account_key: str, token: Optional[str]):
+        """Renunță la `token` (ex. respins cu 401). Un token deja înlocuit nu este atins."""
+        entry = self._entry(account_key)
+        if token is None or entry.token == token:
+            entry.token = None
+        if settings.COURIER_TOKEN_PERSIST and token:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(delete(models.CourierToken).where(
+                        models.CourierToken.account_key == account_key,
+                        models.CourierToken.token == token,
+                    ))
+                    await db.commit()
+            except Exception as e:
+                logging.error(f"Nu s-a putut șterge token-ul salvat pentru contul {account_key}: {e}")
+
+    async def forget(self, account_key: str):
+        """Renunță la orice token al contului, din memorie și din baza de date (ex. credențiale modificate)."""
+        self._entries.pop(account_key, None)
+        if not settings.COURIER_TOKEN_PERSIST:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(models.CourierToken).where(models.CourierToken.account_key == account_key))
+                await db.commit()
+        except Exception as e:
+            logging.error(f"Nu s-a putut șterge token-ul salvat pentru contul {account_key}: {e}")
+
+    async def _load_or_fetch(self, account_key: str, entry: _TokenEntry, fetch: TokenFetcher):
+        """Apelat sub `entry.lock`: token-ul salvat de alt proces, altfel autentificare nouă."""
+        stored = await self._load(account_key)
+        if stored and stored[1] - datetime.now(timezone.utc) > timedelta(seconds=settings.COURIER_TOKEN_REFRESH_MARGIN_SECONDS):
+            entry.token, entry.expires_at = stored
+            logging.info(f"Token refolosit din baza de date pentru contul {account_key}.")
+            return
+        entry.token, entry.expires_at = await fetch()
+        await self._save(account_key, entry.token, entry.expires_at)
+
+    async def _refresh(self, account_key: str, entry: _TokenEntry, fetch: TokenFetcher):
+        try:
+            async with entry.lock:
+                # Alt worker poate să fi reînnoit deja token-ul: îl preluăm din baza de date
+                await self._load_or_fetch(account_key, entry, fetch)
+            logging.info(f"Token reînnoit în fundal pentru contul {account_key} (expiră la {entry.expires_at:%H:%M:%S}).")
+        except Exception as e:
+            # Token-ul curent rămâne valabil până la expirare; următoarea cerere reîncearcă
+            logging.warning(f"Reînnoirea token-ului pentru contul {account_key} a eșuat: {e}")
+
+    async def _load(self, account_key: str) -> Optional[Tuple[str, datetime]]:
+        if not settings.COURIER_TOKEN_PERSIST:
+            return None
+        try:
+            async with AsyncSessionLocal() as db:
+                row = (await db.execute(
+                    select(models.CourierToken.token, models.CourierToken.expires_at)
+                    .where(models.CourierToken.account_key == account_key)
+                )).first()
+            return (row.token, row.expires_at) if row else None
+        except Exception as e:
+            logging.error(f"Nu s-a putut citi token-ul salvat pentru contul {account_key}: {e}")
+            return None
+
+    async def _save(self, account_key: str, token: str, expires_at: datetime):
+        if not settings.COURIER_TOKEN_PERSIST:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                stmt = insert(models.CourierToken).values(account_key=account_key, token=token, expires_at=expires_at)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[models.CourierToken.account_key],
+                    set_={'token': stmt.excluded.token, 'expires_at': stmt.excluded.expires_at, 'updated_at': datetime.now(timezone.utc)},
+                )
+                await db.execute(stmt)
+                await db.commit()
+        except Exception as e:
+            logging.error(f"Nu s-a putut salva token-ul pentru contul {account_key}: {e}")
+
+
+token_store = CourierTokenStore()
@@ -0,0 +1,122 @@
+# services/derived_status_service.py
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import String, and_, case, column, distinct, func, literal, or_, select, update, values
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from .status_classifier import status_classifier
+
+# Grupurile care înseamnă că AWB-ul a plecat din depozit (anularea devine refuz)
+LEFT_WAREHOUSE_GROUPS = ('shipped', 'in_transit', 'pickup_office', 'delivery_issues', 'delivered', 'refused')
+HOLD_TAGS = ('on-hold', 'hold')
+
+
+async def _status_group_values(db: AsyncSession, order_ids: Optional[list] = None):
+    """
+    Tabel VALUES (raw, grp) pentru statusurile distincte din `shipments`, clasificate
+    de `status_classifier` (aceleași reguli ca în Python: exact, normalizat, prefix, regex).
+    """
+    query = select(distinct(func.lower(func.btrim(models.Shipment.last_status)))).where(models.Shipment.last_status.isnot(None))
+    if order_ids is not None:
+        query = query.where(models.Shipment.order_id.in_(order_ids))
+    raw_statuses = (await db.execute(query)).scalars().all()
+    rows = [(raw, status_classifier.classify(raw, record_unmapped=False)) for raw in raw_statuses]
+    rows = [(raw, group) for raw, group in rows if group]
+    if not rows:
+        return None
+    return values(column('raw', String), column('grp', String), name='status_groups').data(rows)
+
+
+def _derived_status_select(status_groups, now: datetime, order_ids: Optional[list] = None):
+    """
+    SELECT (id, processing_status, derived_status) pentru comenzi (toate sau doar `order_ids`),
+    cu aceeași logică ca `utils.calculate_and_set_derived_status`, pe ultimul AWB al fiecărei comenzi.
+    """
+    o = models.Order.__table__
+    s = models.Shipment.__table__
+    latest = (
+        select(s.c.order_id, s.c.awb, s.c.last_status)
+        .distinct(s.c.order_id)
+        .order_by(s.c.order_id, s.c.fulfillment_created_at.desc().nulls_last(), s.c.id.desc())
+    )
+    if order_ids is not None:
+        latest = latest.where(s.c.order_id.in_(order_ids))
+    latest = latest.subquery('latest_shipment')
+    joined = o.outerjoin(latest, latest.c.order_id == o.c.id)
+    if status_groups is not None:
+        joined = joined.outerjoin(status_groups, status_groups.c.raw == func.lower(func.btrim(latest.c.last_status)))
+        group = status_groups.c.grp
+    else:
+        group = literal(None, String)
+
+    tags = func.regexp_split_to_array(func.lower(func.btrim(func.coalesce(o.c.tags, ''))), r'\s*,\s*')
+    has_hold_tag = tags.op('&&')(array(HOLD_TAGS))
+    no_awb = or_(latest.c.order_id.is_(None), func.coalesce(latest.c.awb, '') == '')
+    raw_status = func.btrim(func.coalesce(latest.c.last_status, 'AWB Generat'))
+
+    processing_status = case(
+        (has_hold_tag, "On Hold"),
+        (o.c.address_status == 'invalid', "Adresă Invalidă"),
+        (o.c.address_status == 'nevalidat', "Așteaptă Validare"),
+        (no_awb, "Neprocesată"),
+        else_="Procesată",
+    )
+    derived_status = case(
+        (and_(or_(o.c.cancelled_at.isnot(None), group == 'canceled'), group.in_(LEFT_WAREHOUSE_GROUPS)), "❌ Refuzată"),
+        (or_(o.c.cancelled_at.isnot(None), group == 'canceled'), "❌ Anulată"),
+        (or_(o.c.is_on_hold_shopify, has_hold_tag), "🚦 On Hold"),
+        (no_awb, "📦 Neprocesată"),
+        (group == 'delivered', "✅ Livrată"),
+        (group == 'refused', "❌ Refuzată"),
+        (and_(group == 'processed', o.c.fulfilled_at < now - timedelta(days=3)), "⏰ Netrimisă (Alertă)"),
+        (group == 'processed', "✈️ Procesată"),
+        (group == 'shipped', "🚚 Expediată"),
+        (group.in_(('in_transit', 'pickup_office', 'delivery_issues')), "🚚 În curs de livrare"),
+        (raw_status != 'AWB Generat', literal("❔ ") + raw_status),
+        else_="✈️ Procesată",
+    )
+    computed = select(
+        o.c.id.label('order_id'),
+        processing_status.label('processing_status'),
+        derived_status.label('derived_status'),
+    ).select_from(joined)
+    if order_ids is not None:
+        computed = computed.where(o.c.id.in_(order_ids))
+    return computed.subquery('computed')
+
+
+async def recompute_derived_statuses(db: AsyncSession, order_ids: Optional[Iterable[int]] = None, commit: bool = True) -> int:
+    """
+    Recalculează `processing_status` și `derived_status` pentru toate comenzile (sau doar
+    pentru `order_ids`) printr-un singur UPDATE ... FROM, fără a încărca comenzile în ORM.
+    Sunt scrise doar rândurile care se schimbă; returnează numărul lor.
+    """
+    start_ts = datetime.now(timezone.utc)
+    order_ids = list(order_ids) if order_ids is not None else None
+    computed = _derived_status_select(await _status_group_values(db, order_ids), start_ts, order_ids)
+    stmt = (
+        update(models.Order)
+        .where(models.Order.id == computed.c.order_id)
+        .where(or_(
+            models.Order.derived_status.is_distinct_from(computed.c.derived_status),
+            models.Order.processing_status.is_distinct_from(computed.c.processing_status),
+        ))
+        # `updated_at` rămâne neatins: recalcularea nu este o modificare a comenzii
+        .values(
+            derived_status=computed.c.derived_status,
+            processing_status=computed.c.processing_status,
+            updated_at=models.Order.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    if commit:
+        await db.commit()
+    if order_ids is None:
+        logging.warning(f"Status derivat recalculat în {(datetime.now(timezone.utc) - start_ts).total_seconds():.1f}s: {result.rowcount} comenzi modificate.")
+    return result.rowcount
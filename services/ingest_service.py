@@ -0,0 +1,246 @@
+# services/ingest_service.py
+"""
+Etapa de ingestie "set-based" pentru sincronizarea comenzilor.
+
+O pagină de comenzi Shopify este scrisă în câteva instrucțiuni SQL, indiferent
+de numărul de comenzi din pagină:
+
+    0. SELECT payload_hash pentru comenzile din pagină (cele neschimbate sunt sărite)
+    1. INSERT ... ON CONFLICT DO UPDATE pentru orders (RETURNING id)
+    2. line_items, fulfillment_orders și shipments prin `reconcile_service`:
+       câte un SELECT, plus INSERT / UPDATE / DELETE bulk doar dacă există diferențe
+
+Vechiul flux făcea per comandă: 1 SELECT cu joinedload('*'), 1 flush la comenzile noi,
+1 SELECT + 1 DELETE per fulfillment order și 2 SELECT-uri per fulfillment
+(mapare curier + căutare shipment) - adică ~6-10 round trip-uri per comandă.
+Acum sunt 5 round trip-uri per pagină (50 de comenzi) când copiii nu s-au schimbat și
+cel mult 13 în cel mai rău caz, adică ~0.1-0.26 per comandă (doar 1 dacă nicio comandă
+nu s-a schimbat);
+maparea curierilor vine din `courier_mapping_cache` și nu mai costă un query.
+"""
+
+import hashlib
+import json
+import logging
+from typing import List, Dict, Any, Iterable, Tuple, Optional, NamedTuple
+
+from sqlalchemy import select, func, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from .utils import _dt, map_payment_method, _get_mapped_address, shopify_legacy_id
+from .courier_mapping_cache import courier_mapping_cache
+from . import reconcile_service
+
+
+def build_order_values(store_rec: models.Store, o: Dict[str, Any]) -> Dict[str, Any]:
+    """Transformă un nod `Order` din GraphQL în valorile coloanelor din tabela `orders`."""
+    shipping_address = _get_mapped_address(o, store_rec.pii_source)
+    if not shipping_address:
+        logging.warning(f"Nu s-au găsit date PII pentru comanda {o.get('name')} din sursa '{store_rec.pii_source}'")
+
+    gateways = o.get('paymentGatewayNames', [])
+    financial_status = o.get('displayFinancialStatus', 'unknown')
+    total_price_str = (o.get('totalPriceSet') or {}).get('shopMoney', {}).get('amount', '0.0')
+
+    status_from_shopify = (o.get('displayFulfillmentStatus') or 'unfulfilled').strip().lower()
+    if status_from_shopify == 'success':
+        status_from_shopify = 'fulfilled'
+
+    fulfillment_orders = (o.get('fulfillmentOrders') or {}).get('edges', [])
+    has_active_hold = any(ff_edge.get('node', {}).get('fulfillmentHolds') for ff_edge in fulfillment_orders)
+
+    return {
+        'store_id': store_rec.id,
+        'shopify_order_id': o['id'],
+        'name': o.get('name'),
+        'customer': shipping_address.get('name') or 'N/A',
+        'created_at': _dt(o.get('createdAt')),
+        'cancelled_at': _dt(o.get('cancelledAt')),
+        'is_on_hold_shopify': has_active_hold,
+        'financial_status': financial_status,
+        'total_price': float(total_price_str) if total_price_str else 0.0,
+        'payment_gateway_names': ", ".join(gateways),
+        'mapped_payment': map_payment_method(gateways, financial_status),
+        'tags': ",".join(o.get('tags', [])),
+        'note': o.get('note', ''),
+        'shopify_status': status_from_shopify,
+        'shipping_name': shipping_address.get('name'),
+        'shipping_address1': shipping_address.get('address1'),
+        'shipping_address2': shipping_address.get('address2'),
+        'shipping_phone': shipping_address.get('phone'),
+        'shipping_city': shipping_address.get('city'),
+        'shipping_zip': shipping_address.get('zip'),
+        'shipping_province': shipping_address.get('province'),
+        'shipping_country': shipping_address.get('country'),
+    }
+
+
+async def _resolve_courier_accounts(db: AsyncSession, companies: List[str]) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """Mapează toate numele de curier din pagină (cheie: nume lowercase), din cache."""
+    resolved = await courier_mapping_cache.resolve_many(db, companies)
+    for name in {(c or '').strip().lower() for c in companies} - resolved.keys() - {''}:
+        logging.warning(f"Nu s-a găsit nicio mapare exactă și activă pentru curierul: '{name}'")
+    return resolved
+
+
+class IngestResult(NamedTuple):
+    """Rezultatul ingestiei unei pagini."""
+    order_ids: List[int]  # comenzile scrise (noi sau modificate)
+    skipped: int          # comenzile sărite pentru că payload-ul nu s-a schimbat
+
+
+# Câmpuri care se schimbă fără ca datele folosite de noi să se schimbe
+_FINGERPRINT_IGNORED_KEYS = {'updatedAt', 'pageInfo'}
+
+
+def _strip_volatile(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _strip_volatile(v) for k, v in value.items() if k not in _FINGERPRINT_IGNORED_KEYS}
+    if isinstance(value, list):
+        return [_strip_volatile(v) for v in value]
+    return value
+
+
+def _tracking_companies(o: Dict[str, Any]) -> List[str]:
+    """Numele de curier (lowercase) ale fulfillment-urilor cu tracking ale comenzii."""
+    return [
+        ((f.get('trackingInfo') or [{}])[0].get('company') or '').strip().lower()
+        for f in o.get('fulfillments') or [] if f.get('trackingInfo')
+    ]
+
+
+def payload_fingerprint(o: Dict[str, Any], pii_source: str, courier_accounts: Optional[List[Tuple[str, Optional[str]]]] = None) -> str:
+    """
+    Hash SHA-256 stabil al payload-ului Shopify relevant pentru o comandă, plus starea locală
+    din care derivă rândurile: `pii_source` și contul de curier rezolvat pentru fiecare
+    fulfillment. O mapare de curier adăugată sau modificată schimbă deci amprenta.
+    """
+    canonical = json.dumps([pii_source, courier_accounts or [], _strip_volatile(o)], sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+async def invalidate_courier_fingerprints(db: AsyncSession, account_keys: Iterable[str] = ()):
+    """
+    Șterge `payload_hash` pentru comenzile cu AWB-uri fără cont de curier (sau pe `account_keys`),
+    ca următoarea sincronizare care le preia să le rescrie cu maparea curentă. Apelată de
+    `crud.couriers` la modificarea mapărilor / conturilor. Nu face commit.
+    """
+    account_keys = [k for k in account_keys if k]
+    account_filter = models.Shipment.account_key.is_(None)
+    if account_keys:
+        account_filter = or_(account_filter, models.Shipment.account_key.in_(account_keys))
+    await db.execute(
+        update(models.Order)
+        .where(models.Order.payload_hash.isnot(None), models.Order.id.in_(select(models.Shipment.order_id).where(account_filter)))
+        .values(payload_hash=None, updated_at=models.Order.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def ingest_orders_page(db: AsyncSession, store_rec: models.Store, orders: List[Dict[str, Any]]) -> IngestResult:
+    """
+    Scrie o pagină de comenzi Shopify (cu line items, fulfillment orders și shipments)
+    folosind instrucțiuni bulk; copiii sunt reconciliați după ID-ul Shopify. Comenzile al căror `payload_hash` coincide cu cel salvat
+    sunt sărite complet (fără scriere, fără reconcilierea copiilor).
+    Nu face commit.
+    """
+    if not orders:
+        return IngestResult([], 0)
+
+    # --- 0. Amprentele: sărim comenzile neschimbate de la ultima sincronizare ---
+    # Conturile de curier rezolvate intră în amprentă: un AWB rămas fără cont este rescris după adăugarea mapării
+    couriers = await _resolve_courier_accounts(db, [c for o in orders for c in _tracking_companies(o)])
+    fingerprints = {
+        o['id']: payload_fingerprint(o, store_rec.pii_source, [(c, couriers.get(c, (None, None))[1]) for c in _tracking_companies(o)])
+        for o in orders
+    }
+    stored_res = await db.execute(
+        select(models.Order.shopify_order_id, models.Order.payload_hash)
+        .where(models.Order.shopify_order_id.in_(list(fingerprints.keys())))
+    )
+    stored_hashes = dict(stored_res.all())
+    changed = [o for o in orders if stored_hashes.get(o['id']) != fingerprints[o['id']]]
+    skipped = len({o['id'] for o in orders}) - len({o['id'] for o in changed})
+    if not changed:
+        return IngestResult([], skipped)
+    orders = changed
+
+    # --- 1. Comenzile ---
+    order_rows = {o['id']: {**build_order_values(store_rec, o), 'payload_hash': fingerprints[o['id']]} for o in orders}
+    order_stmt = insert(models.Order).values(list(order_rows.values()))
+    update_cols = {col: order_stmt.excluded[col] for col in next(iter(order_rows.values())) if col != 'shopify_order_id'}
+    update_cols['updated_at'] = func.now()
+    order_stmt = order_stmt.on_conflict_do_update(
+        index_elements=[models.Order.shopify_order_id],
+        set_=update_cols,
+    ).returning(models.Order.id, models.Order.shopify_order_id)
+    order_ids = {sid: oid for oid, sid in (await db.execute(order_stmt)).all()}
+
+    # --- 2. Construim rândurile copil pentru toată pagina ---
+    line_item_rows: Dict[str, Dict[str, Any]] = {}
+    ff_order_rows: Dict[str, Dict[str, Any]] = {}
+    fulfillments: List[Tuple[int, Dict[str, Any], Dict[str, Any]]] = []
+
+    for o in orders:
+        order_id = order_ids.get(o['id'])
+        if order_id is None:
+            continue
+
+        for li_edge in (o.get('lineItems') or {}).get('edges', []):
+            li = li_edge.get('node') or {}
+            li_id = shopify_legacy_id(li.get('id'))
+            if not li_id:
+                continue
+            line_item_rows[li_id] = {
+                'order_id': order_id,
+                'shopify_line_item_id': li_id,
+                'sku': li.get('sku'),
+                'title': li.get('title'),
+                'quantity': li.get('quantity'),
+            }
+
+        for ff_edge in (o.get('fulfillmentOrders') or {}).get('edges', []):
+            ff_node = ff_edge.get('node') or {}
+            if not ff_node.get('id'):
+                continue
+            ff_order_rows[ff_node['id']] = {
+                'order_id': order_id,
+                'shopify_fulfillment_order_id': ff_node['id'],
+                'status': ff_node.get('status'),
+                'hold_details': ff_node.get('fulfillmentHolds'),
+            }
+
+        for f in o.get('fulfillments') or []:
+            tracking_info_list = f.get('trackingInfo') or []
+            if not tracking_info_list:
+                continue
+            fulfillments.append((order_id, f, tracking_info_list[0]))
+
+    page_order_ids = list(order_ids.values())
+
+    # --- 3. Line items și fulfillment orders: doar diferențele față de ce există ---
+    await reconcile_service.reconcile_children(db, reconcile_service.LINE_ITEMS, page_order_ids, list(line_item_rows.values()))
+    await reconcile_service.reconcile_children(db, reconcile_service.FULFILLMENT_ORDERS, page_order_ids, list(ff_order_rows.values()))
+
+    # --- 4. Shipments ---
+    shipment_rows: Dict[str, Dict[str, Any]] = {}
+    if fulfillments:
+        for order_id, f, tracking_info in fulfillments:
+            awb = str(tracking_info.get('number') or '').strip()
+            if not awb:
+                continue
+            _, account_key = couriers.get((tracking_info.get('company') or '').strip().lower(), (None, None))
+            shipment_rows[awb] = {
+                'order_id': order_id,
+                'awb': awb,
+                'courier': account_key,
+                'account_key': account_key,
+                # ID numeric, ca în webhook-uri (`notify_shopify_of_shipment` construiește GID-ul)
+                'shopify_fulfillment_id': shopify_legacy_id(f.get('id')),
+                'fulfillment_created_at': _dt(f.get('createdAt')),
+            }
+    await reconcile_service.reconcile_children(db, reconcile_service.SHIPMENTS, page_order_ids, list(shipment_rows.values()))
+
+    return IngestResult(page_order_ids, skipped)
@@ -0,0 +1,154 @@
+# services/label_cache.py
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from settings import settings
+
+
+class LabelCache:
+    """
+    Cache pe disc pentru etichetele PDF, cu cheia (account_key, awb, paper_size).
+    Fișierul este `<dir>/<hash[:2]>/<hash>.pdf`, unde hash = sha256 al cheii, deci
+    un AWB reprintat (Print Hub, descărcare individuală, reîncercări) nu mai cere
+    eticheta de la curier. Evacuare:
+    - după vârstă: intrările mai vechi de LABEL_CACHE_MAX_AGE_DAYS sunt ignorate și șterse;
+    - după mărime: peste LABEL_CACHE_MAX_MB se șterg cele mai vechi fișiere.
+    Operațiile pe disc rulează în thread-uri, ca să nu blocheze event loop-ul.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_age_seconds: float):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._size: Optional[int] = None
+        self._evict_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def _path(self, account_key: str, awb: str, paper_size: str) -> Path:
+        digest = hashlib.sha256(f"{account_key}\0{awb}\0{paper_size}".encode('utf-8')).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.pdf"
+
+    def _read(self, path: Path) -> Optional[bytes]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        if time.time() - stat.st_mtime > self.max_age_seconds:
+            self._remove(path, stat.st_size)
+            return None
+        try:
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def _write(self, path: Path, content: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(content)
+        # Redenumirea este atomică: cititorii văd fie fișierul vechi, fie pe cel complet
+        os.replace(tmp_path, path)
+
+    def _remove(self, path: Path, size: int):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return
+        self.evictions += 1
+        if self._size is not None:
+            self._size -= size
+
+    def _scan_size(self) -> int:
+        return sum(p.stat().st_size for p in self.directory.glob('*/*.pdf'))
+
+    def _evict(self):
+        """Șterge fișierele expirate, apoi cele mai vechi până sub LABEL_CACHE_MAX_MB."""
+        now = time.time()
+        files = []
+        for path in self.directory.glob('*/*.pdf'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                self._remove(path, stat.st_size)
+            else:
+                files.append((stat.st_mtime, stat.st_size, path))
+        self._size = sum(size for _, size, _ in files)
+        # Coborâm la 90% din limită, ca evacuarea să nu ruleze la fiecare scriere
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in sorted(files):
+            if self._size <= target:
+                break
+            self._remove(path, size)
+
+    async def get(self, account_key: str, awb: str, paper_size: str, record_stats: bool = True) -> Optional[bytes]:
+        """Eticheta din cache sau None. `record_stats=False` pentru citirile din fundal (prefetch), care nu intră în hit ratio."""
+        if not settings.LABEL_CACHE_ENABLED:
+            return None
+        content = await asyncio.to_thread(self._read, self._path(account_key, awb, paper_size))
+        if not record_stats:
+            return content
+        if content is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return content
+
+    def _fresh(self, path: Path, now: float) -> bool:
+        try:
+            return now - path.stat().st_mtime <= self.max_age_seconds
+        except FileNotFoundError:
+            return False
+
+    async def contains_many(self, keys: Iterable[Tuple[str, str, str]]) -> List[bool]:
+        """Pentru fiecare cheie (account_key, awb, paper_size): există o etichetă validă în cache? Nu numără hit-uri."""
+        if not settings.LABEL_CACHE_ENABLED:
+            return [False for _ in keys]
+        paths = [self._path(*key) for key in keys]
+        now = time.time()
+        return await asyncio.to_thread(lambda: [self._fresh(path, now) for path in paths])
+
+    async def put(self, account_key: str, awb: str, paper_size: str, content: bytes):
+        if not settings.LABEL_CACHE_ENABLED or not content.startswith(b'%PDF'):
+            return
+        try:
+            await asyncio.to_thread(self._write, self._path(account_key, awb, paper_size), content)
+        except OSError as e:
+            logging.error(f"Nu s-a putut salva eticheta AWB {awb} în cache: {e}")
+            return
+        self.writes += 1
+        if self._size is None:
+            self._size = await asyncio.to_thread(self._scan_size)
+        else:
+            self._size += len(content)
+        if self._size > self.max_bytes and not self._evict_lock.locked():
+            async with self._evict_lock:
+                await asyncio.to_thread(self._evict)
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "size_mb": round(self._size / 1024 / 1024, 1) if self._size is not None else None,
+            "max_mb": round(self.max_bytes / 1024 / 1024, 1),
+        }
+
+
+label_cache = LabelCache(
+    settings.LABEL_CACHE_DIR,
+    max_bytes=settings.LABEL_CACHE_MAX_MB * 1024 * 1024,
+    max_age_seconds=settings.LABEL_CACHE_MAX_AGE_DAYS * 86400,
+)
@@ -0,0 +1,91 @@
+# services/label_prefetcher.py
+
+import logging
+import time
+from typing import Dict, Iterable, NamedTuple, Tuple
+
+import models
+from database import AsyncSessionLocal
+from settings import settings
+from . import label_service
+from .label_cache import label_cache
+from .print_service import printable_shipments_select
+
+
+def _cache_key(account_key: str, awb: str) -> Tuple[str, str, str]:
+    # Print Hub cere etichetele în formatul implicit, deci prefetch-ul folosește aceeași cheie
+    return (account_key, awb, label_service.DEFAULT_PAPER_SIZE)
+
+
+class _FailedLabel(NamedTuple):
+    retry_at: float
+    failures: int
+
+
+# Cache negativ: (account_key, awb) -> când poate fi reîncercată eticheta. Intervalul se dublează
+# la fiecare eșec (de la LABEL_PREFETCH_RETRY_MINUTES până la LABEL_PREFETCH_MAX_RETRY_HOURS),
+# ca AWB-urile care eșuează mereu (anulate, cont greșit) să nu consume bugetul fiecărei rulări.
+_failed_labels: Dict[Tuple[str, str], _FailedLabel] = {}
+
+
+def _record_failure(key: Tuple[str, str], now: float):
+    failures = _failed_labels[key].failures + 1 if key in _failed_labels else 1
+    delay = min(settings.LABEL_PREFETCH_RETRY_MINUTES * 60 * 2 ** (failures - 1), settings.LABEL_PREFETCH_MAX_RETRY_HOURS * 3600)
+    _failed_labels[key] = _FailedLabel(now + delay, failures)
+
+
+def _is_backed_off(key: Tuple[str, str], now: float) -> bool:
+    entry = _failed_labels.get(key)
+    return entry is not None and entry.retry_at > now
+
+
+async def prefetch_unprinted_labels() -> int:
+    """
+    Descarcă în `label_cache` etichetele AWB-urilor neprintate (aceeași selecție ca Print Hub)
+    care lipsesc din cache, cele mai noi întâi, cel mult LABEL_PREFETCH_MAX_PER_RUN pe rulare.
+    Cererile trec prin limitatorul fiecărui cont și sunt trimise în bucăți de
+    LABEL_PREFETCH_CHUNK_SIZE, ca o imprimare pornită de operator să nu aștepte după tot prefetch-ul.
+    AWB-urile eșuate sunt amânate (`_failed_labels`), deci nu consumă bugetul rulărilor următoare.
+    """
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            printable_shipments_select(models.Shipment.awb, models.Shipment.courier, models.Shipment.account_key)
+            .order_by(models.Shipment.id.desc())
+        )).all()
+
+    # AWB-urile care nu mai sunt neprintate ies din cache-ul negativ
+    now = time.time()
+    unprinted_keys = {(account_key, awb) for awb, _, account_key in rows}
+    for key in [k for k in _failed_labels if k not in unprinted_keys]:
+        del _failed_labels[key]
+
+    cached = await label_cache.contains_many([_cache_key(account_key, awb) for awb, _, account_key in rows])
+    missing = [
+        {"awb": awb, "courier": courier, "account_key": account_key}
+        for (awb, courier, account_key), is_cached in zip(rows, cached)
+        if not is_cached and not _is_backed_off((account_key, awb), now)
+    ][:settings.LABEL_PREFETCH_MAX_PER_RUN]
+    if not missing:
+        return 0
+
+    fetched = failed = 0
+    chunk_size = max(1, settings.LABEL_PREFETCH_CHUNK_SIZE)
+    for i in range(0, len(missing), chunk_size):
+        chunk = missing[i:i + chunk_size]
+        ok, failed_map = await label_service.prefetch_labels(chunk)
+        fetched += ok
+        failed += len(failed_map)
+        for s in chunk:
+            key = (s['account_key'], s['awb'])
+            if s['awb'] in failed_map:
+                _record_failure(key, time.time())
+            else:
+                _failed_labels.pop(key, None)
+    logging.info(f"Prefetch etichete: {fetched} descărcate, {failed} eșuate ({len(rows)} AWB-uri neprintate, {len(_failed_labels)} amânate după eșecuri).")
+    return fetched
+
+
+async def count_prefetched(shipments: Iterable[Dict]) -> int:
+    """Câte dintre `shipments` ({"awb", "account_key"}) au deja eticheta în cache (pentru Print Hub)."""
+    cached = await label_cache.contains_many([_cache_key(s['account_key'], s['awb']) for s in shipments])
+    return sum(cached)
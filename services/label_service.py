@@ -1,50 +1,163 @@
 import asyncio
 import logging
-from typing import List, Dict, Tuple
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Awaitable, Callable, List, Dict, Tuple
 import io
+
+from sqlalchemy import select
+
+import models
+from database import AsyncSessionLocal
 from .couriers import get_courier_service
+from .label_cache import label_cache
+from . import pdf_pool
+
+DEFAULT_PAPER_SIZE = 'A6'
+
+
+async def _load_accounts(account_keys: List[str]) -> Dict[str, Tuple[str, dict]]:
+    """account_key -> (courier_type, credentials) pentru conturile active."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(models.CourierAccount.account_key, models.CourierAccount.courier_type, models.CourierAccount.credentials)
+            .where(models.CourierAccount.account_key.in_(account_keys), models.CourierAccount.is_active == True)
+        )
+        return {account_key: (courier_type, credentials or {}) for account_key, courier_type, credentials in result.all()}
+
+
+async def _fetch_labels(
+    shipments_data: List[Dict], on_label: Callable[[str, bytes], Awaitable[None]], record_stats: bool = True
+) -> Dict[str, str]:
+    """
+    Descarcă etichetele și apelează `on_label(awb, pdf)` pentru fiecare, pe măsură ce sosesc.
+    Fiecare etichetă este căutată întâi în `label_cache` (cheie: account_key, awb, format hârtie)
+    și descărcată de la curier doar dacă lipsește; etichetele descărcate sunt salvate în cache.
+    `record_stats=False` ține citirile din cache în afara statisticilor (hit ratio-ul reflectă operatorii).
+    Returnează {awb: motiv} pentru etichetele eșuate.
+    """
+    failed_awbs_map: Dict[str, str] = {}
+    from_cache = downloaded = 0
+    accounts: Dict[str, Tuple[str, dict]] = {}
+    accounts_lock = asyncio.Lock()
+
+    async def get_account(account_key: str):
+        # Conturile sunt citite din DB o singură dată, doar dacă există etichete lipsă din cache
+        async with accounts_lock:
+            if not accounts:
+                keys = list({s.get('account_key') for s in shipments_data if s.get('account_key')})
+                accounts.update(await _load_accounts(keys))
+        return accounts.get(account_key)
+
+    # Fiecare cerere către curier trece prin limitatorul contului (rate/burst/concurență),
+    # deci conturile diferite rulează în paralel, fiecare în ritmul lui
+    async def worker(shipment: Dict):
+        nonlocal from_cache, downloaded
+        awb, account_key = shipment.get('awb'), shipment.get('account_key')
+        paper_size = shipment.get('paper_size') or DEFAULT_PAPER_SIZE
+
+        cached = await label_cache.get(account_key, awb, paper_size, record_stats=record_stats)
+        if cached:
+            from_cache += 1
+            await on_label(awb, cached)
+            return
+
+        account = await get_account(account_key)
+        courier_service = get_courier_service(account[0], account_key, account[1]) if account else None
+        if not courier_service:
+            failed_awbs_map[awb] = f"Contul de curier '{account_key}' nu există, este inactiv sau nu este suportat."
+            return
+        response = await courier_service.get_label(awb, paper_size)
+        if response.success:
+            downloaded += 1
+            await label_cache.put(account_key, awb, paper_size, response.content)
+            await on_label(awb, response.content)
+        else:
+            failed_awbs_map[awb] = response.error_message
+
+    await asyncio.gather(*(worker(s) for s in shipments_data))
+
+    if not record_stats:
+        return failed_awbs_map
+    logging.info(
+        f"Etichete: {from_cache + downloaded} generate ({from_cache} din cache), {len(failed_awbs_map)} eșuate; "
+        f"rata de hit a cache-ului: {label_cache.stats()['hit_ratio']}"
+    )
+    return failed_awbs_map
+
 
 async def generate_labels_pdf(
     shipments_data: List[Dict]
 ) -> Tuple[Dict[str, io.BytesIO], Dict[str, str]]:
-    """
-    Generează etichete PDF, aplicând rate-limiting pentru Sameday.
-    """
+    """Generează etichete PDF în memorie (pentru descărcări individuale / loturi mici)."""
     if not shipments_data:
         return {}, {}
 
     awb_to_pdf_map: Dict[str, io.BytesIO] = {}
-    failed_awbs_map: Dict[str, str] = {}
-    
-    sameday_shipments = [s for s in shipments_data if 'sameday' in s.get('courier', '').lower()]
-    other_shipments = [s for s in shipments_data if 'sameday' not in s.get('courier', '').lower()]
-
-    # --- PROCESARE PARALELĂ PENTRU DPD, ECONT ETC. ---
-    other_sem = asyncio.Semaphore(10)
-    async def other_worker(shipment: Dict):
-        awb, courier, account = shipment.get('awb'), shipment.get('courier'), shipment.get('account_key')
-        courier_service = get_courier_service(courier)
-        if not courier_service: return
-        async with other_sem:
-            response = await courier_service.get_label(awb, account, 'A6')
-            if response.success: awb_to_pdf_map[awb] = response.content
-            else: failed_awbs_map[awb] = response.error_message
-
-    # --- PROCESARE SECVENȚIALĂ CU PAUZĂ PENTRU SAMEDAY ---
-    sameday_sem = asyncio.Semaphore(1)
-    async def sameday_worker(shipment: Dict):
-        awb, courier, account = shipment.get('awb'), shipment.get('courier'), shipment.get('account_key')
-        courier_service = get_courier_service(courier)
-        if not courier_service: return
-        async with sameday_sem:
-            await asyncio.sleep(1.0) # PAUZA DE 1 SECUNDĂ
-            response = await courier_service.get_label(awb, account, 'A6')
-            if response.success: awb_to_pdf_map[awb] = response.content
-            else: failed_awbs_map[awb] = response.error_message
-
-    other_tasks = [other_worker(s) for s in other_shipments]
-    sameday_tasks = [sameday_worker(s) for s in sameday_shipments]
-    
-    await asyncio.gather(*(other_tasks + sameday_tasks))
-
-    return awb_to_pdf_map, failed_awbs_map
\ No newline at end of file
+
+    async def collect(awb: str, content: bytes):
+        awb_to_pdf_map[awb] = io.BytesIO(content)
+
+    failed_awbs_map = await _fetch_labels(shipments_data, collect)
+    return awb_to_pdf_map, failed_awbs_map
+
+
+async def prefetch_labels(shipments_data: List[Dict]) -> Tuple[int, Dict[str, str]]:
+    """Descarcă etichetele doar pentru a umple `label_cache`. Returnează (număr reușite, eșuate)."""
+    fetched = 0
+
+    async def count(awb: str, content: bytes):
+        nonlocal fetched
+        fetched += 1
+
+    failed_awbs_map = await _fetch_labels(shipments_data, count, record_stats=False) if shipments_data else {}
+    return fetched, failed_awbs_map
+
+
+class LabelSpool:
+    """
+    Etichetele unei imprimări, scrise pe disc (un fișier per AWB într-un director temporar)
+    pe măsură ce sosesc, în loc să fie ținute ca BytesIO în memorie. Se folosește ca
+    `with LabelSpool() as spool:`; directorul este șters la ieșire.
+    """
+
+    def __init__(self):
+        self.directory = Path(tempfile.mkdtemp(prefix='awb_labels_'))
+        self.paths: Dict[str, Path] = {}
+        self._count = 0
+
+    async def add(self, awb: str, content: bytes):
+        self._count += 1
+        path = self.directory / f"{self._count}.pdf"
+        await asyncio.to_thread(path.write_bytes, content)
+        self.paths[awb] = path
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+async def spool_labels(shipments_data: List[Dict], spool: LabelSpool) -> Tuple[List[str], Dict[str, str]]:
+    """Ca `generate_labels_pdf`, dar etichetele ajung în `spool` (pe disc). Returnează (AWB-uri reușite, eșuate)."""
+    if not shipments_data:
+        return [], {}
+    failed_awbs_map = await _fetch_labels(shipments_data, spool.add)
+    return list(spool.paths), failed_awbs_map
+
+
+async def merge_spooled_labels(spool: LabelSpool, awbs_in_order: List[str], dest: Path) -> int:
+    """
+    Îmbină etichetele din `spool`, în ordinea `awbs_in_order`, direct în fișierul `dest`
+    (scris ca `.part` și redenumit la final). Rulează într-un proces din pool-ul PDF, ca parsarea
+    să nu blocheze event loop-ul; procesului i se trimit doar căile fișierelor (paginile îmbinate sunt
+    ținute în memorie în procesul din pool până la scriere). Returnează numărul de pagini.
+    """
+    paths = [spool.paths[awb] for awb in awbs_in_order if awb in spool.paths]
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    return await pdf_pool.run_in_pdf_pool(pdf_pool.merge_pdf_files, paths, dest)
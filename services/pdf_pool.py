@@ -0,0 +1,119 @@
+# services/pdf_pool.py
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import A6
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from settings import settings
+
+# Procesele pentru PDF (pypdf/reportlab sunt Python pur și țin GIL-ul, deci un thread ar bloca
+# tot event loop-ul). Între procese circulă doar căi de fișiere și bytes, nu obiecte PDF.
+_executor: Optional[ProcessPoolExecutor] = None
+_fonts: Optional[Tuple[str, str]] = None
+
+
+def _pool_size() -> int:
+    return settings.PDF_POOL_WORKERS or os.cpu_count() or 1
+
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # `spawn`: procesele noi nu moștenesc event loop-ul, conexiunile DB sau thread-urile părintelui
+        _executor = ProcessPoolExecutor(max_workers=_pool_size(), mp_context=multiprocessing.get_context('spawn'))
+        logging.info(f"Pool-ul de procese PDF pornit cu {_pool_size()} procese.")
+    return _executor
+
+
+async def run_in_pdf_pool(func: Callable, *args):
+    """Rulează `func(*args)` într-un proces din pool; dacă pool-ul a căzut, îl recreează o dată."""
+    global _executor
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_pdf_executor(), func, *args)
+    except BrokenProcessPool:
+        logging.error("Pool-ul de procese PDF s-a oprit neașteptat; este repornit.")
+        _executor = None
+        return await loop.run_in_executor(get_pdf_executor(), func, *args)
+
+
+def shutdown_pdf_pool():
+    """Oprește procesele pool-ului. Apelată la oprirea aplicației."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# --- Funcții executate în procesele pool-ului ---
+
+def merge_pdf_files(paths: List[Path], dest: Path) -> int:
+    """
+    Îmbină fișierele PDF `paths`, în ordine, în `dest` (scris ca `.part` și redenumit). Returnează numărul de pagini.
+
+    Memoria nu este constantă: `PdfWriter` clonează fiecare pagină (cu stream-urile ei) și le ține
+    pe toate până la `write`, deci vârful de memorie al procesului din pool crește cu numărul de
+    etichete. Procesul web ține doar căile fișierelor.
+    """
+    writer = PdfWriter()
+    for path in paths:
+        try:
+            for page in PdfReader(path).pages:
+                writer.add_page(page)
+        except Exception as e:
+            logging.error(f"Nu s-a putut procesa PDF-ul {path.name}: {e}")
+    if not writer.pages:
+        return 0
+    part = dest.with_name(f".{dest.name}.{os.getpid()}.part")
+    try:
+        with open(part, 'wb') as f:
+            writer.write(f)
+        os.replace(part, dest)
+    finally:
+        if part.exists():
+            part.unlink()
+    return len(writer.pages)
+
+
+def _summary_fonts() -> Tuple[str, str]:
+    global _fonts
+    if _fonts is None:
+        try:
+            pdfmetrics.registerFont(TTFont('DejaVuSans', 'DejaVuSans.ttf'))
+            pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', 'DejaVuSans-Bold.ttf'))
+            _fonts = ('DejaVuSans', 'DejaVuSans-Bold')
+        except Exception:
+            logging.warning("Fontul DejaVuSans nu a fost găsit.")
+            _fonts = ('Helvetica', 'Helvetica-Bold')
+    return _fonts
+
+
+def render_summary_page(info_lines: List[str]) -> bytes:
+    """Pagina A6 de sumar: primul rând ca titlu, restul ca text. Returnează PDF-ul ca bytes."""
+    font_name, font_name_bold = _summary_fonts()
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A6)
+    width, height = A6
+    p.setFont(font_name_bold, 24)
+    p.drawString(15 * mm, height - 20 * mm, info_lines[0])
+    p.setFont(font_name, 11)
+    y_position = height - 35 * mm
+    for line in info_lines[1:]:
+        p.drawString(15 * mm, y_position, line)
+        y_position -= 7 * mm
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
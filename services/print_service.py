@@ -1,53 +1,47 @@
 import io
-import logging
-from typing import List, Tuple
+from pathlib import Path
+from typing import Dict, List, Tuple
 from collections import defaultdict
-from pypdf import PdfReader, PdfWriter
-from reportlab.lib.pagesizes import A6
-from reportlab.lib.units import mm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from sqlalchemy import select, or_, func
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 from itertools import groupby
 import models
-from services import label_service
-from settings import settings
-
-try:
-    pdfmetrics.registerFont(TTFont('DejaVuSans', 'DejaVuSans.ttf'))
-    pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', 'DejaVuSans-Bold.ttf'))
-    FONT_NAME, FONT_NAME_BOLD = 'DejaVuSans', 'DejaVuSans-Bold'
-except Exception:
-    logging.warning("Fontul DejaVuSans nu a fost găsit.")
-    FONT_NAME, FONT_NAME_BOLD = 'Helvetica', 'Helvetica-Bold'
-
-def _create_summary_page(info_lines: List[str]) -> io.BytesIO:
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A6)
-    width, height = A6
-    p.setFont(FONT_NAME_BOLD, 24)
-    p.drawString(15 * mm, height - 20 * mm, info_lines[0])
-    p.setFont(FONT_NAME, 11)
-    y_position = height - 35 * mm
-    for line in info_lines[1:]:
-        p.drawString(15 * mm, y_position, line)
-        y_position -= 7 * mm
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-    return buffer
+from services import label_service, pdf_pool
+
+
+async def _create_summary_page(info_lines: List[str]) -> io.BytesIO:
+    """Pagina A6 de sumar (titlu + rânduri), randată de reportlab într-un proces din pool-ul PDF."""
+    return io.BytesIO(await pdf_pool.run_in_pdf_pool(pdf_pool.render_summary_page, info_lines))
 
 
 # services/print_service.py
 
 # ... (păstrează toate importurile și funcția _create_summary_page neschimbate) ...
 
-async def generate_pdf_for_selected_batches(db: AsyncSession, category_id: int, batch_numbers: List[int]) -> Tuple[io.BytesIO, List[str], List[str]]:
-    batch_size = settings.PRINT_BATCH_SIZE
-    
+def printable_shipments_select(*columns):
+    """
+    SELECT peste comenzile gata de printare: ultimul AWB al comenzii, neprintat, la un curier
+    cu etichete suportate (DPD/Sameday). Aceeași selecție pentru Print Hub, numărători și prefetch.
+    """
+    latest_shipment_subq = (
+        select(models.Shipment.order_id, func.max(models.Shipment.id).label("max_id"))
+        .group_by(models.Shipment.order_id).alias("latest_shipment_subq")
+    )
+    supported_couriers_filter = or_(models.Shipment.courier.ilike('%dpd%'), models.Shipment.courier.ilike('%sameday%'))
+    return (
+        select(*columns)
+        .select_from(models.Order)
+        .join(models.Shipment, models.Order.id == models.Shipment.order_id)
+        .join(latest_shipment_subq, models.Shipment.id == latest_shipment_subq.c.max_id)
+        .where(models.Shipment.printed_at.is_(None), models.Shipment.awb.isnot(None), supported_couriers_filter)
+    )
+
+async def sorted_printable_shipments(db: AsyncSession, category_id: int) -> List[Dict]:
+    """
+    AWB-urile neprintate ale categoriei, în ordinea de printare (categorie, curier, produse).
+    Returnează [{"awb", "courier", "account_key"}]; `batch_planner` le împarte în loturi.
+    """
     # Pas 1: Preluare Store ID-uri (neschimbat)
     store_ids_res = await db.execute(
         select(models.store_category_map.c.store_id)
@@ -55,30 +49,17 @@ async def generate_pdf_for_selected_batches(db: AsyncSession, category_id: int,
     )
     store_ids_result = store_ids_res.scalars().all()
     if not store_ids_result:
-        return io.BytesIO(), [], []
+        return []
 
-    # Pas 2: Preluare comenzi neprintate (neschimbat)
-    latest_shipment_subq = (
-        select(models.Shipment.order_id, func.max(models.Shipment.id).label("max_id"))
-        .group_by(models.Shipment.order_id).alias("latest_shipment_subq")
-    )
-    supported_couriers_filter = or_(models.Shipment.courier.ilike('%dpd%'), models.Shipment.courier.ilike('%sameday%'))
-    
+    # Pas 2: Preluare comenzi neprintate
     base_query = (
-        select(models.Order)
-        .join(models.Shipment, models.Order.id == models.Shipment.order_id)
-        .join(latest_shipment_subq, models.Shipment.id == latest_shipment_subq.c.max_id)
+        printable_shipments_select(models.Order)
         .options(
             selectinload(models.Order.store).selectinload(models.Store.categories), 
             selectinload(models.Order.line_items), 
             selectinload(models.Order.shipments)
         )
-        .where(
-            models.Order.store_id.in_(store_ids_result), 
-            models.Shipment.printed_at.is_(None), 
-            models.Shipment.awb.isnot(None), 
-            supported_couriers_filter
-        )
+        .where(models.Order.store_id.in_(store_ids_result))
     )
     all_printable_orders_res = await db.execute(base_query)
     all_printable_orders = all_printable_orders_res.unique().scalars().all()
@@ -133,49 +114,29 @@ async def generate_pdf_for_selected_batches(db: AsyncSession, category_id: int,
             # 5. Logică pentru comenzile cu produse multiple
             o['sort_product_signature'],    # Grupează comenzile cu conținut identic
             -o['sort_total_items'],         # Fallback: sortează după cantitatea totală (desc)
+            o['awb'],                       # 6. Ordine stabilă între rulări (același plan, aceleași loturi)
         )
     )
     # --- SFÂRȘIT MODIFICARE ---
-    
-    # Pas 5: Selectarea loturilor (neschimbat)
-    orders_in_selected_batches = []
-    for batch_num in batch_numbers:
-        start_index = (batch_num - 1) * batch_size
-        end_index = batch_num * batch_size
-        orders_in_selected_batches.extend(all_orders_sorted[start_index:end_index])
-    
-    if not orders_in_selected_batches:
-        return io.BytesIO(), [], []
-
-    # Pas 6 & 7: Generarea și asamblarea PDF-ului (neschimbat)
-    shipments_to_fetch = [
-        {"awb": o["awb"], "courier": o["courier"], "account_key": o["account_key"]} 
-        for o in orders_in_selected_batches
-    ]
-    # Am redenumit funcția pentru a fi consistentă cu ce am folosit în `labels.py`
-    awb_to_pdf_map, failed_awbs_dict = await label_service.generate_labels_pdf_sequentially(db, shipments_to_fetch)
-    
-    successful_awbs = list(awb_to_pdf_map.keys())
-    failed_awbs = list(failed_awbs_dict.keys())
-    
-    if not successful_awbs:
-        return io.BytesIO(), [], [s['awb'] for s in orders_in_selected_batches]
-
-    final_pdf_writer = PdfWriter()
-    for order_data in orders_in_selected_batches:
-        awb = order_data['awb']
-        if pdf_buffer := awb_to_pdf_map.get(awb):
-            try:
-                pdf_reader = PdfReader(pdf_buffer)
-                for page in pdf_reader.pages:
-                    final_pdf_writer.add_page(page)
-            except Exception as e:
-                logging.error(f"Eroare la adăugarea PDF pentru AWB {awb}: {e}")
-
-    final_buffer = io.BytesIO()
-    if len(final_pdf_writer.pages) > 0:
-        final_pdf_writer.write(final_buffer)
-    final_buffer.seek(0)
-    
-    return final_buffer, successful_awbs, failed_awbs
+    return [{"awb": o["awb"], "courier": o["courier"], "account_key": o["account_key"]} for o in all_orders_sorted]
+
+async def generate_pdf_for_shipments(shipments_to_fetch: List[Dict], dest: Path) -> Tuple[int, List[str], List[str]]:
+    """
+    Îmbină etichetele `shipments_to_fetch` (loturile selectate din planul de printare) direct
+    în fișierul `dest`, în ordinea dată. Etichetele sunt ținute pe disc (`LabelSpool`) pe măsură
+    ce sosesc, nu în memorie. Returnează (număr de pagini scrise, AWB-uri reușite, AWB-uri eșuate).
+    """
+    if not shipments_to_fetch:
+        return 0, [], []
+
+    # Descărcarea etichetelor în spool și îmbinarea lor direct în `dest`
+    with label_service.LabelSpool() as spool:
+        successful_awbs, failed_awbs_dict = await label_service.spool_labels(shipments_to_fetch, spool)
+        failed_awbs = list(failed_awbs_dict.keys())
+
+        if not successful_awbs:
+            return 0, [], [s['awb'] for s in shipments_to_fetch]
+
+        pages = await label_service.merge_spooled_labels(spool, [s['awb'] for s in shipments_to_fetch], dest)
 
+    return pages, successful_awbs, failed_awbs
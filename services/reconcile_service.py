@@ -0,0 +1,101 @@
+# services/reconcile_service.py
+"""
+Reconcilierea rândurilor copil ale comenzilor (line items, fulfillment orders, shipments)
+cu datele venite din Shopify, folosită atât de sincronizare cât și de webhook-uri.
+
+Rândurile existente sunt citite o singură dată pentru toate comenzile date și comparate
+după ID-ul Shopify; se trimit apoi doar instrucțiunile necesare, fiecare ca bulk:
+
+    1. SELECT rândurile existente (ale comenzilor date sau cu aceleași ID-uri Shopify)
+    2. INSERT ... ON CONFLICT DO UPDATE pentru rândurile noi
+    3. UPDATE (executemany după cheia primară) doar pentru rândurile modificate
+    4. DELETE pentru rândurile care nu mai există în Shopify (dacă `delete_missing`)
+"""
+
+import logging
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+
+from sqlalchemy import select, update, delete, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+
+class ChildSpec(NamedTuple):
+    """Descrie un tip de rând copil: modelul, coloana cu ID-ul Shopify și coloanele sincronizate."""
+    model: Any
+    key: str
+    fields: Tuple[str, ...]
+    # Shipment-urile păstrează istoricul de tracking/printare, deci nu sunt șterse
+    delete_missing: bool = True
+
+
+class ReconcileResult(NamedTuple):
+    inserted: int
+    updated: int
+    deleted: int
+
+
+LINE_ITEMS = ChildSpec(models.LineItem, 'shopify_line_item_id', ('sku', 'title', 'quantity'))
+FULFILLMENT_ORDERS = ChildSpec(models.FulfillmentOrder, 'shopify_fulfillment_order_id', ('status', 'hold_details'))
+SHIPMENTS = ChildSpec(models.Shipment, 'awb', ('courier', 'account_key', 'shopify_fulfillment_id', 'fulfillment_created_at'), delete_missing=False)
+
+
+async def reconcile_children(db: AsyncSession, spec: ChildSpec, order_ids: Iterable[int], rows: List[Dict[str, Any]]) -> ReconcileResult:
+    """
+    Aduce rândurile `spec.model` ale comenzilor `order_ids` la starea din `rows`
+    (dicționare cu `order_id`, `spec.key` și `spec.fields`). `rows` trebuie să conțină
+    toți copiii comenzilor date. Nu face commit.
+    """
+    order_ids = set(order_ids)
+    if not order_ids and not rows:
+        return ReconcileResult(0, 0, 0)
+
+    model = spec.model
+    key_col = getattr(model, spec.key)
+    columns = ('order_id',) + spec.fields
+    incoming = {row[spec.key]: row for row in rows if row.get(spec.key)}
+
+    scope = [model.order_id.in_(list(order_ids))]
+    if incoming:
+        # Includem și rândurile cu aceleași ID-uri dar atașate altei comenzi, ca să fie mutate, nu duplicate
+        scope.append(key_col.in_(list(incoming.keys())))
+    existing_res = await db.execute(
+        select(model.id, key_col, *(getattr(model, c) for c in columns)).where(or_(*scope))
+    )
+    existing = {}
+    stale_ids = []
+    for row in existing_res.all():
+        pk, key, values = row[0], row[1], row[2:]
+        if key is None or (key in existing):
+            # Rânduri vechi fără ID Shopify sau duplicate: nu pot fi potrivite
+            stale_ids.append(pk)
+        else:
+            existing[key] = (pk, dict(zip(columns, values)))
+
+    to_insert = [{spec.key: key, **{c: row.get(c) for c in columns}} for key, row in incoming.items() if key not in existing]
+    to_update = [
+        {'id': existing[key][0], **{c: row.get(c) for c in columns}}
+        for key, row in incoming.items()
+        if key in existing and any(existing[key][1][c] != row.get(c) for c in columns)
+    ]
+    if spec.delete_missing:
+        stale_ids += [pk for key, (pk, values) in existing.items() if key not in incoming and values['order_id'] in order_ids]
+    else:
+        stale_ids = []
+
+    if to_insert:
+        insert_stmt = insert(model).values(to_insert)
+        await db.execute(insert_stmt.on_conflict_do_update(
+            index_elements=[key_col],
+            set_={c: insert_stmt.excluded[c] for c in columns},
+        ))
+    if to_update:
+        await db.execute(update(model), to_update)
+    if stale_ids:
+        await db.execute(delete(model).where(model.id.in_(stale_ids)))
+
+    if to_insert or to_update or stale_ids:
+        logging.info(f"Reconciliere {model.__tablename__}: {len(to_insert)} inserate, {len(to_update)} actualizate, {len(stale_ids)} șterse.")
+    return ReconcileResult(len(to_insert), len(to_update), len(stale_ids))
@@ -0,0 +1,158 @@
+# services/shopify_client.py
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from settings import ShopifyStore, settings
+
+try:
+    import h2  # noqa: F401  (necesar pentru httpx cu http2=True)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    logging.warning("Pachetul 'h2' nu este instalat; clientul Shopify folosește HTTP/1.1.")
+    HTTP2_AVAILABLE = False
+
+DEFAULT_QUERY_COST = 50.0
+MAX_THROTTLE_RETRIES = 5
+
+
+class ShopifyClient:
+    """
+    Client HTTP pe termen lung pentru un magazin (keep-alive, HTTP/2), partajat de
+    sincronizare, webhook-uri și notificările de fulfillment.
+
+    Ține evidența bugetului "leaky bucket" al magazinului din
+    `extensions.cost.throttleStatus` și pune cererile la coadă până când bugetul
+    estimat acoperă costul lor, în loc să primească THROTTLED / 429.
+    """
+
+    def __init__(self, store: ShopifyStore):
+        self.store = store
+        self.http = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(settings.SHOPIFY_HTTP_TIMEOUT_SECONDS, connect=10.0),
+            limits=httpx.Limits(max_connections=settings.SHOPIFY_MAX_CONNECTIONS, max_keepalive_connections=settings.SHOPIFY_MAX_CONNECTIONS),
+        )
+        # Token-ul se trimite doar către Shopify, nu și către URL-urile externe (ex. rezultatul bulk)
+        self._auth_headers = {"X-Shopify-Access-Token": store.access_token}
+        # Starea bucket-ului; necunoscută până la primul răspuns
+        self._available: Optional[float] = None
+        self._maximum = 1000.0
+        self._restore_rate = 50.0
+        self._updated_at = time.monotonic()
+        self._bucket_lock = asyncio.Lock()
+        # Ultimul cost cerut, per query, folosit ca estimare pentru următoarea rulare
+        self._cost_estimates: Dict[str, float] = {}
+
+    @property
+    def graphql_url(self) -> str:
+        if self.store.graphql_url:
+            return self.store.graphql_url
+        return f"https://{self.store.domain}/admin/api/{self.store.api_version}/graphql.json"
+
+    @property
+    def rest_base_url(self) -> str:
+        return f"https://{self.store.domain}/admin/api/{self.store.api_version}"
+
+    def _current_available(self) -> float:
+        elapsed = time.monotonic() - self._updated_at
+        return min(self._maximum, self._available + elapsed * self._restore_rate)
+
+    async def _reserve(self, cost: float):
+        """Așteaptă (la coadă, în ordinea sosirii) până când bugetul acoperă `cost`."""
+        async with self._bucket_lock:
+            if self._available is None:
+                return
+            available = self._current_available()
+            if available < cost:
+                wait = (cost - available) / self._restore_rate
+                logging.info(f"Shopify {self.store.domain}: buget {available:.0f}/{self._maximum:.0f}, se așteaptă {wait:.1f}s.")
+                await asyncio.sleep(wait)
+                available = self._current_available()
+            self._available = available - cost
+            self._updated_at = time.monotonic()
+
+    def _update_bucket(self, body: Dict[str, Any], query: str):
+        cost = (body.get("extensions") or {}).get("cost") or {}
+        throttle = cost.get("throttleStatus") or {}
+        if "currentlyAvailable" in throttle:
+            self._available = float(throttle["currentlyAvailable"])
+            self._maximum = float(throttle.get("maximumAvailable", self._maximum))
+            self._restore_rate = float(throttle.get("restoreRate", self._restore_rate))
+            self._updated_at = time.monotonic()
+        if "requestedQueryCost" in cost:
+            self._cost_estimates[query] = float(cost["requestedQueryCost"])
+
+    @staticmethod
+    def _is_throttled(body: Dict[str, Any]) -> bool:
+        return any((err.get("extensions") or {}).get("code") == "THROTTLED" for err in body.get("errors") or [])
+
+    async def graphql(self, query: str, variables: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Trimite un query/mutation GraphQL și returnează corpul JSON complet.
+        Reîncearcă automat răspunsurile THROTTLED / 429; celelalte erori HTTP sunt ridicate.
+        """
+        payload = {"query": query, "variables": variables or {}}
+        request_timeout = timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            estimated_cost = self._cost_estimates.get(query, DEFAULT_QUERY_COST)
+            await self._reserve(min(estimated_cost, self._maximum))
+
+            response = await self.http.post(self.graphql_url, json=payload, headers=self._auth_headers, timeout=request_timeout)
+            if response.status_code == 429:
+                retry_after = float(response.headers.get("Retry-After", 2.0))
+                logging.warning(f"Shopify {self.store.domain}: 429, reîncercare în {retry_after:.1f}s.")
+                await asyncio.sleep(retry_after)
+                continue
+            response.raise_for_status()
+
+            body = response.json()
+            self._update_bucket(body, query)
+            if self._is_throttled(body) and attempt < MAX_THROTTLE_RETRIES:
+                wait = max(1.0, (estimated_cost - (self._available or 0.0)) / self._restore_rate)
+                logging.warning(f"Shopify {self.store.domain}: THROTTLED, reîncercare în {wait:.1f}s.")
+                await asyncio.sleep(wait)
+                continue
+            return body
+
+        raise RuntimeError(f"Shopify {self.store.domain}: cererea a fost limitată de {MAX_THROTTLE_RETRIES + 1} ori.")
+
+    async def rest(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Cerere către Admin REST API, pe aceeași conexiune; respectă `Retry-After` la 429."""
+        headers = {**self._auth_headers, **kwargs.pop("headers", {})}
+        for _ in range(MAX_THROTTLE_RETRIES + 1):
+            response = await self.http.request(method, f"{self.rest_base_url}/{path.lstrip('/')}", headers=headers, **kwargs)
+            if response.status_code != 429:
+                return response
+            await asyncio.sleep(float(response.headers.get("Retry-After", 2.0)))
+        return response
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+_clients: Dict[str, ShopifyClient] = {}
+
+
+def get_shopify_client(store: ShopifyStore) -> ShopifyClient:
+    """Returnează clientul unic al magazinului (recreat dacă s-a schimbat token-ul sau versiunea API)."""
+    client = _clients.get(store.domain)
+    if client and (client.store.access_token != store.access_token or client.store.api_version != store.api_version or client.store.graphql_url != store.graphql_url):
+        asyncio.ensure_future(client.aclose())
+        client = None
+    if client is None:
+        client = ShopifyClient(store)
+        _clients[store.domain] = client
+    return client
+
+
+async def close_shopify_clients():
+    """Închide toate conexiunile; apelată la oprirea aplicației."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -1,19 +1,52 @@
+import asyncio
 import httpx
+import json
 import logging
-import re
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple, NamedTuple
 from settings import ShopifyStore, settings
 import models
+from .shopify_client import ShopifyClient, get_shopify_client
 
-async def fetch_orders(store: ShopifyStore, since_days: int) -> list:
-    since_date = datetime.now(timezone.utc) - timedelta(days=since_days)
-    since_str = since_date.isoformat()
-    
+# Dimensiunile paginilor sunt alese astfel încât costul estimat al unui query
+# (orders x (lineItems + fulfillmentOrders)) să rămână sub limita de 1000 a Shopify.
+ORDERS_PAGE_SIZE = 50
+LINE_ITEMS_PAGE_SIZE = 25
+FULFILLMENT_ORDERS_PAGE_SIZE = 5
+NESTED_FOLLOWUP_PAGE_SIZE = 100
+
+LINE_ITEM_FIELDS = "id sku title quantity"
+FULFILLMENT_ORDER_FIELDS = "id status fulfillmentHolds { reason reasonNotes }"
+
+# Conexiunile imbricate care pot depăși o singură pagină și trebuie completate separat
+NESTED_CONNECTIONS = {
+    "lineItems": LINE_ITEM_FIELDS,
+    "fulfillmentOrders": FULFILLMENT_ORDER_FIELDS,
+}
+
+
+def store_config_from_db(store: models.Store) -> ShopifyStore:
+    """Construiește configurația de API a unui magazin din înregistrarea din baza de date."""
+    return ShopifyStore(
+        brand=store.name,
+        domain=store.domain,
+        shared_secret=store.shared_secret or "",
+        access_token=store.access_token or "",
+        pii_source=store.pii_source,
+        api_version="2025-07",
+        graphql_url=settings.SHOPIFY_GRAPHQL_URL,
+    )
+
+
+def _order_fields(store: ShopifyStore, bulk: bool = False) -> str:
+    """
+    Câmpurile unei comenzi, comune pentru toate modurile de preluare.
+    În modul `bulk` conexiunile imbricate nu au `first`/`pageInfo`: Shopify le
+    exportă integral ca rânduri separate, legate prin `__parentId`.
+    """
     # Construim dinamic partea de query pentru adresa de livrare
     shipping_address_query_part = ""
     if store.pii_source == 'shopify':
-        logging.warning(f"Se preiau datele PII din Shopify API pentru {store.domain}")
         shipping_address_query_part = """
             shippingAddress {
                 firstName
@@ -29,65 +62,299 @@ async def fetch_orders(store: ShopifyStore, since_days: int) -> list:
             email
         """
 
-    # Query-ul este acum formatat dinamic pentru a include și metafield-ul
+    if bulk:
+        line_items_args = fulfillment_orders_args = page_info = ""
+    else:
+        line_items_args = f"(first: {LINE_ITEMS_PAGE_SIZE})"
+        fulfillment_orders_args = f"(first: {FULFILLMENT_ORDERS_PAGE_SIZE})"
+        page_info = "pageInfo { hasNextPage endCursor }"
+
+    return f"""
+        id
+        name
+        createdAt
+        updatedAt
+        cancelledAt
+        displayFinancialStatus
+        displayFulfillmentStatus
+        tags
+        note
+        totalPriceSet {{ shopMoney {{ amount }} }}
+        paymentGatewayNames
+        {shipping_address_query_part}
+        metafield(namespace: "custom", key: "adresa") {{
+            value
+        }}
+        lineItems{line_items_args} {{
+            {page_info}
+            edges {{ node {{ {LINE_ITEM_FIELDS} }} }}
+        }}
+        fulfillments {{ createdAt, trackingInfo {{ company, number, url }}, id }}
+        fulfillmentOrders{fulfillment_orders_args} {{
+            {page_info}
+            edges {{ node {{ {FULFILLMENT_ORDER_FIELDS} }} }}
+        }}
+    """
+
+
+async def _post_graphql(client: ShopifyClient, query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Trimite un query GraphQL și returnează 'data'. Ridică excepție la erori HTTP sau GraphQL."""
+    data = await client.graphql(query, variables)
+    if "errors" in data:
+        raise RuntimeError(f"Eroare GraphQL pentru {client.store.domain}: {data['errors']}")
+    return data.get("data") or {}
+
+
+async def _fetch_remaining_nested(client: ShopifyClient, order_id: str, connection: str, after: str) -> List[Dict[str, Any]]:
+    """Preia restul paginilor unei conexiuni imbricate (ex. lineItems) pentru o singură comandă."""
+    query = f"""
+    query RemainingNested($id: ID!, $after: String) {{
+        node(id: $id) {{
+            ... on Order {{
+                {connection}(first: {NESTED_FOLLOWUP_PAGE_SIZE}, after: $after) {{
+                    pageInfo {{ hasNextPage endCursor }}
+                    edges {{ node {{ {NESTED_CONNECTIONS[connection]} }} }}
+                }}
+            }}
+        }}
+    }}
+    """
+    edges: List[Dict[str, Any]] = []
+    cursor: Optional[str] = after
+    while cursor:
+        data = await _post_graphql(client, query, {"id": order_id, "after": cursor})
+        conn = (data.get("node") or {}).get(connection) or {}
+        edges.extend(conn.get("edges", []))
+        page_info = conn.get("pageInfo") or {}
+        cursor = page_info.get("endCursor") if page_info.get("hasNextPage") else None
+    return edges
+
+
+async def _complete_nested_connections(client: ShopifyClient, orders: List[Dict[str, Any]]):
+    """Completează in-place conexiunile imbricate trunchiate de prima pagină."""
+    for order in orders:
+        for connection in NESTED_CONNECTIONS:
+            conn = order.get(connection) or {}
+            page_info = conn.get("pageInfo") or {}
+            if page_info.get("hasNextPage"):
+                extra_edges = await _fetch_remaining_nested(client, order["id"], connection, page_info.get("endCursor"))
+                conn.setdefault("edges", []).extend(extra_edges)
+                conn["pageInfo"] = {"hasNextPage": False, "endCursor": None}
+
+
+class OrderPage(NamedTuple):
+    """O pagină de comenzi și token-ul de reluare de după ea."""
+    orders: List[Dict[str, Any]]
+    # Cursorul GraphQL (`endCursor`) sau "bulk:<id operație>:<pagini procesate>"
+    resume_token: Optional[str]
+
+
+def _orders_search(since_days: Optional[int], updated_since: Optional[datetime], created_since: Optional[datetime] = None) -> Tuple[str, str, bool]:
+    """Returnează (query, sortKey, reverse) pentru fereastra de sincronizare cerută."""
+    if updated_since is not None:
+        # Incremental: doar comenzile modificate, în ordine cronologică
+        return f"updated_at:>'{updated_since.isoformat()}'", "UPDATED_AT", False
+    since_date = created_since or datetime.now(timezone.utc) - timedelta(days=since_days)
+    return f"created_at:>{since_date.isoformat()}", "CREATED_AT", True
+
+
+async def iter_order_pages(store: ShopifyStore, since_days: Optional[int] = None, updated_since: Optional[datetime] = None, page_size: int = ORDERS_PAGE_SIZE, created_since: Optional[datetime] = None, resume_from: Optional[str] = None) -> AsyncIterator[OrderPage]:
+    """
+    Generator asincron care parcurge toate comenzile din fereastra cerută folosind
+    cursorul `pageInfo.endCursor` și returnează câte o pagină completă (inclusiv
+    lineItems / fulfillmentOrders imbricate) imediat ce a sosit.
+    Cu `updated_since` se preiau doar comenzile modificate după acel moment,
+    altfel cele create după `created_since` (implicit: ultimele `since_days` zile).
+    `resume_from` continuă de după o pagină returnată anterior (`OrderPage.resume_token`).
+    Erorile HTTP/GraphQL sunt propagate către apelant.
+    """
+    search_query, sort_key, reverse = _orders_search(since_days, updated_since, created_since)
+
+    if store.pii_source == 'shopify':
+        logging.warning(f"Se preiau datele PII din Shopify API pentru {store.domain}")
+
     query = f"""
+    query OrdersPage($first: Int!, $after: String, $query: String) {{
+        orders(first: $first, after: $after, sortKey: {sort_key}, reverse: {str(reverse).lower()}, query: $query) {{
+            pageInfo {{ hasNextPage endCursor }}
+            edges {{
+                node {{
+                    {_order_fields(store)}
+                }}
+            }}
+        }}
+    }}
+    """
+
+    cursor: Optional[str] = resume_from
+    client = get_shopify_client(store)
+    while True:
+        variables = {"first": page_size, "after": cursor, "query": search_query}
+        data = await _post_graphql(client, query, variables)
+        orders_conn = data.get("orders") or {}
+        orders = [edge["node"] for edge in orders_conn.get("edges", [])]
+        await _complete_nested_connections(client, orders)
+        page_info = orders_conn.get("pageInfo") or {}
+        if orders:
+            yield OrderPage(orders, page_info.get("endCursor") or cursor)
+
+        if not page_info.get("hasNextPage"):
+            break
+        cursor = page_info.get("endCursor")
+
+
+# --- Bulk Operations (pentru sincronizări totale / ferestre mari) ---
+
+BULK_FINAL_STATUSES = {"COMPLETED", "FAILED", "CANCELED", "EXPIRED"}
+
+# Tipul de obiect din GID -> conexiunea din comanda-părinte
+BULK_CHILD_CONNECTIONS = {
+    "LineItem": "lineItems",
+    "FulfillmentOrder": "fulfillmentOrders",
+}
+
+
+async def _start_bulk_orders_query(client: ShopifyClient, search_query: str) -> str:
+    """Pornește un `bulkOperationRunQuery` pentru comenzi și returnează ID-ul operației."""
+    bulk_query = f"""
     {{
-        orders(first: 250, sortKey: CREATED_AT, reverse: true, query: "created_at:>{since_str}") {{
+        orders(query: "{search_query}") {{
             edges {{
                 node {{
-                    id
-                    name
-                    createdAt
-                    cancelledAt
-                    displayFinancialStatus
-                    displayFulfillmentStatus
-                    tags
-                    note
-                    totalPriceSet {{ shopMoney {{ amount }} }}
-                    paymentGatewayNames
-                    {shipping_address_query_part}
-                    metafield(namespace: "custom", key: "adresa") {{
-                        value
-                    }}
-                    lineItems(first: 50) {{ edges {{ node {{ sku, title, quantity }} }} }}
-                    fulfillments {{ createdAt, trackingInfo {{ company, number, url }}, id }}
-                    fulfillmentOrders(first: 10) {{ edges {{ node {{ status, fulfillmentHolds {{ reason, reasonNotes }} }} }} }}
+                    {_order_fields(client.store, bulk=True)}
                 }}
             }}
         }}
     }}
     """
-    
-    url = f"https://{store.domain}/admin/api/{store.api_version}/graphql.json"
-    headers = {
-        "X-Shopify-Access-Token": store.access_token,
-        "Content-Type": "application/json",
+    mutation = """
+    mutation RunBulkOrders($query: String!) {
+        bulkOperationRunQuery(query: $query) {
+            bulkOperation { id status }
+            userErrors { field message }
+        }
     }
-    payload = {"query": query}
+    """
+    data = await _post_graphql(client, mutation, {"query": bulk_query})
+    result = data.get("bulkOperationRunQuery") or {}
+    if result.get("userErrors"):
+        raise RuntimeError(f"Bulk operation respinsă pentru {client.store.domain}: {result['userErrors']}")
+    return result["bulkOperation"]["id"]
+
+
+async def _wait_for_bulk_operation(client: ShopifyClient, operation_id: str, poll_interval: float) -> Optional[str]:
+    """Așteaptă finalizarea operației și returnează URL-ul fișierului JSONL (None dacă nu există date)."""
+    query = """
+    query BulkStatus($id: ID!) {
+        node(id: $id) {
+            ... on BulkOperation { id status errorCode objectCount url }
+        }
+    }
+    """
+    while True:
+        data = await _post_graphql(client, query, {"id": operation_id})
+        operation = data.get("node") or {}
+        status = operation.get("status")
+        if status in BULK_FINAL_STATUSES:
+            if status != "COMPLETED":
+                raise RuntimeError(f"Bulk operation {operation_id} pentru {client.store.domain} s-a încheiat cu {status} ({operation.get('errorCode')})")
+            logging.info(f"Bulk operation {operation_id} pentru {client.store.domain} finalizată: {operation.get('objectCount')} obiecte.")
+            return operation.get("url")
+        await asyncio.sleep(poll_interval)
+
+
+def _bulk_child_connection(gid: str) -> Optional[str]:
+    # gid://shopify/LineItem/123 -> "LineItem"
+    parts = (gid or "").split("/")
+    return BULK_CHILD_CONNECTIONS.get(parts[-2]) if len(parts) >= 2 else None
+
+
+async def _iter_bulk_result_pages(client: httpx.AsyncClient, url: str, page_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Citește fișierul JSONL linie cu linie și reconstruiește comenzile în aceeași formă
+    ca `iter_order_pages` (copiii sunt atașați după `__parentId`).
+    Shopify scrie fiecare copil după părintele lui, deci o comandă este completă
+    în momentul în care apare următoarea comandă.
+    """
+    page: List[Dict[str, Any]] = []
+    by_id: Dict[str, Dict[str, Any]] = {}
+    async with client.stream("GET", url, timeout=None) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            parent_id = row.pop("__parentId", None)
+
+            if parent_id is None:
+                if len(page) >= page_size:
+                    yield page
+                    page, by_id = [], {}
+                for connection in BULK_CHILD_CONNECTIONS.values():
+                    row.setdefault(connection, {"edges": []})
+                page.append(row)
+                by_id[row["id"]] = row
+                continue
+
+            parent = by_id.get(parent_id)
+            connection = _bulk_child_connection(row.get("id"))
+            if parent is None or connection is None:
+                logging.warning(f"Rând bulk ignorat (părinte {parent_id} negăsit sau tip necunoscut): {row.get('id')}")
+                continue
+            parent[connection]["edges"].append({"node": row})
+
+    if page:
+        yield page
+
+
+def _parse_bulk_resume_token(token: Optional[str]) -> Tuple[Optional[str], int]:
+    # "bulk:gid://shopify/BulkOperation/1:3" -> ("gid://shopify/BulkOperation/1", 3)
+    if not token or not token.startswith("bulk:"):
+        return None, 0
+    operation_id, _, pages_done = token[len("bulk:"):].rpartition(":")
+    return (operation_id or None), int(pages_done or 0)
+
+
+async def iter_bulk_order_pages(store: ShopifyStore, since_days: Optional[int] = None, updated_since: Optional[datetime] = None, page_size: int = ORDERS_PAGE_SIZE, poll_interval: Optional[float] = None, created_since: Optional[datetime] = None, resume_from: Optional[str] = None) -> AsyncIterator[OrderPage]:
+    """
+    Alternativă la `iter_order_pages` pentru volume mari: trimite un
+    `bulkOperationRunQuery`, așteaptă finalizarea și apoi parcurge rezultatul JSONL
+    în flux, returnând pagini de comenzi în același format.
+    La reluare (`resume_from`) se refolosește rezultatul operației existente și se
+    sar paginile deja procesate; dacă rezultatul nu mai este disponibil, se pornește
+    o operație nouă.
+    """
+    search_query, _, _ = _orders_search(since_days, updated_since, created_since)
+    poll_interval = settings.SHOPIFY_BULK_POLL_SECONDS if poll_interval is None else poll_interval
 
-    async with httpx.AsyncClient() as client:
+    client = get_shopify_client(store)
+    operation_id, pages_done = _parse_bulk_resume_token(resume_from)
+    url = None
+    if operation_id:
         try:
-            response = await client.post(url, json=payload, headers=headers, timeout=60.0)
-            response.raise_for_status()
-            data = response.json()
-            if "errors" in data:
-                logging.error(f"Eroare GraphQL pentru {store.domain}: {data['errors']}")
-                return []
-            return [edge["node"] for edge in data.get("data", {}).get("orders", {}).get("edges", [])]
-        except httpx.HTTPStatusError as e:
-            logging.error(f"Eroare HTTP la preluarea comenzilor pentru {store.domain}: {e.response.status_code} - {e.response.text}")
-        except Exception as e:
-            logging.error(f"Eroare neașteptată la preluarea comenzilor pentru {store.domain}: {e}")
-            
-    return []
+            url = await _wait_for_bulk_operation(client, operation_id, poll_interval)
+            logging.warning(f"Bulk operation {operation_id} reluată pentru {store.domain} după {pages_done} pagini.")
+        except RuntimeError as e:
+            logging.warning(f"Bulk operation {operation_id} nu mai poate fi reluată ({e}); se pornește una nouă.")
+            operation_id, pages_done = None, 0
+
+    if not operation_id:
+        operation_id = await _start_bulk_orders_query(client, search_query.replace('"', '\\"'))
+        logging.warning(f"Bulk operation {operation_id} pornită pentru {store.domain} ({search_query}).")
+        url = await _wait_for_bulk_operation(client, operation_id, poll_interval)
+    if not url:
+        return
+    # Fișierul rezultat este pe un URL semnat extern: fără token și fără buget Shopify
+    page_number = 0
+    async for page in _iter_bulk_result_pages(client.http, url, page_size):
+        page_number += 1
+        if page_number <= pages_done:
+            continue
+        yield OrderPage(page, f"bulk:{operation_id}:{page_number}")
 
 
 async def get_open_fulfillment_order_id(store_cfg: ShopifyStore, order_gid: str) -> Optional[str]:
     """Interoghează Shopify pentru a găsi ID-ul primului FulfillmentOrder deschis."""
-    api_version = store_cfg.api_version
-    url = f"https://{store_cfg.domain}/admin/api/{api_version}/graphql.json"
-    headers = {'X-Shopify-Access-Token': store_cfg.access_token, 'Content-Type': 'application/json'}
-    
     query = """
     query GetFFOrders($id: ID!) { 
       order(id: $id) { 
@@ -97,27 +364,19 @@ async def get_open_fulfillment_order_id(store_cfg: ShopifyStore, order_gid: str)
       } 
     }
     """
-    body = {"query": query, "variables": {"id": order_gid}}
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.post(url, json=body, headers=headers)
-            r.raise_for_status()
-            fulfillment_orders = r.json().get("data", {}).get("order", {}).get("fulfillmentOrders", {}).get("edges", [])
-            if not fulfillment_orders:
-                logging.warning(f"Niciun FulfillmentOrder deschis găsit pentru comanda {order_gid}.")
-                return None
-            return fulfillment_orders[0]['node']['id']
-        except Exception as e:
-            logging.error(f"Excepție la găsirea FulfillmentOrder pentru {order_gid}: {e}", exc_info=True)
+    try:
+        response_data = await get_shopify_client(store_cfg).graphql(query, {"id": order_gid}, timeout=30.0)
+        fulfillment_orders = response_data.get("data", {}).get("order", {}).get("fulfillmentOrders", {}).get("edges", [])
+        if not fulfillment_orders:
+            logging.warning(f"Niciun FulfillmentOrder deschis găsit pentru comanda {order_gid}.")
             return None
+        return fulfillment_orders[0]['node']['id']
+    except Exception as e:
+        logging.error(f"Excepție la găsirea FulfillmentOrder pentru {order_gid}: {e}", exc_info=True)
+        return None
 
 async def hold_fulfillment_order(store_cfg: ShopifyStore, fulfillment_order_id: str) -> bool:
     """Apelează mutația GraphQL pentru a pune un FulfillmentOrder pe 'hold'."""
-    api_version = store_cfg.api_version
-    url = f"https://{store_cfg.domain}/admin/api/{api_version}/graphql.json"
-    headers = {'X-Shopify-Access-Token': store_cfg.access_token, 'Content-Type': 'application/json'}
-    
     mutation = """
     mutation fulfillmentOrderHold($id: ID!) {
       fulfillmentOrderHold(id: $id) {
@@ -132,28 +391,20 @@ async def hold_fulfillment_order(store_cfg: ShopifyStore, fulfillment_order_id:
       }
     }
     """
-    body = {"query": mutation, "variables": {"id": fulfillment_order_id}}
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.post(url, json=body, headers=headers)
-            r.raise_for_status()
-            response_data = r.json()
-            user_errors = response_data.get("data", {}).get("fulfillmentOrderHold", {}).get("userErrors", [])
-            if user_errors:
-                logging.error(f"Eroare la punerea pe hold a {fulfillment_order_id}: {user_errors}")
-                return False
-            logging.info(f"FulfillmentOrder {fulfillment_order_id} a fost pus pe hold cu succes.")
-            return True
-        except Exception as e:
-            logging.error(f"Excepție la punerea pe hold a {fulfillment_order_id}: {e}", exc_info=True)
+    try:
+        response_data = await get_shopify_client(store_cfg).graphql(mutation, {"id": fulfillment_order_id}, timeout=30.0)
+        user_errors = response_data.get("data", {}).get("fulfillmentOrderHold", {}).get("userErrors", [])
+        if user_errors:
+            logging.error(f"Eroare la punerea pe hold a {fulfillment_order_id}: {user_errors}")
             return False
+        logging.info(f"FulfillmentOrder {fulfillment_order_id} a fost pus pe hold cu succes.")
+        return True
+    except Exception as e:
+        logging.error(f"Excepție la punerea pe hold a {fulfillment_order_id}: {e}", exc_info=True)
+        return False
 
 async def _update_existing_fulfillment(store_cfg: ShopifyStore, fulfillment_gid: str, tracking_info: Dict[str, str]) -> bool:
     logging.info(f"Crearea unui eveniment 'LABEL_PRINTED' pentru fulfillment-ul: {fulfillment_gid}")
-    api_version = store_cfg.api_version
-    url = f"https://{store_cfg.domain}/admin/api/{api_version}/graphql.json"
-    headers = {'X-Shopify-Access-Token': store_cfg.access_token, 'Content-Type': 'application/json'}
     mutation = """
     mutation fulfillmentEventCreate($fulfillmentEvent: FulfillmentEventInput!) {
       fulfillmentEventCreate(fulfillmentEvent: $fulfillmentEvent) {
@@ -163,54 +414,45 @@ async def _update_existing_fulfillment(store_cfg: ShopifyStore, fulfillment_gid:
     }
     """
     variables = { "fulfillmentEvent": { "fulfillmentId": fulfillment_gid, "status": "LABEL_PRINTED", "happenedAt": datetime.now(timezone.utc).isoformat() } }
-    body = {"query": mutation, "variables": variables}
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.post(url, json=body, headers=headers)
-            r.raise_for_status()
-            response_data = r.json()
-            if 'errors' in response_data:
-                logging.error(f"Eroare GraphQL de la Shopify pentru fulfillment {fulfillment_gid}: {response_data['errors']}")
-                return False
-            data = response_data.get("data")
-            if not data:
-                logging.warning(f"Răspunsul de la Shopify pentru {fulfillment_gid} nu conține 'data'. Răspuns: {response_data}")
-                return False
-            fulfillment_event_create = data.get("fulfillmentEventCreate")
-            if not fulfillment_event_create:
-                logging.warning(f"Răspunsul pentru {fulfillment_gid} nu conține 'fulfillmentEventCreate', posibil deja procesat. Răspuns: {data}")
-                return True
-            user_errors = fulfillment_event_create.get("userErrors", [])
-            if user_errors:
-                logging.error(f"Eroare la crearea evenimentului pentru fulfillment {fulfillment_gid}: {user_errors}")
-                return False
-            logging.info(f"Eveniment 'LABEL_PRINTED' creat cu succes pentru fulfillment-ul {fulfillment_gid}.")
+    try:
+        response_data = await get_shopify_client(store_cfg).graphql(mutation, variables, timeout=30.0)
+        if 'errors' in response_data:
+            logging.error(f"Eroare GraphQL de la Shopify pentru fulfillment {fulfillment_gid}: {response_data['errors']}")
+            return False
+        data = response_data.get("data")
+        if not data:
+            logging.warning(f"Răspunsul de la Shopify pentru {fulfillment_gid} nu conține 'data'. Răspuns: {response_data}")
+            return False
+        fulfillment_event_create = data.get("fulfillmentEventCreate")
+        if not fulfillment_event_create:
+            logging.warning(f"Răspunsul pentru {fulfillment_gid} nu conține 'fulfillmentEventCreate', posibil deja procesat. Răspuns: {data}")
             return True
-        except Exception as e:
-            logging.error(f"Excepție la crearea evenimentului pentru fulfillment {fulfillment_gid}: {e}", exc_info=True)
+        user_errors = fulfillment_event_create.get("userErrors", [])
+        if user_errors:
+            logging.error(f"Eroare la crearea evenimentului pentru fulfillment {fulfillment_gid}: {user_errors}")
             return False
+        logging.info(f"Eveniment 'LABEL_PRINTED' creat cu succes pentru fulfillment-ul {fulfillment_gid}.")
+        return True
+    except Exception as e:
+        logging.error(f"Excepție la crearea evenimentului pentru fulfillment {fulfillment_gid}: {e}", exc_info=True)
+        return False
 
 async def _create_fulfillment_from_order(store_cfg: ShopifyStore, order_gid: str, tracking_info: Dict[str, str]) -> bool:
     logging.info(f"Încercare de a crea un fulfillment nou pentru comanda: {order_gid}")
-    api_version = store_cfg.api_version
-    url = f"https://{store_cfg.domain}/admin/api/{api_version}/graphql.json"
-    headers = {'X-Shopify-Access-Token': store_cfg.access_token, 'Content-Type': 'application/json'}
+    client = get_shopify_client(store_cfg)
     get_ff_order_query = """
     query GetFFOrders($id: ID!) { order(id: $id) { fulfillmentOrders(first: 5, query: "status:open") { edges { node { id } } } } }
     """
-    body_step1 = {"query": get_ff_order_query, "variables": {"id": order_gid}}
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.post(url, json=body_step1, headers=headers)
-            r.raise_for_status()
-            fulfillment_orders = r.json().get("data", {}).get("order", {}).get("fulfillmentOrders", {}).get("edges", [])
-            if not fulfillment_orders:
-                logging.warning(f"Niciun FulfillmentOrder deschis găsit pentru comanda {order_gid}.")
-                return False
-            fulfillment_order_id = fulfillment_orders[0]['node']['id']
-        except Exception as e:
-            logging.error(f"Excepție la găsirea FulfillmentOrder pentru {order_gid}: {e}", exc_info=True)
+    try:
+        response_data = await client.graphql(get_ff_order_query, {"id": order_gid}, timeout=30.0)
+        fulfillment_orders = response_data.get("data", {}).get("order", {}).get("fulfillmentOrders", {}).get("edges", [])
+        if not fulfillment_orders:
+            logging.warning(f"Niciun FulfillmentOrder deschis găsit pentru comanda {order_gid}.")
             return False
+        fulfillment_order_id = fulfillment_orders[0]['node']['id']
+    except Exception as e:
+        logging.error(f"Excepție la găsirea FulfillmentOrder pentru {order_gid}: {e}", exc_info=True)
+        return False
     create_ff_mutation = """
     mutation fulfillmentCreateV2($fulfillment: FulfillmentV2Input!) {
       fulfillmentCreateV2(fulfillment: $fulfillment) {
@@ -220,20 +462,17 @@ async def _create_fulfillment_from_order(store_cfg: ShopifyStore, order_gid: str
     }
     """
     variables_step2 = { "fulfillment": { "notifyCustomer": False, "trackingInfo": tracking_info, "lineItemsByFulfillmentOrder": [{"fulfillmentOrderId": fulfillment_order_id}] } }
-    body_step2 = {"query": create_ff_mutation, "variables": variables_step2}
-    async with httpx.AsyncClient(timeout=45.0) as client:
-        try:
-            r = await client.post(url, json=body_step2, headers=headers)
-            r.raise_for_status()
-            user_errors = r.json().get("data", {}).get("fulfillmentCreateV2", {}).get("userErrors", [])
-            if user_errors:
-                logging.error(f"Eroare la crearea fulfillment-ului pentru {order_gid}: {user_errors}")
-                return False
-            logging.info(f"Fulfillment creat cu succes pentru comanda {order_gid}.")
-            return True
-        except Exception as e:
-            logging.error(f"Excepție la crearea fulfillment-ului pentru {order_gid}: {e}", exc_info=True)
+    try:
+        response_data = await client.graphql(create_ff_mutation, variables_step2, timeout=45.0)
+        user_errors = response_data.get("data", {}).get("fulfillmentCreateV2", {}).get("userErrors", [])
+        if user_errors:
+            logging.error(f"Eroare la crearea fulfillment-ului pentru {order_gid}: {user_errors}")
             return False
+        logging.info(f"Fulfillment creat cu succes pentru comanda {order_gid}.")
+        return True
+    except Exception as e:
+        logging.error(f"Excepție la crearea fulfillment-ului pentru {order_gid}: {e}", exc_info=True)
+        return False
 
 async def notify_shopify_of_shipment(store_cfg: ShopifyStore, order_gid: str, fulfillment_id: Optional[str], tracking_info: Dict[str, str]) -> bool:
     if fulfillment_id:
@@ -245,33 +484,29 @@ async def notify_shopify_of_shipment(store_cfg: ShopifyStore, order_gid: str, fu
 class ShopifyAdminAPI:
     """A client to interact with the Shopify Admin REST API."""
     def __init__(self, store: models.Store):
-        store_config = next((s for s in settings.SHOPIFY_STORES if s.domain == store.domain), None)
-        if not store_config:
+        if not store.access_token:
             raise ValueError(f"Store config not found for {store.domain}")
-        
-        self.base_url = f"https://{store.domain}/admin/api/{store_config.api_version}"
-        self.headers = {"X-Shopify-Access-Token": store_config.access_token}
+        self.client = get_shopify_client(store_config_from_db(store))
+        self.base_url = self.client.rest_base_url
 
     async def get_existing_webhooks(self) -> List[Dict[str, Any]]:
         """Fetches all currently registered webhooks for the store."""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(f"{self.base_url}/webhooks.json", headers=self.headers)
-                response.raise_for_status()
-                return response.json().get("webhooks", [])
-            except httpx.HTTPStatusError as e:
-                logging.error(f"Failed to get webhooks for {self.base_url}: {e.response.text}")
-                return []
+        try:
+            response = await self.client.rest("GET", "webhooks.json")
+            response.raise_for_status()
+            return response.json().get("webhooks", [])
+        except httpx.HTTPStatusError as e:
+            logging.error(f"Failed to get webhooks for {self.base_url}: {e.response.text}")
+            return []
 
     async def create_webhook(self, topic: str, address: str) -> bool:
         """Creates a new webhook subscription."""
         payload = {"webhook": {"topic": topic, "address": address, "format": "json"}}
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(f"{self.base_url}/webhooks.json", headers=self.headers, json=payload)
-                response.raise_for_status()
-                logging.info(f"Successfully created webhook '{topic}' for {self.base_url}")
-                return True
-            except httpx.HTTPStatusError as e:
-                logging.error(f"Failed to create webhook '{topic}' for {self.base_url}: {e.response.text}")
-                return False
+        try:
+            response = await self.client.rest("POST", "webhooks.json", json=payload)
+            response.raise_for_status()
+            logging.info(f"Successfully created webhook '{topic}' for {self.base_url}")
+            return True
+        except httpx.HTTPStatusError as e:
+            logging.error(f"Failed to create webhook '{topic}' for {self.base_url}: {e.response.text}")
+            return False
@@ -0,0 +1,141 @@
+# services/status_classifier.py
+
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from settings import settings
+
+STATUS_MAP_PATH = 'config/courier_status_map.json'
+
+_NON_WORD = re.compile(r'[^\w]+')
+# Statusurile care conțin date variabile (ex. numele orașului) nu trebuie să crească memo-ul nelimitat
+_MEMO_MAX_SIZE = 10000
+
+
+def normalize_status(raw: str) -> str:
+    """'Coletul a fost ridicat.' -> 'coletul a fost ridicat' (fără diacritice, punctuație și spații multiple)."""
+    text = unicodedata.normalize('NFKD', raw).encode('ascii', 'ignore').decode('ascii')
+    return _NON_WORD.sub(' ', text.casefold()).strip()
+
+
+class CourierStatusClassifier:
+    """
+    Clasifică statusul brut al curierului în grupul din `courier_status_map.json`
+    (processed, shipped, ..., delivered). Harta este compilată o singură dată:
+    - potrivire exactă (lowercase), apoi pe forma normalizată (`normalize_status`);
+    - reguli: o intrare terminată în `*` este prefix ("Returned to*"), iar una care
+      începe cu `re:` este expresie regulată pe forma normalizată ("re:^retur");
+    - rezultatul pentru statusurile noi este memorat, deci fiecare șir distinct este
+      evaluat pe reguli o singură dată.
+    Fișierul este recitit când i se schimbă mtime-ul (verificat cel mult o dată la
+    STATUS_MAP_RELOAD_CHECK_SECONDS). Statusurile nemapate sunt numărate.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._exact: Dict[str, str] = {}
+        self._normalized: Dict[str, str] = {}
+        self._prefixes: List[Tuple[str, str]] = []
+        self._patterns: List[Tuple[Pattern, str]] = []
+        self._memo: Dict[str, Optional[str]] = {}
+        self.unmapped: Counter = Counter()
+        self._compile(settings.COURIER_STATUS_MAP or {})
+        self._mtime = self._current_mtime()
+
+    def _current_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def _compile(self, status_map: dict):
+        exact, normalized, prefixes, patterns = {}, {}, [], []
+        for group, (_, statuses) in status_map.items():
+            for entry in statuses:
+                entry = entry.strip()
+                if entry.startswith('re:'):
+                    try:
+                        patterns.append((re.compile(entry[3:].strip()), group))
+                    except re.error as e:
+                        logging.error(f"Regulă invalidă '{entry}' în {self.path}: {e}")
+                elif entry.endswith('*'):
+                    prefixes.append((normalize_status(entry[:-1]), group))
+                else:
+                    exact.setdefault(entry.lower(), group)
+                    normalized.setdefault(normalize_status(entry), group)
+        # Prefixele cele mai lungi (mai specifice) au prioritate
+        prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+        self._exact, self._normalized, self._prefixes, self._patterns = exact, normalized, prefixes, patterns
+        self._memo = {}
+        self.unmapped = Counter()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < settings.STATUS_MAP_RELOAD_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        mtime = self._current_mtime()
+        if mtime is None or mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                status_map = json.load(f)
+        except (OSError, ValueError) as e:
+            # Un fișier salvat pe jumătate sau invalid nu înlocuiește harta curentă
+            logging.error(f"Nu s-a putut reîncărca {self.path}: {e}")
+            return
+        self._mtime = mtime
+        settings.COURIER_STATUS_MAP = status_map
+        self._compile(status_map)
+        logging.warning(f"Harta statusurilor de curier a fost reîncărcată ({len(self._exact)} statusuri, {len(self._prefixes) + len(self._patterns)} reguli).")
+
+    def _match_rules(self, raw: str) -> Optional[str]:
+        normalized = normalize_status(raw)
+        group = self._normalized.get(normalized)
+        if group:
+            return group
+        for prefix, group in self._prefixes:
+            if normalized.startswith(prefix):
+                return group
+        for pattern, group in self._patterns:
+            if pattern.search(normalized):
+                return group
+        return None
+
+    def classify(self, raw_status: Optional[str], record_unmapped: bool = True) -> Optional[str]:
+        """Grupul statusului brut sau None dacă nu este mapat (numărat în `unmapped` dacă `record_unmapped`)."""
+        self._maybe_reload()
+        key = (raw_status or '').strip().lower()
+        if not key:
+            return None
+        group = self._exact.get(key)
+        if group:
+            return group
+        if key in self._memo:
+            group = self._memo[key]
+        else:
+            if len(self._memo) >= _MEMO_MAX_SIZE:
+                self._memo.clear()
+            group = self._memo[key] = self._match_rules(key)
+        if group is None and record_unmapped:
+            # Statusurile deja numărate continuă să crească; altele noi intră doar sub limită
+            # (statusurile cu date variabile - date, depozite - nu trebuie să umple memoria)
+            unmapped_key = raw_status.strip()
+            if unmapped_key in self.unmapped or len(self.unmapped) < _MEMO_MAX_SIZE:
+                self.unmapped[unmapped_key] += 1
+        return group
+
+    def unmapped_statuses(self, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Statusurile nemapate întâlnite de la ultima (re)încărcare, cele mai frecvente primele."""
+        return self.unmapped.most_common(limit)
+
+
+status_classifier = CourierStatusClassifier(STATUS_MAP_PATH)
@@ -2,310 +2,268 @@
 
 import asyncio
 import logging
-import json
-from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any, Tuple
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, timedelta
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator
 
 from sqlalchemy.orm import joinedload
-from sqlalchemy import select, func
+from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import models
-from settings import settings, ShopifyStore
-from . import shopify_service, address_service, courier_service
-from .utils import calculate_and_set_derived_status
+from settings import settings
+from . import shopify_service, address_service, courier_service, ingest_service
+from .utils import calculate_and_set_derived_status, _dt, map_payment_method, _get_mapped_address
+from .courier_mapping_cache import courier_mapping_cache
 from websocket_manager import manager
+from database import AsyncSessionLocal, engine
 
-def _dt(v: Optional[str]) -> Optional[datetime]:
-    if not v: return None
+async def courier_from_shopify(db: AsyncSession, tracking_company: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Map a tracking company string from Shopify to our specific courier account.
+    Case-insensitive, exact match on CourierMapping, served from the in-process cache.
+    """
+    courier_type, account_key = await courier_mapping_cache.resolve(db, tracking_company)
+    if not account_key and (tracking_company or '').strip():
+        logging.warning(f"Nu s-a găsit nicio mapare exactă și activă pentru curierul: '{tracking_company.strip()}'")
+    return courier_type, account_key
+
+
+async def _recalculate_orders(db: AsyncSession, order_ids: List[int]):
+    """Validează adresele și recalculează statusurile pentru comenzile date."""
+    if not order_ids:
+        return
+    orders_to_recalc_res = await db.execute(select(models.Order).options(joinedload(models.Order.shipments)).where(models.Order.id.in_(order_ids)))
+    orders_to_recalc = orders_to_recalc_res.unique().scalars().all()
+    for order in orders_to_recalc:
+        if order.address_status != 'valid':
+            await address_service.validate_address_for_order(db, order)
+        calculate_and_set_derived_status(order)
+
+
+async def _prefetch_pages(pages: AsyncIterator[shopify_service.OrderPage]) -> AsyncIterator[shopify_service.OrderPage]:
+    """
+    Returnează paginile din `pages`, pornind cererea pentru pagina N+1 înainte ca
+    apelantul să înceapă procesarea paginii N.
+    """
+    next_page = asyncio.ensure_future(pages.__anext__())
     try:
-        return datetime.fromisoformat(v.replace('Z', '+00:00'))
-    except (ValueError, TypeError):
+        while True:
+            try:
+                page = await next_page
+            except StopAsyncIteration:
+                return
+            next_page = asyncio.ensure_future(pages.__anext__())
+            yield page
+    finally:
+        if not next_page.done():
+            next_page.cancel()
+
+
+class _SyncProgress:
+    """Agregă progresul worker-ilor per magazin în mesajele `progress_update` existente."""
+
+    def __init__(self):
+        self.updated = 0
+        self.skipped = 0
+        self.per_store: Dict[str, int] = {}
+
+    async def add(self, store_name: str, updated: int, skipped: int):
+        self.updated += updated
+        self.skipped += skipped
+        self.per_store[store_name] = self.per_store.get(store_name, 0) + updated + skipped
+        await manager.broadcast({
+            "type": "progress_update",
+            "current": self.updated + self.skipped,
+            "total": None,
+            "stores": self.per_store,
+            "message": f"Se procesează... ({self.updated} actualizate, {self.skipped} neschimbate, {len(self.per_store)} magazine)",
+        })
+
+
+async def _load_checkpoint(db: AsyncSession, store_id: int, full_sync: bool) -> Optional[models.SyncCheckpoint]:
+    """Returnează checkpoint-ul unei rulări întrerupte care trebuie reluată (sau None)."""
+    checkpoint = (await db.execute(
+        select(models.SyncCheckpoint).where(models.SyncCheckpoint.store_id == store_id)
+    )).scalar_one_or_none()
+    if checkpoint and full_sync and not checkpoint.full_sync:
+        # O sincronizare totală cerută explicit înlocuiește o rulare incrementală întreruptă
+        await db.delete(checkpoint)
+        await db.commit()
         return None
+    return checkpoint
 
-def map_payment_method(gateways: List[str], financial_status: str) -> str:
-    raw_gateways = gateways or []
-    lower_gateways_set = {g.lower().strip() for g in raw_gateways}
-    gateway_str_joined = ", ".join(raw_gateways).lower()
 
-    if settings.PAYMENT_MAP:
-        for standard_name, keywords in settings.PAYMENT_MAP.items():
-            if not lower_gateways_set.isdisjoint(keywords):
-                return standard_name
-            if any(keyword in gateway_str_joined for keyword in keywords):
-                return standard_name
+# Spațiul de chei pentru advisory lock-urile de sincronizare (pg_try_advisory_lock(namespace, store_id))
+_SYNC_LOCK_NAMESPACE = 0x5359
 
-    if not gateway_str_joined.strip():
-        if financial_status == 'paid': return "Fara plata"
-        if financial_status == 'pending': return "Ramburs"
 
-    return ", ".join(raw_gateways)
+@asynccontextmanager
+async def _store_sync_lock(store_id: int):
+    """
+    Advisory lock Postgres pe magazin, valabil între procese (workerii uvicorn, task-ul periodic,
+    rutele /sync/*). Este ținut pe o conexiune dedicată, în autocommit, pentru toată durata
+    sincronizării magazinului; dacă procesul moare, conexiunea se închide și lock-ul se eliberează.
+    Produce False dacă magazinul este deja sincronizat de altcineva.
+    """
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        acquired = (await conn.execute(
+            text("SELECT pg_try_advisory_lock(:ns, :store_id)"), {"ns": _SYNC_LOCK_NAMESPACE, "store_id": store_id}
+        )).scalar()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                await conn.execute(text("SELECT pg_advisory_unlock(:ns, :store_id)"), {"ns": _SYNC_LOCK_NAMESPACE, "store_id": store_id})
 
 
-async def courier_from_shopify(db: AsyncSession, tracking_company: str) -> Tuple[Optional[str], Optional[str]]:
+async def _sync_store(store_id: int, run_id: str, days: int, full_sync: bool, use_bulk: Optional[bool], progress: _SyncProgress) -> bool:
     """
-    Map a tracking company string from Shopify to our specific courier account.
-    This uses the CourierMapping table for a case-insensitive, exact match.
+    Worker pentru un singur magazin, cu propria sesiune. Fiecare pagină (≤ ORDERS_PAGE_SIZE
+    comenzi) este salvată împreună cu checkpoint-ul magazinului, în același commit, așa că
+    o eroare sau o repornire a procesului nu pierde paginile deja scrise: următoarea
+    rulare continuă de la ultimul checkpoint.
+    Returnează False (fără să sincronizeze) dacă magazinul este deja sincronizat de altă rulare.
     """
-    search_text = (tracking_company or '').strip()
-    if not search_text:
-        return None, None
-
-    # MODIFICARE: Folosim func.lower() pentru o comparație case-insensitive
-    stmt = (
-        select(models.CourierMapping)
-        .options(joinedload(models.CourierMapping.account))
-        .where(func.lower(models.CourierMapping.shopify_name) == search_text.lower())
-    )
-    result = await db.execute(stmt)
-    mapping = result.scalar_one_or_none()
-
-    if mapping and mapping.account and mapping.account.is_active:
-        logging.info(f"Mapare găsită pentru '{search_text}'. Folosim contul: {mapping.account.account_key} ({mapping.account.courier_type})")
-        return mapping.account.courier_type, mapping.account.account_key
-
-    logging.warning(f"Nu s-a găsit nicio mapare exactă și activă pentru curierul: '{search_text}'")
-    return None, None
-
-
-
-def _get_mapped_address(order_data: Dict[str, Any], pii_source: str) -> Dict[str, Any]:
-    """Funcție helper pentru a extrage și mapa adresa PII din diverse surse."""
-    address = {}
-    
-    if pii_source == 'shopify':
-        source = order_data.get('shippingAddress')
-        if not source:
-            return address
-        
-        first_name = source.get('firstName', '')
-        last_name = source.get('lastName', '')
-        
-        address = {
-            'name': f"{first_name} {last_name}".strip(),
-            'address1': source.get('address1'),
-            'address2': source.get('address2'),
-            'phone': source.get('phone'),
-            'city': source.get('city'),
-            'zip': source.get('zip'),
-            'province': source.get('province'),
-            'country': source.get('country'),
-            'email': order_data.get('email')
-        }
-
-    elif pii_source == 'metafield':
-        source_node = order_data.get('metafield')
-        if not source_node or not source_node.get('value'):
-            return address
-        
+    async with _store_sync_lock(store_id) as acquired:
+        if not acquired:
+            return False
+        await _sync_store_locked(store_id, run_id, days, full_sync, use_bulk, progress)
+        return True
+
+
+async def _sync_store_locked(store_id: int, run_id: str, days: int, full_sync: bool, use_bulk: Optional[bool], progress: _SyncProgress):
+    async with AsyncSessionLocal() as db:
+        store_rec = await db.get(models.Store, store_id)
+        s = shopify_service.store_config_from_db(store_rec)
+
+        checkpoint = await _load_checkpoint(db, store_id, full_sync)
+        if checkpoint:
+            logging.warning(f"ORDER SYNC: {s.domain} - se reia rularea {checkpoint.run_id} după {checkpoint.pages_done} pagini ({checkpoint.orders_done} comenzi deja salvate).")
+        else:
+            updated_since = None
+            if not full_sync and store_rec.last_sync_at:
+                updated_since = store_rec.last_sync_at - timedelta(minutes=settings.SYNC_INCREMENTAL_OVERLAP_MINUTES)
+                logging.info(f"ORDER SYNC: {s.domain} - comenzi modificate după {updated_since.isoformat()}")
+
+            # Watermark-ul este momentul dinaintea primei cereri, ca nimic modificat în timpul rulării să nu fie pierdut
+            store_watermark = datetime.now(timezone.utc)
+            bulk = use_bulk if use_bulk is not None else days >= settings.SHOPIFY_BULK_MIN_DAYS
+            checkpoint = models.SyncCheckpoint(
+                store_id=store_id,
+                run_id=run_id,
+                full_sync=full_sync,
+                use_bulk=bulk and updated_since is None,
+                created_since=None if updated_since else store_watermark - timedelta(days=days),
+                updated_since=updated_since,
+                watermark=store_watermark,
+                pages_done=0,
+                orders_done=0,
+            )
+            db.add(checkpoint)
+            await db.commit()
+
+        fetch_pages = shopify_service.iter_bulk_order_pages if checkpoint.use_bulk else shopify_service.iter_order_pages
         try:
-            metafield_data = json.loads(source_node['value'])
-            address = {
-                'name': f"{metafield_data.get('first_name', '')} {metafield_data.get('last_name', '')}".strip(),
-                'address1': metafield_data.get('address1'),
-                'address2': metafield_data.get('address2'),
-                'phone': metafield_data.get('phone_number'),
-                'city': metafield_data.get('city'),
-                'zip': metafield_data.get('postal_code'),
-                'province': metafield_data.get('county'),
-                'country': metafield_data.get('country'),
-                'email': metafield_data.get('email')
-            }
-        except json.JSONDecodeError:
-            logging.warning(f"Nu s-a putut decoda metafield-ul PII pentru comanda {order_data.get('name')}")
-
-    return address
-
-async def run_orders_sync(db: AsyncSession, days: int, full_sync: bool = False):
+            pages = fetch_pages(s, updated_since=checkpoint.updated_since, created_since=checkpoint.created_since, resume_from=checkpoint.resume_token)
+            async for page in _prefetch_pages(pages):
+                result = await ingest_service.ingest_orders_page(db, store_rec, page.orders)
+
+                # Doar comenzile modificate trec prin validarea adresei și recalcularea statusului
+                await _recalculate_orders(db, result.order_ids)
+
+                checkpoint.resume_token = page.resume_token
+                checkpoint.pages_done += 1
+                checkpoint.orders_done += len(page.orders)
+                checkpoint.last_order_updated_at = max(
+                    filter(None, [checkpoint.last_order_updated_at, *(_dt(o.get('updatedAt')) for o in page.orders)]),
+                    default=None,
+                )
+                await db.commit()
+
+                await progress.add(s.brand, len(result.order_ids), result.skipped)
+        except Exception:
+            await db.rollback()
+            raise
+
+        # O sincronizare totală acoperă doar fereastra de `days` zile, deci nu avansează un watermark existent
+        if not checkpoint.full_sync or store_rec.last_sync_at is None:
+            store_rec.last_sync_at = checkpoint.watermark
+        await db.delete(checkpoint)
+        await db.commit()
+
+
+async def run_orders_sync(db: AsyncSession, days: int, full_sync: bool = False, use_bulk: Optional[bool] = None):
+    """
+    Sincronizează comenzile tuturor magazinelor active.
+    - full_sync=True: preia toată fereastra `created_at` din ultimele `days` zile.
+    - full_sync=False (incremental): preia doar comenzile cu `updated_at` după
+      `Store.last_sync_at` (minus o mică suprapunere). Magazinele fără watermark
+      cad înapoi pe fereastra de `days` zile.
+    Watermark-ul unui magazin avansează doar după ce toate paginile lui au fost salvate.
+    Ferestrele mari (`use_bulk`, implicit pentru `days >= SHOPIFY_BULK_MIN_DAYS`) sunt
+    preluate prin Shopify Bulk Operations în loc de paginare GraphQL.
+    Magazinele sunt procesate în paralel (cel mult SYNC_STORE_CONCURRENCY deodată),
+    fiecare pe propria sesiune.
+    Magazinele cu un `SyncCheckpoint` rămas de la o rulare întreruptă continuă de la
+    acel checkpoint (cu fereastra și watermark-ul rulării inițiale).
+    """
     start_ts = datetime.now(timezone.utc)
-    sync_type = "TOTALĂ" if full_sync else "STANDARD"
-    logging.warning(f"ORDER SYNC ({sync_type}) a pornit pentru ultimele {days} zile.")
-    await manager.broadcast({"type": "sync_start", "message": f"Sincronizare comenzi ({sync_type})...", "sync_type": "orders"})
+    run_id = uuid.uuid4().hex
+    sync_type = "TOTALĂ" if full_sync else "INCREMENTALĂ"
+    logging.warning(f"ORDER SYNC ({sync_type}) {run_id} a pornit (fereastră implicită: {days} zile).")
 
-    stores_from_db_res = await db.execute(select(models.Store).where(models.Store.is_active == True))
-    stores_from_db = stores_from_db_res.scalars().all()
+    stores_from_db_res = await db.execute(select(models.Store.id, models.Store.domain).where(models.Store.is_active == True))
+    stores_from_db = stores_from_db_res.all()
 
     if not stores_from_db:
         logging.warning("ORDER SYNC: Nu există magazine active în baza de date. Sincronizarea a fost oprită.")
         await manager.broadcast({"type": "sync_end", "message": "Nu sunt magazine active pentru sincronizare."})
         return
 
-    stores_to_sync = [
-        ShopifyStore(
-            brand=db_store.name,
-            domain=db_store.domain,
-            shared_secret=db_store.shared_secret,
-            access_token=db_store.access_token,
-            pii_source=db_store.pii_source,
-            api_version="2025-07"
-        ) for db_store in stores_from_db
-    ]
-    
-    fetch_tasks = [shopify_service.fetch_orders(s, since_days=days) for s in stores_to_sync]
-    all_results = await asyncio.gather(*fetch_tasks, return_exceptions=True)
-
-    existing_stores_res = await db.execute(select(models.Store))
-    existing_stores = {st.domain: st for st in existing_stores_res.scalars().all()}
-
-    total_orders_to_process = sum(len(res) for res in all_results if isinstance(res, list))
-    await manager.broadcast({"type": "progress_update", "current": 0, "total": total_orders_to_process, "message": f"S-au găsit {total_orders_to_process} comenzi. Se procesează..."})
-
-    processed_count = 0
-    all_processed_order_ids = set()
-
-    for s, orders_or_exception in zip(stores_to_sync, all_results):
-        if isinstance(orders_or_exception, Exception):
-            logging.warning(f"Eroare la preluarea comenzilor pentru {s.domain}: {orders_or_exception}")
-            continue
-
-        store_rec = existing_stores.get(s.domain)
-        if not store_rec:
-            logging.warning(f"ORDER SYNC: Magazinul '{s.brand}' ({s.domain}) nu a fost găsit în BD, deși a fost sincronizat. Se adaugă automat.")
-            store_rec = models.Store(name=s.brand, domain=s.domain)
-            db.add(store_rec)
-            await db.flush()
-            existing_stores[s.domain] = store_rec
-
-        for o in orders_or_exception:
-            sid = o['id']
-            order_res = await db.execute(select(models.Order).options(joinedload('*')).where(models.Order.shopify_order_id == sid))
-            order = order_res.unique().scalar_one_or_none()
-
-            shipping_address = _get_mapped_address(o, store_rec.pii_source)
-            if not shipping_address:
-                 logging.warning(f"Nu s-au găsit date PII pentru comanda {o.get('name')} din sursa '{store_rec.pii_source}'")
-
-            gateways = o.get('paymentGatewayNames', [])
-            financial_status = o.get('displayFinancialStatus', 'unknown')
-            mapped_payment = map_payment_method(gateways, financial_status)
-            total_price_str = o.get('totalPriceSet', {}).get('shopMoney', {}).get('amount', '0.0')
-
-            status_from_shopify = (o.get('displayFulfillmentStatus') or 'unfulfilled').strip().lower()
-            if status_from_shopify == 'success':
-                status_from_shopify = 'fulfilled'
-
-            fulfillment_orders = o.get('fulfillmentOrders', {}).get('edges', [])
-            has_active_hold = any(ff_edge.get('node', {}).get('fulfillmentHolds') for ff_edge in fulfillment_orders)
-
-            order_data = {
-                'name': o.get('name'),
-                'customer': shipping_address.get('name') or 'N/A',
-                'created_at': _dt(o.get('createdAt')),
-                'cancelled_at': _dt(o.get('cancelledAt')),
-                'is_on_hold_shopify': has_active_hold,
-                'financial_status': financial_status,
-                'total_price': float(total_price_str) if total_price_str else 0.0,
-                'payment_gateway_names': ", ".join(gateways),
-                'mapped_payment': mapped_payment,
-                'tags': ",".join(o.get('tags', [])),
-                'note': o.get('note', ''),
-                'shopify_status': status_from_shopify,
-                'shipping_name': shipping_address.get('name'),
-                'shipping_address1': shipping_address.get('address1'),
-                'shipping_address2': shipping_address.get('address2'),
-                'shipping_phone': shipping_address.get('phone'),
-                'shipping_city': shipping_address.get('city'),
-                'shipping_zip': shipping_address.get('zip'),
-                'shipping_province': shipping_address.get('province'),
-                'shipping_country': shipping_address.get('country'),
-            }
-
-            if not order:
-                order = models.Order(store_id=store_rec.id, shopify_order_id=sid, **order_data)
-                db.add(order)
-                await db.flush()
-                line_items_data = o.get('lineItems', {}).get('edges', [])
-                for li_edge in line_items_data:
-                    li = li_edge['node']
-                    db.add(models.LineItem(order_id=order.id, sku=li.get('sku'), title=li.get('title'), quantity=li.get('quantity')))
-            else:
-                for key, value in order_data.items():
-                    setattr(order, key, value)
-            if order.fulfillment_orders:
-                for fo in order.fulfillment_orders:
-                    await db.delete(fo)
-                await db.flush()
-
-            for ff_order_edge in fulfillment_orders:
-                ff_order_node = ff_order_edge.get('node', {})
-                if not ff_order_node:
-                    continue
-                
-                # Căutăm să vedem dacă există deja, deși le-am șters mai sus (extra siguranță)
-                ff_order_id = ff_order_node.get('id')
-                existing_ff_order_res = await db.execute(
-                    select(models.FulfillmentOrder).where(models.FulfillmentOrder.shopify_fulfillment_order_id == ff_order_id)
-                )
-                existing_ff_order = existing_ff_order_res.scalar_one_or_none()
-
-                hold_details = ff_order_node.get('fulfillmentHolds')
-
-                if not existing_ff_order:
-                    db.add(models.FulfillmentOrder(
-                        order_id=order.id,
-                        shopify_fulfillment_order_id=ff_order_id,
-                        status=ff_order_node.get('status'),
-                        hold_details=hold_details
-                    ))
-                else:
-                    existing_ff_order.status = ff_order_node.get('status')
-                    existing_ff_order.hold_details = hold_details
-            # --- SFÂRȘITUL BLOCULUI DE COD ADĂUGAT ---
-
-            ffs = o.get('fulfillments', [])
-            if ffs:
-                for f in ffs:
-                    tracking_info_list = f.get('trackingInfo', [])
-                    if not tracking_info_list:
-                        continue
-                    tracking_info = tracking_info_list[0]
-                    awb = str(tracking_info.get('number', '')).strip()
-                    if not awb: continue
-                    
-                    fulfillment_date = _dt(f.get('createdAt'))
-                    # Mai întâi, apelăm funcția și obținem cheia contului
-                    courier_type, account_key = await courier_from_shopify(db, tracking_info.get('company', ''))
-
-
-
-                    # Căutăm dacă există deja o înregistrare
-                    shipment_res = await db.execute(select(models.Shipment).where(models.Shipment.awb == awb))
-                    sh = shipment_res.scalar_one_or_none()
-
-                    # AICI ESTE CORECȚIA COMPLETĂ
-                    if not sh:
-                        # Dacă NU există, adăugăm una nouă folosind 'account_key'
-                        db.add(models.Shipment(order_id=order.id, awb=awb, courier=account_key, account_key=account_key, shopify_fulfillment_id=str(f.get('id')), fulfillment_created_at=fulfillment_date))
-                    else:
-                        # Dacă există, o actualizăm folosind tot 'account_key'
-                        sh.courier = account_key
-                        sh.account_key = account_key
-                        sh.fulfillment_created_at = fulfillment_date
-
-            all_processed_order_ids.add(order.id)
-            processed_count += 1
-            if processed_count % 50 == 0:
-                await manager.broadcast({"type": "progress_update", "current": processed_count, "total": total_orders_to_process, "message": f"Se procesează... ({processed_count}/{total_orders_to_process})"})
-
-    await db.commit()
-
-    if all_processed_order_ids:
-        logging.warning(f"Validare adrese și recalculare statusuri pentru {len(all_processed_order_ids)} comenzi...")
-        orders_to_recalc_res = await db.execute(select(models.Order).options(joinedload(models.Order.shipments)).where(models.Order.id.in_(all_processed_order_ids)))
-        orders_to_recalc = orders_to_recalc_res.unique().scalars().all()
-        for order in orders_to_recalc:
-            if order.address_status != 'valid':
-                await address_service.validate_address_for_order(db, order)
-            calculate_and_set_derived_status(order)
-
-    await db.commit()
-    await manager.broadcast({"type": "sync_end", "message": f"Sincronizare finalizată! {processed_count} comenzi actualizate."})
-    logging.warning(f"ORDER SYNC finalizat în {(datetime.now(timezone.utc) - start_ts).total_seconds():.1f}s.")
+    checkpoints_res = await db.execute(
+        select(models.Store.domain, models.SyncCheckpoint.full_sync)
+        .join(models.SyncCheckpoint, models.SyncCheckpoint.store_id == models.Store.id)
+        .where(models.Store.id.in_([store_id for store_id, _ in stores_from_db]))
+    )
+    resumed_stores = [domain for domain, checkpoint_full in checkpoints_res.all() if checkpoint_full or not full_sync]
+    start_message = f"Sincronizare comenzi ({sync_type})..."
+    if resumed_stores:
+        start_message += f" Reluată de la ultimul checkpoint pentru: {', '.join(resumed_stores)}."
+    await manager.broadcast({"type": "sync_start", "message": start_message, "sync_type": "orders", "run_id": run_id, "resumed": bool(resumed_stores), "resumed_stores": resumed_stores})
+
+    progress = _SyncProgress()
+    semaphore = asyncio.Semaphore(max(1, settings.SYNC_STORE_CONCURRENCY))
+
+    async def worker(store_id: int):
+        async with semaphore:
+            return await _sync_store(store_id, run_id, days, full_sync, use_bulk, progress)
+
+    results = await asyncio.gather(*(worker(store_id) for store_id, _ in stores_from_db), return_exceptions=True)
+    failed_stores = []
+    busy_stores = []
+    for (_, domain), result in zip(stores_from_db, results):
+        if isinstance(result, Exception):
+            logging.warning(f"Eroare la sincronizarea comenzilor pentru {domain}: {result}")
+            failed_stores.append(domain)
+        elif result is False:
+            logging.warning(f"ORDER SYNC: {domain} este deja sincronizat de altă rulare; sărit.")
+            busy_stores.append(domain)
+
+    message = f"Sincronizare finalizată! {progress.updated} comenzi actualizate, {progress.skipped} neschimbate (sărite)."
+    if failed_stores:
+        message += f" Magazine cu erori (vor fi reluate de la checkpoint): {', '.join(failed_stores)}."
+    if busy_stores:
+        message += f" Magazine sincronizate deja de altă rulare: {', '.join(busy_stores)}."
+    await manager.broadcast({"type": "sync_end", "message": message, "run_id": run_id, "updated": progress.updated, "skipped": progress.skipped, "failed_stores": failed_stores, "busy_stores": busy_stores, "resumed_stores": resumed_stores})
+    logging.warning(f"ORDER SYNC {run_id} finalizat în {(datetime.now(timezone.utc) - start_ts).total_seconds():.1f}s: {progress.updated} actualizate, {progress.skipped} sărite.")
 
 async def run_couriers_sync(db: AsyncSession, full_sync: bool = False):
     await courier_service.track_and_update_shipments(db, full_sync=full_sync)
 
 async def run_full_sync(db: AsyncSession, days: int):
     """Rulează o sincronizare completă: comenzi și apoi curieri."""
-    await run_orders_sync(db, days, full_sync=True)
+    await run_orders_sync(db, days, full_sync=True, use_bulk=True)
     await run_couriers_sync(db, full_sync=True)
\ No newline at end of file
@@ -1,6 +1,90 @@
+import json
+import logging
 from datetime import datetime, timezone, timedelta
+from typing import Optional, List, Dict, Any
 import models  # Asigură-te că acest import este aici
 from settings import settings
+from .status_classifier import status_classifier
+
+def _dt(v: Optional[str]) -> Optional[datetime]:
+    if not v: return None
+    try:
+        return datetime.fromisoformat(v.replace('Z', '+00:00'))
+    except (ValueError, TypeError):
+        return None
+
+def map_payment_method(gateways: List[str], financial_status: str) -> str:
+    raw_gateways = gateways or []
+    lower_gateways_set = {g.lower().strip() for g in raw_gateways}
+    gateway_str_joined = ", ".join(raw_gateways).lower()
+
+    if settings.PAYMENT_MAP:
+        for standard_name, keywords in settings.PAYMENT_MAP.items():
+            if not lower_gateways_set.isdisjoint(keywords):
+                return standard_name
+            if any(keyword in gateway_str_joined for keyword in keywords):
+                return standard_name
+
+    if not gateway_str_joined.strip():
+        if financial_status == 'paid': return "Fara plata"
+        if financial_status == 'pending': return "Ramburs"
+
+    return ", ".join(raw_gateways)
+
+
+def _get_mapped_address(order_data: Dict[str, Any], pii_source: str) -> Dict[str, Any]:
+    """Funcție helper pentru a extrage și mapa adresa PII din diverse surse."""
+    address = {}
+    
+    if pii_source == 'shopify':
+        source = order_data.get('shippingAddress')
+        if not source:
+            return address
+        
+        first_name = source.get('firstName', '')
+        last_name = source.get('lastName', '')
+        
+        address = {
+            'name': f"{first_name} {last_name}".strip(),
+            'address1': source.get('address1'),
+            'address2': source.get('address2'),
+            'phone': source.get('phone'),
+            'city': source.get('city'),
+            'zip': source.get('zip'),
+            'province': source.get('province'),
+            'country': source.get('country'),
+            'email': order_data.get('email')
+        }
+
+    elif pii_source == 'metafield':
+        source_node = order_data.get('metafield')
+        if not source_node or not source_node.get('value'):
+            return address
+        
+        try:
+            metafield_data = json.loads(source_node['value'])
+            address = {
+                'name': f"{metafield_data.get('first_name', '')} {metafield_data.get('last_name', '')}".strip(),
+                'address1': metafield_data.get('address1'),
+                'address2': metafield_data.get('address2'),
+                'phone': metafield_data.get('phone_number'),
+                'city': metafield_data.get('city'),
+                'zip': metafield_data.get('postal_code'),
+                'province': metafield_data.get('county'),
+                'country': metafield_data.get('country'),
+                'email': metafield_data.get('email')
+            }
+        except json.JSONDecodeError:
+            logging.warning(f"Nu s-a putut decoda metafield-ul PII pentru comanda {order_data.get('name')}")
+
+    return address
+
+def shopify_legacy_id(gid: Optional[str]) -> Optional[str]:
+    """'gid://shopify/LineItem/123' -> '123'. ID-urile numerice (din webhook-uri) rămân neschimbate."""
+    if gid is None:
+        return None
+    return str(gid).rsplit('/', 1)[-1]
+
 
 def calculate_and_set_derived_status(order: models.Order):
     """
@@ -8,8 +92,7 @@ def calculate_and_set_derived_status(order: models.Order):
     pentru statusurile de anulare și refuz.
     """
     now = datetime.now(timezone.utc)
-    RAW_STATUS_TO_GROUP_KEY = {s.lower().strip(): group for group, (_, statuses) in settings.COURIER_STATUS_MAP.items() for s in statuses}
-    
+
     def get_shipment_sort_key(shipment):
         # Prioritizează data, apoi ID-ul. None este tratat ca o dată foarte veche.
         return (shipment.fulfillment_created_at or datetime.min.replace(tzinfo=timezone.utc), shipment.id)
@@ -30,7 +113,8 @@ def calculate_and_set_derived_status(order: models.Order):
              order.processing_status = "Procesată"
 
     raw_status = (latest_shipment.last_status or 'AWB Generat').strip() if latest_shipment else ''
-    courier_status_key = RAW_STATUS_TO_GROUP_KEY.get(raw_status.lower())
+    # 'AWB Generat' este doar eticheta implicită, nu un status primit de la curier
+    courier_status_key = status_classifier.classify(latest_shipment.last_status) if latest_shipment else None
     
     is_on_hold = order.is_on_hold_shopify or 'on-hold' in order_tags or 'hold' in order_tags
     is_canceled_event = (order.cancelled_at is not None) or (courier_status_key == 'canceled')
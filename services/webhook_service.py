@@ -7,6 +7,7 @@ import models
 from services.sync_service import _dt, map_payment_method, courier_from_shopify
 from services.utils import calculate_and_set_derived_status
 from services.address_service import validate_address_for_order
+from services import reconcile_service
 
 async def _create_or_update_order(db: AsyncSession, store_id: int, payload: Dict[str, Any]):
     """Creează sau actualizează o comandă și produsele asociate pe baza datelor de la webhook."""
@@ -14,7 +15,7 @@ async def _create_or_update_order(db: AsyncSession, store_id: int, payload: Dict
     
     order_res = await db.execute(
         select(models.Order)
-        .options(joinedload(models.Order.line_items), joinedload(models.Order.shipments))
+        .options(joinedload(models.Order.shipments))
         .where(models.Order.shopify_order_id == shopify_id)
     )
     order = order_res.unique().scalar_one_or_none()
@@ -53,22 +54,19 @@ async def _create_or_update_order(db: AsyncSession, store_id: int, payload: Dict
         for key, value in order_data.items():
             setattr(order, key, value)
     
-    # Actualizează produsele
-    db_line_items = {li.id: li for li in order.line_items}
-    payload_line_items = {li['id']: li for li in payload.get('line_items', [])}
-    
-    for li_id, li_data in payload_line_items.items():
-        if li_id in db_line_items:
-            db_line_items[li_id].quantity = li_data['quantity']
-            db_line_items[li_id].price = li_data['price']
-        else:
-            db.add(models.LineItem(order_id=order.id, sku=li_data.get('sku'), title=li_data.get('title'), quantity=li_data.get('quantity')))
+    # Actualizează produsele (aceeași reconciliere după ID-ul Shopify ca la sincronizare)
+    line_item_rows = [
+        {
+            'order_id': order.id,
+            'shopify_line_item_id': str(li['id']),
+            'sku': li.get('sku'),
+            'title': li.get('title'),
+            'quantity': li.get('quantity'),
+        }
+        for li in payload.get('line_items', []) if li.get('id')
+    ]
+    await reconcile_service.reconcile_children(db, reconcile_service.LINE_ITEMS, [order.id], line_item_rows)
 
-    # Șterge produsele care nu mai sunt în comandă
-    for li_id, li_db in db_line_items.items():
-        if li_id not in payload_line_items:
-            await db.delete(li_db)
-            
     await validate_address_for_order(db, order)
     calculate_and_set_derived_status(order)
     await db.commit()
@@ -84,7 +82,7 @@ async def _delete_order(db: AsyncSession, payload: Dict[str, Any]):
         await db.commit()
         logging.warning(f"Webhook: Comanda cu Shopify ID '{shopify_id}' a fost ștearsă.")
 
-async def _process_fulfillment(db: AsyncSession, payload: Dict[str, Any]):
+async def _process_fulfillment(db: AsyncSession, store_id: int, payload: Dict[str, Any]):
     """Procesează un eveniment de creare/actualizare fulfillment."""
     order_shopify_id = str(payload['order_id'])
     order_res = await db.execute(select(models.Order).options(joinedload(models.Order.shipments)).where(models.Order.shopify_order_id == order_shopify_id))
@@ -96,24 +94,19 @@ async def _process_fulfillment(db: AsyncSession, payload: Dict[str, Any]):
     awb = str(payload.get('tracking_number', '')).strip()
     if not awb: return
 
-    courier_key = courier_from_shopify(payload.get('tracking_company', ''), payload.get('tracking_url', ''))
-    
-    shipment = next((s for s in order.shipments if s.awb == awb), None)
-    
-    if not shipment:
-        shipment = models.Shipment(
-            order_id=order.id,
-            awb=awb,
-            courier=courier_key,
-            account_key=courier_key,
-            shopify_fulfillment_id=str(payload.get('id')),
-            fulfillment_created_at=_dt(payload.get('created_at'))
-        )
-        db.add(shipment)
-    else:
-        shipment.courier = courier_key
-        shipment.account_key = courier_key
-        shipment.fulfillment_created_at = _dt(payload.get('created_at'))
+    _, courier_key = await courier_from_shopify(db, payload.get('tracking_company', ''))
+
+    shipment_row = {
+        'order_id': order.id,
+        'awb': awb,
+        'courier': courier_key,
+        'account_key': courier_key,
+        'shopify_fulfillment_id': str(payload.get('id')),
+        'fulfillment_created_at': _dt(payload.get('created_at')),
+    }
+    result = await reconcile_service.reconcile_children(db, reconcile_service.SHIPMENTS, [order.id], [shipment_row])
+    if result.inserted or result.updated:
+        await db.refresh(order, ['shipments'])
 
     calculate_and_set_derived_status(order)
     await db.commit()
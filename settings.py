@@ -13,6 +13,7 @@ class ShopifyStore(BaseModel):
     pii_source: str  # ADĂUGAT
     shared_secret: str
     api_version: str = "2025-07"
+    graphql_url: Optional[str] = None # Suprascrie endpoint-ul GraphQL (ex. un server local de test)
 
 def json_config_settings_source(settings: BaseSettings) -> Dict[str, Any]:
     return {}
@@ -27,6 +28,71 @@ class Settings(BaseSettings):
     APP_PORT: int = 8000
     SYNC_INTERVAL_ORDERS_MINUTES: int = 15
     SYNC_INTERVAL_COURIERS_MINUTES: int = 5
+    SYNC_INITIAL_DAYS: int = 30
+    SYNC_INCREMENTAL_OVERLAP_MINUTES: int = 10
+    SYNC_STORE_CONCURRENCY: int = 4
+    SHOPIFY_BULK_MIN_DAYS: int = 60
+    SHOPIFY_BULK_POLL_SECONDS: float = 5.0
+    SHOPIFY_HTTP_TIMEOUT_SECONDS: float = 60.0
+    SHOPIFY_MAX_CONNECTIONS: int = 10
+    # Endpoint GraphQL folosit pentru toate magazinele în locul Shopify (ex. scripts/shopify_standin.py serve)
+    SHOPIFY_GRAPHQL_URL: Optional[str] = None
+    COURIER_MAPPING_CACHE_TTL_SECONDS: int = 300
+    # Cât de des se verifică dacă config/courier_status_map.json a fost modificat
+    STATUS_MAP_RELOAD_CHECK_SECONDS: float = 5.0
+    # Intervalul de bază dintre verificările de tracking, per grup din COURIER_STATUS_MAP
+    TRACKING_INTERVAL_MINUTES: Dict[str, int] = {
+        "processed": 240,
+        "shipped": 60,
+        "in_transit": 30,
+        "pickup_office": 180,
+        "delivery_issues": 60,
+        "unknown": 120,
+    }
+    TRACKING_FINAL_GROUPS: List[str] = ["delivered", "refused", "canceled"]
+    TRACKING_MAX_INTERVAL_MINUTES: int = 1440
+    TRACKING_MAX_PER_RUN: int = 5000
+    TRACKING_WORKERS: int = 8
+    TRACKING_CHUNK_SIZE: int = 50
+    TRACKING_COMMIT_EVERY: int = 200
+    TRACKING_RUN_DEADLINE_SECONDS: float = 600.0
+    # AWB-urile fără răspuns de la curier sunt reîncercate după acest interval, fără a le schimba statusul
+    TRACKING_ERROR_RETRY_MINUTES: int = 15
+    # Clientul HTTP al fiecărui cont de curier (suprascris per cont: http_timeout_seconds, http_max_connections)
+    COURIER_HTTP_TIMEOUT_SECONDS: float = 15.0
+    COURIER_HTTP_MAX_CONNECTIONS: int = 10
+    COURIER_HTTP_KEEPALIVE_SECONDS: float = 30.0
+    COURIER_RETRY_ATTEMPTS: int = 3
+    COURIER_RETRY_BACKOFF_SECONDS: float = 0.5
+    COURIER_BREAKER_FAILURE_THRESHOLD: int = 5
+    COURIER_BREAKER_RESET_SECONDS: float = 60.0
+    # Token-urile de autentificare ale curierilor (Sameday) sunt salvate în DB și partajate între worker-i
+    COURIER_TOKEN_PERSIST: bool = True
+    COURIER_TOKEN_REFRESH_MARGIN_SECONDS: int = 300
+    # Limite implicite per tip de curier; pot fi suprascrise per cont din credențiale
+    # (rate_limit_per_second, rate_limit_burst, max_concurrency)
+    COURIER_RATE_LIMITS: Dict[str, Dict[str, float]] = {
+        "sameday": {"rate": 2.0, "burst": 2, "concurrency": 2},
+        "dpd": {"rate": 5.0, "burst": 10, "concurrency": 4},
+        "default": {"rate": 5.0, "burst": 5, "concurrency": 4},
+    }
+    # Cache pe disc pentru etichetele PDF (cheie: cont, AWB, format hârtie)
+    LABEL_CACHE_ENABLED: bool = True
+    LABEL_CACHE_DIR: str = "label_cache"
+    LABEL_CACHE_MAX_MB: int = 1024
+    LABEL_CACHE_MAX_AGE_DAYS: int = 30
+    # Descărcarea în fundal a etichetelor neprintate (umple cache-ul înainte de Print Hub)
+    LABEL_PREFETCH_ENABLED: bool = True
+    LABEL_PREFETCH_INTERVAL_SECONDS: int = 120
+    LABEL_PREFETCH_MAX_PER_RUN: int = 500
+    LABEL_PREFETCH_CHUNK_SIZE: int = 20
+    # Etichetele eșuate la prefetch sunt reîncercate cu interval dublat la fiecare eșec
+    LABEL_PREFETCH_RETRY_MINUTES: int = 30
+    LABEL_PREFETCH_MAX_RETRY_HOURS: int = 24
+    # Procese pentru îmbinarea PDF-urilor și randarea paginilor de sumar (0 = numărul de nuclee)
+    PDF_POOL_WORKERS: int = 0
+    # Planurile de printare (loturi) sunt reconstruite la schimbarea datelor sau după această vârstă
+    PRINT_PLAN_MAX_AGE_SECONDS: int = 900
     CORS_ORIGINS: List[str] = ["*"]
 
     print_batch_size: int = 250
@@ -21,4 +21,21 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         });
     });
-});
\ No newline at end of file
+
+    // Logic for the live sync status line (websocket)
+    const syncStatus = document.getElementById('sync-status');
+    if (syncStatus && 'WebSocket' in window) {
+        const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${protocol}://${window.location.host}/ws/status`);
+        let resumedNote = '';
+        socket.addEventListener('message', function(event) {
+            const data = JSON.parse(event.data);
+            if (!['sync_start', 'progress_update', 'sync_end', 'sync_error'].includes(data.type)) return;
+            if (data.type === 'sync_start') {
+                resumedNote = data.resumed ? ` (reluată de la checkpoint: ${data.resumed_stores.join(', ')})` : '';
+            }
+            syncStatus.hidden = false;
+            syncStatus.querySelector('small').textContent = data.type === 'progress_update' ? data.message + resumedNote : data.message;
+        });
+    }
+});
@@ -0,0 +1,54 @@
+# tests/test_sameday_token_expiry.py
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from services.couriers import sameday
+from services.couriers.sameday import SAMEDAY_TZ, SamedayCourierService
+
+
+def _authenticate(expire_at):
+    service = SamedayCourierService("test_sameday", {"username": "user", "password": "pass"})
+
+    async def fake_request(method, url, **kwargs):
+        return httpx.Response(200, json={"token": "tok", "expire_at": expire_at})
+
+    service._request = fake_request
+
+    async def run():
+        try:
+            return await service._authenticate()
+        finally:
+            await service.aclose()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("fmt", ["%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S"])
+def test_expire_at_without_offset_is_local_time(fmt):
+    local = (datetime.now(SAMEDAY_TZ) + timedelta(minutes=20)).replace(second=0, microsecond=0, tzinfo=None)
+    token, expires_at = _authenticate(local.strftime(fmt))
+    assert token == "tok"
+    assert expires_at.tzinfo is not None
+    assert expires_at == local.replace(tzinfo=SAMEDAY_TZ)
+
+
+def test_expire_at_with_offset_is_capped_at_one_hour():
+    far = (datetime.now(timezone.utc) + timedelta(days=2)).isoformat()
+    _, expires_at = _authenticate(far)
+    assert expires_at <= datetime.now(timezone.utc) + timedelta(minutes=60)
+
+
+@pytest.mark.parametrize("expire_at", [None, "", "nu e o dată"])
+def test_missing_or_invalid_expire_at_uses_default(expire_at):
+    _, expires_at = _authenticate(expire_at)
+    assert timedelta(minutes=59) < expires_at - datetime.now(timezone.utc) <= timedelta(minutes=60)
+
+
+def test_parse_sameday_date_mixed_history_is_comparable():
+    dates = [sameday._parse_sameday_date("2026-10-17 16:37:00"), sameday._parse_sameday_date("2026-10-17T14:00:00Z")]
+    # 16:37 ora României (EEST, UTC+3) = 13:37 UTC, deci evenimentul UTC de la 14:00 este ultimul
+    assert dates[0] == datetime(2026, 10, 17, 13, 37, tzinfo=timezone.utc)
+    assert max(dates) == dates[1]